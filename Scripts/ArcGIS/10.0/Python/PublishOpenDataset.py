@@ -45,14 +45,21 @@
 #
 # 3) Uses the CKAN client API to create a new dataset on the OpenColorado
 #    Data Repository if the dataset does not already exist. If the dataset
-#    already exists, it is updated. 
+#    already exists, it is updated. With -u the exported files are also
+#    uploaded to the CKAN file storage, and the resources link to them there.
 #
 # 4) Updates the version (revision) number of the dataset on the OpenColorado
 #    Data Catalog (if it already exists)
+#
+# The script uses the ckanclient package in this folder, which extends the
+# stock CKAN client with response caching, retries, request hooks and file
+# storage uploads. Keep it next to the script.
 # ---------------------------------------------------------------------------
 
 # Import system modules
-import sys, os, arcpy, logging, logging.config, shutil, zipfile, glob, ckanclient, datetime, argparse, csv, re
+import sys, os, arcpy, logging, logging.config, shutil, zipfile, glob, ckanclient, datetime, argparse, csv, re, copy
+import ckanclient.cache
+import ckanclient.hooks
 import xml.etree.ElementTree as et
 
 # Global variables
@@ -62,6 +69,8 @@ output_folder = None
 source_feature_class = None
 staging_feature_class = None
 ckan_client = None
+ckan_latency = None
+ckan_lookup_cache = None
 temp_workspace = None
 available_formats = ['shp','dwg','kml','csv','metadata','gdb']
     
@@ -198,6 +207,21 @@ def main():
         choices=['9.2','9.3','10.0','CURRENT'],
         default='9.3', 
         help='The oldest version of Esri ArcGIS file geodatabases need to work with.')
+
+    parser.add_argument('-c', '--ckan-cache-folder',
+        action='store',
+        dest='ckan_cache_folder',
+        help='A folder in which to cache CKAN responses.  Unchanged datasets are then read with conditional requests (ex. C:\\temp\\ckan_cache).')
+
+    parser.add_argument('-j', '--ckan-latency-file',
+        action='store',
+        dest='ckan_latency_file',
+        help='A JSON file to write the CKAN API request latency histograms to, per endpoint (ex. C:\\temp\\ckan_latency.json).')
+
+    parser.add_argument('-u', '--ckan-storage',
+        action='store_true',
+        dest='ckan_storage',
+        help='Upload the exported files to the CKAN file storage and link the resources to them, instead of to the download URL.')
         
     # Positional arguments
     parser.add_argument('feature_class',
@@ -332,6 +356,12 @@ def main():
             if len(args.formats) > 0:
                 publish_to_ckan()
 
+            if ckan_latency != None:
+                ckan_latency.dump(args.ckan_latency_file)
+                logger.info('CKAN latency histograms written to ' + args.ckan_latency_file)
+            if ckan_lookup_cache != None:
+                logger.info('CKAN lookup cache: ' + str(ckan_lookup_cache.stats()))
+
         # Delete the dataset temp folder
         # TODO: This delete statement was failing at the end of the script, but
         # works at the beginning. The script does not release the file geodatabase lock
@@ -356,7 +386,11 @@ def publish_to_ckan():
     global ckan_client
     
     # Initialize the CKAN client  
-    ckan_client = ckanclient.CkanClient(base_location=args.ckan_api,api_key=args.ckan_api_key)
+    ckan_client = create_ckan_client()
+    
+    # Upload the exported files before the resources link to them
+    if args.ckan_storage:
+        upload_to_ckan_storage()
     
     # Create the name of the dataset on the CKAN instance
     dataset_id = args.ckan_dataset_name_prefix + args.dataset_name
@@ -379,6 +413,65 @@ def publish_to_ckan():
     if args.increment != 'none':
         update_dataset_version()
         
+def create_ckan_client():
+    """Creates a CKAN client from the command line arguments
+
+    Returns:
+        A ckanclient.CkanClient
+    """
+    global ckan_latency, ckan_lookup_cache
+    
+    response_cache = None
+    if args.ckan_cache_folder != None:
+        response_cache = ckanclient.cache.ResponseCache(args.ckan_cache_folder)
+
+    # Every client of the run adds to the same latency histograms
+    hooks = []
+    if args.ckan_latency_file != None:
+        if ckan_latency == None:
+            ckan_latency = ckanclient.hooks.LatencyCollector()
+        hooks.append(ckan_latency)
+
+    # Groups are looked up once per process, however many datasets are created.
+    if ckan_lookup_cache == None:
+        ckan_lookup_cache = ckanclient.cache.LookupCache(ttl=300)
+
+    # Retry requests CKAN answers with 429/503, waiting as long as it asks.
+    return ckanclient.CkanClient(base_location=args.ckan_api,
+        api_key=args.ckan_api_key, response_cache=response_cache,
+        max_retries=3, hooks=hooks, lookup_cache=ckan_lookup_cache)
+
+def upload_to_ckan_storage():
+    """Uploads the files in the dataset output folder to the CKAN file storage.
+    Files already stored unchanged are skipped, so a failed publish can be rerun.
+
+    Returns:
+        None
+    """
+    for file_type in sorted(os.listdir(output_folder)):
+        folder = os.path.join(output_folder, file_type)
+        if not os.path.isdir(folder):
+            continue
+        for file_name in sorted(os.listdir(folder)):
+            label = get_dataset_filename() + '/' + file_type + '/' + file_name
+            result = ckan_client.storage_file_upload(os.path.join(folder, file_name), label)
+            if result['skipped']:
+                logger.info('Unchanged in CKAN storage: ' + label)
+            else:
+                logger.info('Uploaded {0} to CKAN storage: {1} bytes in {2:.1f}s ({3:.0f} KB/s)'.format(label,
+                    result['bytes'], result['seconds'], (result['bytes_per_second'] or 0) / 1024))
+
+def get_download_url(file_type, file_name):
+    """Gets the URL a published file is downloaded from
+    
+    Returns:
+        A string with the URL
+    """
+    path = get_dataset_filename() + '/' + file_type + '/' + file_name
+    if args.ckan_storage:
+        return ckan_client.storage_file_url(path)
+    return args.download_url + path
+
 def remove_missing_formats_from_publication(directory):
     """Removes data formats that haven't been created
     from publishing to CKAN.
@@ -966,6 +1059,9 @@ def update_dataset(dataset_entity):
         None
     """    
     
+    # Keep the dataset as read from CKAN to see what the update changes
+    dataset_entity_remote = copy.deepcopy(dataset_entity)
+    
     # Update the dataset's resources (download links)
     dataset_entity = update_dataset_resources(dataset_entity)
     
@@ -980,7 +1076,7 @@ def update_dataset(dataset_entity):
         dataset_entity = update_local_dataset_from_metadata(dataset_entity)
 
     # Update existing dataset in CKAN        
-    update_remote_dataset(dataset_entity)
+    update_remote_dataset(dataset_entity, dataset_entity_remote)
 
 def update_dataset_resources(dataset_entity):
     """Updates the CKAN dataset entity resources. If the resources already
@@ -1029,7 +1125,7 @@ def update_dataset_resources(dataset_entity):
         
         shp_resource['name'] = title + ' - SHP'
         shp_resource['description'] = title + ' - Shapefile'
-        shp_resource['url'] = args.download_url + dataset_file_name + '/shape/' + dataset_file_name + '.zip'
+        shp_resource['url'] = get_download_url('shape', dataset_file_name + '.zip')
         shp_resource['mimetype'] = 'application/zip'
         shp_resource['format'] = 'shp'
         shp_resource['resource_type'] = 'file'
@@ -1052,7 +1148,7 @@ def update_dataset_resources(dataset_entity):
         
         dwg_resource['name'] = title + ' - DWG'
         dwg_resource['description'] = title  + ' - AutoCAD DWG'
-        dwg_resource['url'] = args.download_url + dataset_file_name + '/cad/' + dataset_file_name + '.dwg'
+        dwg_resource['url'] = get_download_url('cad', dataset_file_name + '.dwg')
         dwg_resource['mimetype'] = 'application/acad'
         dwg_resource['format'] = 'dwg'
         dwg_resource['resource_type'] = 'file'
@@ -1075,7 +1171,7 @@ def update_dataset_resources(dataset_entity):
 
         kml_resource['name'] = title + ' - KML'
         kml_resource['description'] = title  + ' - Google KML'
-        kml_resource['url'] = args.download_url + dataset_file_name + '/kml/' + dataset_file_name + '.kmz'
+        kml_resource['url'] = get_download_url('kml', dataset_file_name + '.kmz')
         kml_resource['mimetype'] = 'application/vnd.google-earth.kmz'
         kml_resource['format'] = 'kml'
         kml_resource['resource_type'] = 'file'
@@ -1098,7 +1194,7 @@ def update_dataset_resources(dataset_entity):
 
         csv_resource['name'] = title + ' - CSV'
         csv_resource['description'] = title + ' - Comma-Separated Values'
-        csv_resource['url'] = args.download_url + dataset_file_name + '/csv/' + dataset_file_name + '.csv'
+        csv_resource['url'] = get_download_url('csv', dataset_file_name + '.csv')
         csv_resource['mimetype'] = 'text/csv'
         csv_resource['format'] = 'csv'
         csv_resource['resource_type'] = 'file'
@@ -1121,7 +1217,7 @@ def update_dataset_resources(dataset_entity):
 
         metadata_resource['name'] = title + ' - Metadata'
         metadata_resource['description'] = title + ' - Metadata'
-        metadata_resource['url'] = args.download_url + dataset_file_name + '/metadata/' + dataset_file_name + '.xml'
+        metadata_resource['url'] = get_download_url('metadata', dataset_file_name + '.xml')
         metadata_resource['mimetype'] = 'application/xml'
         metadata_resource['format'] = 'xml'
         metadata_resource['resource_type'] = 'metadata'
@@ -1144,7 +1240,7 @@ def update_dataset_resources(dataset_entity):
         
         gdb_resource['name'] = title + ' - GDB'
         gdb_resource['description'] = title + ' - Esri File Geodatabase'
-        gdb_resource['url'] = args.download_url + dataset_file_name + '/gdb/' + dataset_file_name + '.zip'
+        gdb_resource['url'] = get_download_url('gdb', dataset_file_name + '.zip')
         gdb_resource['mimetype'] = 'application/zip'
         gdb_resource['format'] = 'gdb'
         gdb_resource['resource_type'] = 'file'
@@ -1328,23 +1424,29 @@ def update_local_dataset_from_metadata(dataset_entity):
 
     return dataset_entity
 
-def update_remote_dataset(dataset_entity):
+def update_remote_dataset(dataset_entity, dataset_entity_remote):
     """Updates the remote CKAN dataset.
        The dataset already exists in the CKAN repository, it is updated.
+       If nothing has changed since it was read the update is skipped.
     
     Parameters:
         dataset_entity - An object structured the same as the JSON dataset 
         output from the CKAN REST API. For more information on the structure 
         look at the web service JSON output, or reference:
         http://docs.ckan.org/en/latest/api-v2.html#model-api
+        
+        dataset_entity_remote - The dataset as read from the CKAN repository
     
     Returns:
         None
     """    
     global ckan_client
     
-    logger.info('Updating dataset through CKAN API');
-    ckan_client.package_entity_put(dataset_entity)
+    changes = ckan_client.package_entity_put_if_changed(dataset_entity_remote, dataset_entity)
+    if changes:
+        logger.info('Updated dataset through CKAN API: ' + ', '.join(sorted(changes.keys())))
+    else:
+        logger.info('Dataset unchanged, skipped CKAN API update')
 
 def update_dataset_version():
     """Updates the dataset version number on CKAN repository
@@ -1357,7 +1459,7 @@ def update_dataset_version():
     logger.info('Updating CKAN dataset version')
     
     # Initialize CKAN client
-    ckan = ckanclient.CkanClient(base_location=args.ckan_api,api_key=args.ckan_api_key)
+    ckan = create_ckan_client()
     
     # Create the name of the dataset on the CKAN instance
     dataset_id = args.ckan_dataset_name_prefix + args.dataset_name
@@ -0,0 +1,1809 @@
+__version__ = '0.9'
+__description__ = 'The CKAN client Python package.'
+__long_description__ = \
+'''The CKAN client software may be used to make requests on the Comprehensive
+Knowledge Archive Network (CKAN) API including its REST interface to all
+primary objects (packages, groups, tags) and its search interface.
+
+Synopsis
+========
+
+The simplest way to make CKAN requests is:
+
+    import ckanclient
+
+    # Instantiate the CKAN client.
+    ckan = ckanclient.CkanClient(api_key=my_key)
+    
+    # Get the package list.
+    package_list = ckan.package_register_get()
+    print package_list
+
+    # Get the tag list.
+    tag_list = ckan.tag_register_get()
+    print tag_list
+
+    # Collect the package metadata.
+    package_entity = {
+        'name': my_package_name,
+        'url': my_package_url,
+        'download_url': my_package_download_url,
+        'tags': my_package_keywords,
+        'notes': my_package_long_description,
+    }
+    
+    # Register the package.
+    ckan.package_register_post(package_entity)
+
+    # Get the details of a package.
+    ckan.package_entity_get(package_name)
+    package_entity = ckan.last_message
+    print package_entity
+
+    # Update the details of a package.
+    ckan.package_entity_get(package_name)
+    package_entity = ckan.last_message
+    package_entity['url'] = new_package_url
+    package_entity['notes'] = new_package_notes
+    ckan.package_entity_put(package_entity)
+
+    # List groups
+    group_list = ckan.group_register_get()
+    print group_list
+    
+    # Create a new group
+    group_entity = {
+        'name': my_group_name,
+        'title': my_group_title,
+        'description': my_group_description,
+        'packages': group_package_names,
+        }
+    ckan.group_register_post(group_entity)
+
+    # Get the details of a group.
+    print ckan.group_entity_get(group_name)
+
+    # Update the group details
+    group_entity = ckan.last_message
+    group_entity['title'] = new_group_title
+    group_entity['packages'] = new_group_packages
+    ckan.group_entity_put(group_entity)
+
+Changelog
+=========
+
+v0.10 unreleased
+----------------
+
+  * Pluggable transport; KeepAliveTransport reuses pooled connections
+  * Optional concurrent prefetch of package search result pages
+  * Conditional GET (ETag / Last-Modified) response cache
+  * Debug output is only formatted when verbose, with bodies truncated
+  * ConcurrentCkanClient runs calls on a bounded thread pool
+  * package_bulk_get generates full package dicts for the whole catalog
+  * package_entity_put_if_changed skips PUTs that would change nothing
+  * RateLimiter, and retries honouring Retry-After on 429/503 responses
+  * Streaming package search decodes results as they arrive
+  * Request hooks, and LatencyCollector for per-endpoint latency histograms
+  * gzip / deflate compressed responses, counted in TransferStats
+  * Revision search, and CatalogMirror for an incrementally refreshed
+    local copy of the catalog
+  * open_url returns a read-only ApiResponse, and the last_* attributes
+    are kept per thread, so one client can be shared by many threads
+  * storage_file_upload streams a file from disk to CKAN storage
+  * CircuitBreaker fails requests fast while the server keeps failing
+  * LookupCache holds looked up groups in memory for a time to live
+
+v0.9 2011-08-09
+---------------
+
+  * Default URL changed to thedatahub.org
+  * Guard against 301 redirection, which loses POST contents
+
+
+v0.8 2011-07-20
+---------------
+
+  * More detailed exceptions added
+  * Some Python 3 compatibility
+  
+
+v0.7 2011-01-27
+---------------
+
+  * Package search returns results as a generator
+    (rather than a list that needs to be paged)
+  
+
+v0.5 2010-12-15
+---------------
+
+  * Exception raised on error (more Pythonic)
+  
+
+v0.4 2010-10-07
+---------------
+
+  * Form API added
+  * Package name editing
+  * Groups added
+  * Output can be verbose and use logger
+  * Query API version
+  * Sends API key via additional header
+  
+
+v0.3 2010-04-28
+---------------
+
+  * General usability improvements especially around error messages. 
+  * Package Relationships added
+  * Package deletion fixed
+  * Changeset entities added
+  * Improved httpauth (thanks to will waites)
+
+
+v0.2 2009-11-05
+---------------
+
+  * Search API support added
+  * Improved package support to include additional fields such as 'extras'
+  * Support tag and group entities in addition to package
+  * Compatibility changes: CkanClient base_location (now should point to base
+    api e.g. http://ckan.net/api rather than http://ckan.net/api/rest)
+
+
+v0.1 2008-04
+------------
+
+  * Fully functional implementation for REST interface to packages
+'''
+
+__license__ = 'MIT'
+
+import os
+import re
+import itertools
+import time
+import base64
+import hashlib
+import socket
+import threading
+import zlib
+from email.utils import parsedate_tz, mktime_tz
+
+try:
+    str = unicode
+    from urllib2 import (urlopen, build_opener, install_opener,
+                         HTTPBasicAuthHandler,
+                         HTTPPasswordMgrWithDefaultRealm,
+                         Request,
+                         HTTPError, URLError)
+    from urllib import urlencode, addinfourl
+    from urlparse import urlsplit, urljoin
+    from StringIO import StringIO
+    import httplib
+except NameError:
+    # Forward compatibility with Py3k
+    from urllib.error import HTTPError, URLError
+    from urllib.parse import urlencode, urlsplit, urljoin
+    from urllib.request import (build_opener, install_opener, urlopen,
+                                HTTPPasswordMgrWithDefaultRealm,
+                                HTTPBasicAuthHandler,
+                                Request)
+    from urllib.response import addinfourl
+    from io import BytesIO as StringIO
+    import http.client as httplib
+
+try: # since python 2.6
+    import json
+except ImportError:
+    import simplejson as json
+
+from ckanclient.streaming import JsonArrayStream
+from ckanclient.workers import WorkerPool
+
+import logging
+logger = logging.getLogger('ckanclient')
+
+PAGE_SIZE = 10
+# Characters of a body that verbose output shows
+TRACE_LENGTH = 1000
+
+class CkanApiError(Exception): pass
+class CkanApiNotFoundError(CkanApiError): pass
+class CkanApiNotAuthorizedError(CkanApiError): pass
+class CkanApiConflictError(CkanApiError): pass
+class CkanApiCircuitOpenError(CkanApiError): pass
+
+
+class ApiRequest(Request):
+    def __init__(self, url, data=None, headers={}, method=None):
+        Request.__init__(self, url, data, headers)
+        self._method = method
+        
+    def get_method(self):
+        if self.has_data():
+            if not self._method:
+                return 'POST'
+            assert self._method in ('POST', 'PUT'), 'Invalid method "%s" for request with data.' % self._method
+            return self._method
+        else:
+            if not self._method:
+                return 'GET'
+            assert self._method in ('GET', 'DELETE'), 'Invalid method "%s" for request without data.' % self._method
+            return self._method
+
+
+class UrllibTransport(object):
+    '''Opens each request with urlopen, so every call gets a new connection.
+    This is the default transport.'''
+
+    def open(self, request):
+        return urlopen(request)
+
+
+class KeepAliveTransport(object):
+    '''Reuses HTTP/1.1 keep-alive connections, keeping at most `pool_size`
+    idle connections per host.
+
+    One instance may be shared by several clients and threads. Pool hits,
+    misses and discarded connections are counted, see stats().
+
+    :param pool_size: idle connections kept per host, default *4*
+    :param timeout: socket timeout in seconds, default *None*
+    :param http_user: sent as preemptive basic auth, default *None*
+    :param http_pass: default *None*
+    '''
+    max_redirects = 5
+
+    def __init__(self, pool_size=4, timeout=None, http_user=None,
+                 http_pass=None):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.auth_header = None
+        if http_user and http_pass:
+            self.auth_header = 'Basic ' + base64.b64encode(
+                '%s:%s' % (http_user, http_pass))
+        self._lock = threading.Lock()
+        self._idle = {}
+        self._stats = {'hits': 0, 'misses': 0, 'discarded': 0}
+
+    def stats(self):
+        '''Returns a copy of the pool counters.'''
+        self._lock.acquire()
+        try:
+            return dict(self._stats)
+        finally:
+            self._lock.release()
+
+    def close(self):
+        '''Closes all idle connections.'''
+        self._lock.acquire()
+        try:
+            idle, self._idle = self._idle, {}
+        finally:
+            self._lock.release()
+        for connections in idle.values():
+            for conn in connections:
+                conn.close()
+
+    def open(self, request):
+        url = request.get_full_url()
+        method = request.get_method()
+        data = request.get_data()
+        headers = dict(request.header_items())
+        if data is not None and 'Content-type' not in headers:
+            headers['Content-type'] = 'application/x-www-form-urlencoded'
+        if self.auth_header:
+            headers['Authorization'] = self.auth_header
+        for redirect in range(self.max_redirects + 1):
+            response = self._send(method, url, data, headers)
+            location = response.headers.get('location')
+            if response.code not in (301, 302, 303, 307) or not location:
+                break
+            # Follow the redirect with a GET, as urllib2 does.
+            response.read()
+            url = urljoin(url, location)
+            method, data = 'GET', None
+            headers.pop('Content-type', None)
+            headers.pop('Content-length', None)
+        if not 200 <= response.code < 300:
+            fp = addinfourl(StringIO(response.read()), response.headers,
+                            url, response.code)
+            raise HTTPError(url, response.code, response.msg,
+                            response.headers, fp)
+        return response
+
+    def _send(self, method, url, data, headers):
+        scheme, netloc, path, query, fragment = urlsplit(url)
+        selector = path or '/'
+        if query:
+            selector += '?' + query
+        key = (scheme, netloc)
+        conn, reused = self._acquire(key)
+        try:
+            conn.request(method, selector, data, headers)
+            response = conn.getresponse()
+        except (socket.error, httplib.HTTPException), inst:
+            conn.close()
+            if not reused:
+                raise URLError(inst)
+            # The server may have dropped an idle connection, so retry
+            # once on a fresh one.
+            if hasattr(data, 'seek'):
+                data.seek(0)
+            conn = self._connect(key)
+            try:
+                conn.request(method, selector, data, headers)
+                response = conn.getresponse()
+            except (socket.error, httplib.HTTPException), inst:
+                conn.close()
+                raise URLError(inst)
+        return _PooledResponse(self, key, conn, response, url)
+
+    def _acquire(self, key):
+        self._lock.acquire()
+        try:
+            idle = self._idle.get(key)
+            if idle:
+                self._stats['hits'] += 1
+                return idle.pop(), True
+            self._stats['misses'] += 1
+        finally:
+            self._lock.release()
+        return self._connect(key), False
+
+    def _release(self, key, conn):
+        self._lock.acquire()
+        try:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.pool_size:
+                idle.append(conn)
+                return
+            self._stats['discarded'] += 1
+        finally:
+            self._lock.release()
+        conn.close()
+
+    def _connect(self, key):
+        scheme, netloc = key
+        if scheme == 'https':
+            connection_class = httplib.HTTPSConnection
+        else:
+            connection_class = httplib.HTTPConnection
+        if self.timeout is None:
+            return connection_class(netloc)
+        return connection_class(netloc, timeout=self.timeout)
+
+
+class _PooledResponse(object):
+    '''Response returned by KeepAliveTransport. The connection goes back to
+    the pool once the body has been read to the end.'''
+
+    def __init__(self, transport, key, conn, response, url):
+        self.code = response.status
+        self.msg = response.reason
+        self.headers = response.msg
+        self._transport = transport
+        self._key = key
+        self._conn = conn
+        self._response = response
+        self._url = url
+
+    def geturl(self):
+        return self._url
+
+    def info(self):
+        return self.headers
+
+    def read(self, amt=None):
+        if self._response is None:
+            return ''
+        if amt is None:
+            data = self._response.read()
+        else:
+            data = self._response.read(amt)
+        if amt is None or not data or self._response.isclosed():
+            self._finish()
+        return data
+
+    def close(self):
+        if self._response is not None:
+            # Unread body left on the socket, so it cannot be reused.
+            self._response = None
+            self._conn.close()
+
+    def _finish(self):
+        response, self._response = self._response, None
+        if response.will_close:
+            self._conn.close()
+        else:
+            self._transport._release(self._key, self._conn)
+
+
+class _DecodedResponse(object):
+    '''Wraps a response, decoding a gzip or deflate Content-Encoding as the
+    body is read and counting the bytes in a TransferStats.'''
+
+    def __init__(self, response, transfer_stats=None):
+        self.code = response.code
+        self.msg = getattr(response, 'msg', None)
+        self.headers = response.headers
+        self.raw_bytes = 0
+        self._response = response
+        self._transfer_stats = transfer_stats
+        self._buffer = ''
+        self._eof = False
+        encoding = (self.headers.get('Content-Encoding') or '').lower()
+        self._decompressor = None
+        self._deflate = encoding == 'deflate'
+        if encoding == 'gzip':
+            self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif encoding == 'deflate':
+            self._decompressor = zlib.decompressobj()
+
+    def geturl(self):
+        return self._response.geturl()
+
+    def info(self):
+        return self.headers
+
+    def read(self, amt=None):
+        raw_bytes = self.raw_bytes
+        while not self._eof and (amt is None or len(self._buffer) < amt):
+            if amt is None:
+                data = self._response.read()
+            else:
+                data = self._response.read(max(amt, 8192))
+            if data:
+                self.raw_bytes += len(data)
+                self._buffer += self._decompress(data)
+            else:
+                self._eof = True
+                if self._decompressor is not None:
+                    self._buffer += self._decompressor.flush()
+        if amt is None:
+            data, self._buffer = self._buffer, ''
+        else:
+            data, self._buffer = self._buffer[:amt], self._buffer[amt:]
+        if self._transfer_stats is not None:
+            self._transfer_stats.add(self.raw_bytes - raw_bytes, len(data),
+                                     self._decompressor is not None)
+        return data
+
+    def close(self):
+        self._response.close()
+
+    def _decompress(self, data):
+        if self._decompressor is None:
+            return data
+        try:
+            return self._decompressor.decompress(data)
+        except zlib.error:
+            if not self._deflate or self.raw_bytes != len(data):
+                raise
+            # Some servers send deflate without the zlib header.
+            self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+            return self._decompressor.decompress(data)
+
+
+class _MultipartBody(object):
+    '''A multipart/form-data request body of form fields and one file.
+    The file is read from disk chunk_size bytes at a time as the body is
+    sent, calling progress(bytes_sent, file_size) after each chunk.'''
+
+    def __init__(self, fields, file_field, file_path, chunk_size=1048576,
+                 progress=None):
+        self.file_path = file_path
+        self.chunk_size = chunk_size
+        self.progress = progress
+        self.boundary = '----ckanclient' + hashlib.sha1(
+            '%s %s' % (file_path, time.time())).hexdigest()
+        head = []
+        for name, value in fields:
+            if isinstance(value, unicode):
+                value = value.encode('utf-8')
+            head.append('--%s\r\nContent-Disposition: form-data; '
+                        'name="%s"\r\n\r\n%s\r\n' % (self.boundary, name,
+                                                     value))
+        head.append('--%s\r\nContent-Disposition: form-data; name="%s"; '
+                    'filename="%s"\r\nContent-Type: application/octet-stream'
+                    '\r\n\r\n' % (self.boundary, file_field,
+                                  os.path.basename(file_path)))
+        self._head = ''.join(head)
+        self._tail = '\r\n--%s--\r\n' % self.boundary
+        self.file_size = os.path.getsize(file_path)
+        self.length = len(self._head) + self.file_size + len(self._tail)
+        self._file = None
+        self.seek(0)
+
+    @property
+    def content_type(self):
+        return 'multipart/form-data; boundary=%s' % self.boundary
+
+    def seek(self, offset):
+        '''Rewinds to the start, for the body to be sent again.'''
+        assert offset == 0, 'Can only seek to the start'
+        self.close()
+        self._file = open(self.file_path, 'rb')
+        self._buffer = self._head
+        self._tail_sent = False
+        self.file_sent = 0
+
+    def read(self, amt=-1):
+        if not self._buffer:
+            chunk = self._file.read(self.chunk_size)
+            if chunk:
+                self.file_sent += len(chunk)
+                self._buffer = chunk
+                if self.progress is not None:
+                    self.progress(self.file_sent, self.file_size)
+            elif not self._tail_sent:
+                self._buffer = self._tail
+                self._tail_sent = True
+        if amt is None or amt < 0:
+            data, self._buffer = self._buffer, ''
+        else:
+            data, self._buffer = self._buffer[:amt], self._buffer[amt:]
+        return data
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+class TransferStats(object):
+    '''Counts the response body bytes received over the wire and once
+    decoded. CkanClient makes one per client unless one is passed in, so
+    clients can share one to count a whole run.'''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {'bytes_received': 0, 'bytes_decoded': 0,
+                       'compressed_bytes_received': 0,
+                       'compressed_bytes_decoded': 0}
+
+    def add(self, received, decoded, compressed=False):
+        self._lock.acquire()
+        try:
+            self._stats['bytes_received'] += received
+            self._stats['bytes_decoded'] += decoded
+            if compressed:
+                self._stats['compressed_bytes_received'] += received
+                self._stats['compressed_bytes_decoded'] += decoded
+        finally:
+            self._lock.release()
+
+    def stats(self):
+        '''Returns a copy of the counters, with the compression ratio of
+        the compressed responses.'''
+        self._lock.acquire()
+        try:
+            stats = dict(self._stats)
+        finally:
+            self._lock.release()
+        stats['compression_ratio'] = None
+        if stats['compressed_bytes_received']:
+            stats['compression_ratio'] = (
+                float(stats['compressed_bytes_decoded']) /
+                stats['compressed_bytes_received'])
+        return stats
+
+
+class RateLimiter(object):
+    '''Token bucket pacing requests to `rate` per second, with bursts of up
+    to `burst` requests. It also holds every caller back while the server
+    has asked for a pause (see CkanClient max_retries).
+
+    Share one instance between clients and threads to pace them together.
+    stats() tells time spent throttled by the bucket (client-bound) apart
+    from time spent backing off at the server's request (server-bound).
+
+    :param rate: requests per second, default *None* (no limit)
+    :param burst: default *1*
+    '''
+
+    def __init__(self, rate=None, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.time()
+        self._paused_until = 0
+        self._lock = threading.Lock()
+        self._stats = {'requests': 0, 'throttled_seconds': 0.0,
+                       'backoffs': 0, 'backoff_seconds': 0.0}
+
+    def acquire(self):
+        '''Blocks until a request may be made.'''
+        while True:
+            self._lock.acquire()
+            try:
+                now = time.time()
+                delay = self._paused_until - now
+                stat = 'backoff_seconds'
+                if delay <= 0:
+                    if not self.rate:
+                        self._stats['requests'] += 1
+                        return
+                    self._tokens = min(self.burst, self._tokens +
+                                       (now - self._updated) * self.rate)
+                    self._updated = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        self._stats['requests'] += 1
+                        return
+                    delay = (1 - self._tokens) / self.rate
+                    stat = 'throttled_seconds'
+                self._stats[stat] += delay
+            finally:
+                self._lock.release()
+            time.sleep(delay)
+
+    def pause(self, seconds):
+        '''Holds back all requests for the next `seconds`.'''
+        self._lock.acquire()
+        try:
+            self._paused_until = max(self._paused_until, time.time() + seconds)
+            self._stats['backoffs'] += 1
+        finally:
+            self._lock.release()
+
+    def stats(self):
+        '''Returns a copy of the counters.'''
+        self._lock.acquire()
+        try:
+            return dict(self._stats)
+        finally:
+            self._lock.release()
+
+
+class CircuitBreaker(object):
+    '''Stops requests to a failing server, so callers fail fast instead of
+    each retrying and waiting on their own.
+
+    After `threshold` consecutive failures (5xx responses, or no response)
+    the circuit opens, and requests raise CkanApiCircuitOpenError without
+    being sent. Once `cooldown` seconds have passed, the next request first
+    probes the server with api_version_get: if that succeeds the circuit
+    closes, otherwise it stays open for another cooldown.
+
+    Share one instance between clients and threads to trip them together.
+
+    :param threshold: default *5*
+    :param cooldown: seconds, default *60*
+    '''
+
+    def __init__(self, threshold=5, cooldown=60):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = 'closed'
+        self._consecutive = 0
+        self._opened_at = self._first_opened_at = None
+        self._lock = threading.Lock()
+        self._stats = {'successes': 0, 'failures': 0, 'rejected': 0,
+                       'opened': 0, 'closed': 0, 'probes': 0,
+                       'probe_failures': 0, 'open_seconds': 0.0}
+
+    def allow(self, probe):
+        '''Returns if a request may be made, else raises
+        CkanApiCircuitOpenError. When the cooldown is over, probe() is
+        called to test the server, and should raise CkanApiError if it is
+        still failing.'''
+        self._lock.acquire()
+        try:
+            if self.state == 'closed':
+                return
+            wait = self._opened_at + self.cooldown - time.time()
+            if self.state == 'half_open' or wait > 0:
+                self._stats['rejected'] += 1
+                raise CkanApiCircuitOpenError(
+                    'Circuit open after %d consecutive failures, next probe '
+                    'in %d seconds' % (self._consecutive, max(0, wait)))
+            self.state = 'half_open'
+            self._stats['probes'] += 1
+        finally:
+            self._lock.release()
+        passed = False
+        try:
+            probe()
+            passed = True
+        except CkanApiError:
+            pass
+        finally:
+            self._lock.acquire()
+            try:
+                if passed:
+                    self._close()
+                else:
+                    self._stats['probe_failures'] += 1
+                    self._open()
+            finally:
+                self._lock.release()
+        if not passed:
+            raise CkanApiCircuitOpenError(
+                'Circuit open, probe failed, next probe in %d seconds' %
+                self.cooldown)
+
+    def record(self, success):
+        '''Counts the outcome of a request that was allowed.'''
+        self._lock.acquire()
+        try:
+            if success:
+                self._stats['successes'] += 1
+                self._consecutive = 0
+            else:
+                self._stats['failures'] += 1
+                self._consecutive += 1
+                if self.state == 'closed' and \
+                        self._consecutive >= self.threshold:
+                    self._open()
+        finally:
+            self._lock.release()
+
+    def _open(self):
+        if self.state == 'closed':
+            self._stats['opened'] += 1
+            logger.warning('ckanclient: Circuit opened after %d consecutive '
+                           'failures', self._consecutive)
+            self._opened_at = self._first_opened_at = time.time()
+        else:
+            self._opened_at = time.time()
+        self.state = 'open'
+
+    def _close(self):
+        self._stats['closed'] += 1
+        self._stats['open_seconds'] += time.time() - self._first_opened_at
+        logger.warning('ckanclient: Circuit closed')
+        self._consecutive = 0
+        self.state = 'closed'
+
+    def stats(self):
+        '''Returns a copy of the counters, with the current state and run
+        of consecutive failures.'''
+        self._lock.acquire()
+        try:
+            stats = dict(self._stats)
+            stats['state'] = self.state
+            stats['consecutive_failures'] = self._consecutive
+            return stats
+        finally:
+            self._lock.release()
+
+
+class ApiResponse(object):
+    '''The outcome of one request, as returned by ApiClient.open_url.
+    Read only, so it can be handed between threads.
+
+    stream is the unread body of a response opened with stream=True.'''
+
+    __slots__ = ('location', 'status', 'headers', 'body', 'message',
+                 'http_error', 'url_error', 'stream')
+
+    def __init__(self, **kwargs):
+        for name in self.__slots__:
+            object.__setattr__(self, name, kwargs.get(name))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('ApiResponse is read only')
+
+    def __repr__(self):
+        return '<ApiResponse %s %s>' % (self.status, self.location)
+
+
+def _per_thread(name):
+    '''A property kept separately for each thread using the client.'''
+    def get(self):
+        return getattr(self._thread_state(), name, None)
+    def set(self, value):
+        setattr(self._thread_state(), name, value)
+    return property(get, set)
+
+
+class ApiClient(object):
+
+    transport = UrllibTransport()
+    response_cache = None
+    is_verbose = False
+    hooks = ()
+    # Sent as Accept-Encoding; None asks for uncompressed responses.
+    accept_encoding = 'gzip, deflate'
+    # Sent as Authorization with every request when set, for sites behind
+    # basic auth.
+    basic_auth = None
+    transfer_stats = None
+
+    # The state of the last request made on the calling thread, kept for
+    # compatibility. Prefer the ApiResponse open_url returns.
+    last_location = _per_thread('last_location')
+    last_status = _per_thread('last_status')
+    last_body = _per_thread('last_body')
+    last_headers = _per_thread('last_headers')
+    last_message = _per_thread('last_message')
+    last_http_error = _per_thread('last_http_error')
+    last_url_error = _per_thread('last_url_error')
+    last_response = _per_thread('last_response')
+    url_response = _per_thread('url_response')
+    _bytes_received = _per_thread('_bytes_received')
+
+    _thread_state_lock = threading.Lock()
+
+    def _thread_state(self):
+        state = self.__dict__.get('_thread_local')
+        if state is None:
+            ApiClient._thread_state_lock.acquire()
+            try:
+                state = self.__dict__.setdefault('_thread_local',
+                                                 threading.local())
+            finally:
+                ApiClient._thread_state_lock.release()
+        return state
+
+    def reset(self):
+        self.last_location = None
+        self.last_status = None
+        self.last_body = None
+        self.last_headers = None
+        self.last_message = None
+        self.last_http_error = None
+        self.last_url_error = None
+        self.last_response = None
+
+    def open_url(self, location, data=None, headers={}, method=None,
+                 stream=False):
+        '''Opens location and returns an ApiResponse, which last_status,
+        last_message etc. also reflect for the calling thread.
+
+        With stream, a successful response body is left unread in
+        ApiResponse.stream for the caller, and body and message are None.
+        '''
+        if not self.hooks:
+            self._open_url(location, data, headers, method, stream)
+            return self._make_response(stream)
+        resource = self._resource_name(location)
+        if method is None:
+            method = 'GET' if data is None else 'POST'
+        bytes_sent = len(urlencode({data: 1})) if data is not None else 0
+        for hook in self.hooks:
+            hook.before_request(resource, method, location, bytes_sent)
+        start = time.time()
+        try:
+            self._open_url(location, data, headers, method, stream)
+        finally:
+            elapsed = time.time() - start
+            for hook in self.hooks:
+                hook.after_response(resource, method, location,
+                                    self.last_status, bytes_sent,
+                                    self._bytes_received, elapsed)
+        return self._make_response(stream)
+
+    def _make_response(self, stream):
+        stream_body = None
+        if stream and self.last_http_error is None and \
+                self.last_url_error is None:
+            stream_body = self.url_response
+        self.last_response = ApiResponse(location=self.last_location,
+            status=self.last_status, headers=self.last_headers,
+            body=self.last_body, message=self.last_message,
+            http_error=self.last_http_error, url_error=self.last_url_error,
+            stream=stream_body)
+        return self.last_response
+
+    def _open_url(self, location, data, headers, method, stream):
+        if self.is_verbose:
+            self._print("ckanclient: Opening %s", location)
+        self.last_location = location
+        self._bytes_received = None
+        cache_key = None
+        if self.response_cache is not None and data is None and \
+                method in (None, 'GET') and not stream:
+            cache_key = self._cache_key(location, headers)
+            request_headers = headers
+            headers = dict(headers,
+                           **self.response_cache.validators(cache_key))
+        if self.accept_encoding:
+            headers = dict(headers, **{'Accept-Encoding': self.accept_encoding})
+        if self.basic_auth:
+            headers = dict(headers, Authorization=self.basic_auth)
+        try:
+            if data != None:
+                data = urlencode({data: 1})
+            req = ApiRequest(location, data, headers, method=method)
+            self.url_response = _DecodedResponse(self.transport.open(req),
+                                                 self.transfer_stats)
+            if data and self.url_response.geturl() != location:
+                redirection = '%s -> %s' % (location, self.url_response.geturl())
+                raise URLError("Got redirected to another URL, which does not work with POSTS. Redirection: %s" % redirection)
+        except HTTPError, inst:
+            if inst.code == 304 and cache_key is not None:
+                cached = self.response_cache.hit(cache_key)
+                if cached is None:
+                    # Evicted since the validators were sent.
+                    return ApiClient._open_url(self, location, None,
+                                               request_headers, method, False)
+                self._print("ckanclient: Not modified, using cached body for %s", location)
+                body, content_type = cached
+                self._bytes_received = 0
+                self._set_body(200, body, inst.hdrs, content_type)
+                return
+            self._print("ckanclient: Received HTTP error code from CKAN resource.")
+            self._print("ckanclient: location: %s", location)
+            self._print("ckanclient: response code: %s", inst.fp.code)
+            self._print("ckanclient: request headers: %s", headers)
+            self._print_body("ckanclient: request data: %s", data)
+            self._print("ckanclient: error: %s", inst)
+            self.last_http_error = inst
+            self.last_status = inst.code
+            response = _DecodedResponse(inst, self.transfer_stats)
+            self.last_message = response.read()
+            self._bytes_received = response.raw_bytes
+        except URLError, inst:
+            self._print("ckanclient: Unable to progress with URL.")
+            self._print("ckanclient: location: %s", location)
+            self._print("ckanclient: request headers: %s", headers)
+            self._print_body("ckanclient: request data: %s", data)
+            self._print("ckanclient: error: %s", inst)
+            self.last_url_error = inst
+            if isinstance(inst.reason, tuple):
+                self.last_status,self.last_message = inst.reason
+            else:
+                self.last_message = inst.reason
+                self.last_status = inst.errno
+        else:
+            self._print("ckanclient: OK opening CKAN resource: %s", location)
+            if stream:
+                self.last_status = self.url_response.code
+                self.last_headers = self.url_response.headers
+                return
+            body = self.url_response.read()
+            self._bytes_received = self.url_response.raw_bytes
+            if cache_key is not None:
+                self.response_cache.store(cache_key, body,
+                                          self.url_response.headers)
+            self._set_body(self.url_response.code, body,
+                           self.url_response.headers)
+
+    def _set_body(self, status, body, headers, content_type=None):
+        self.last_status = status
+        self._print('ckanclient: last status %s', self.last_status)
+        self.last_body = body
+        self._print_body('ckanclient: last body %s', self.last_body)
+        self.last_headers = headers
+        self._print('ckanclient: last headers %s', self.last_headers)
+        if content_type is None:
+            content_type = self.last_headers['Content-Type']
+        self._print('ckanclient: content type: %s', content_type)
+        is_json_response = False
+        if 'json' in content_type:
+            is_json_response = True
+        if is_json_response:
+            self.last_message = self._loadstr(self.last_body)
+        else:
+            self.last_message = self.last_body
+        self._print_body('ckanclient: last message %s', self.last_message)
+
+    def _cache_key(self, location, headers):
+        auth = headers.get('Authorization')
+        if not auth:
+            return location
+        # Responses may differ per user, but keep the key itself off disk.
+        return '%s %s' % (location, hashlib.sha1(auth).hexdigest())
+    
+    def _resource_name(self, location):
+        '''Returns the resource_paths key location was made from, or None.'''
+        if not location.startswith(self.base_location):
+            return None
+        path = location[len(self.base_location):].split('?')[0]
+        found = None
+        for name, resource_path in self.resource_paths.items():
+            if path == resource_path:
+                is_entity = False
+            elif resource_path and path.startswith(resource_path + '/'):
+                is_entity = True
+            else:
+                continue
+            # Registers and entities share paths, so the longest path wins,
+            # then the name that matches whether an id follows it.
+            rank = (len(resource_path), name.endswith('Entity') == is_entity)
+            if found is None or rank > found[0]:
+                found = (rank, name)
+        if found is not None:
+            return found[1]
+
+    def get_location(self, resource_name, entity_id=None, subregister=None, entity2_id=None):
+        base = self.base_location
+        path = self.resource_paths[resource_name]
+        if entity_id != None:
+            path += '/' + entity_id
+            if subregister != None:
+                path += '/' + subregister
+                if entity2_id != None:
+                    path += '/' + entity2_id            
+        return base + path
+
+    def _dumpstr(self, data):
+        return json.dumps(data)
+    
+    def _loadstr(self, string):
+        try:
+            if string == '':
+                data = None
+            else:
+                data = json.loads(string)
+        except ValueError, exception:
+            msg = "Couldn't decode data from JSON string: '%s': %s" % (string, exception)
+            raise ValueError, msg
+        return data
+
+    def _print(self, msg, *args):
+        '''Print depending on self.is_verbose and log at the same time.
+
+        msg is only formatted with args when it is going to be output, so
+        large bodies are not turned into strings for nothing.'''
+        if not self.is_verbose:
+            return
+        if args:
+            msg = msg % args
+        logger.debug(msg)
+        print(msg)
+
+    def _print_body(self, msg, body):
+        '''_print a request or response body, or its decoded message, cut
+        to its first TRACE_LENGTH characters.'''
+        if not self.is_verbose:
+            return
+        body = '%s' % (body,)
+        if len(body) > TRACE_LENGTH:
+            body = '%s... (%d characters)' % (body[:TRACE_LENGTH], len(body))
+        self._print(msg, body)
+
+
+class CkanClient(ApiClient):
+    """
+    Client API implementation for CKAN.
+
+    :param base_location: default *http://thedatahub.org/api*
+    :param api_key: default *None*
+    :param is_verbose: default *False*
+    :param http_user: default *None*
+    :param http_pass: default *None*
+    :param transport: default *None*, which opens a new connection for each
+        request. Pass a KeepAliveTransport to reuse connections.
+    :param prefetch_workers: default *0*. When set, package_search fetches
+        later result pages on this many threads while earlier ones are read.
+    :param response_cache: default *None*. A ckanclient.cache.ResponseCache
+        used to make conditional GET requests.
+    :param rate_limiter: default *None*. A RateLimiter pacing the requests.
+    :param max_retries: default *0*. Times to retry a request answered with
+        429 Too Many Requests or 503 Service Unavailable, after waiting as
+        long as the Retry-After header says, or else backoff_base * 2^n
+        seconds. The wait holds back every client sharing the rate_limiter.
+    :param stream_search: default *False*. When set, package_search decodes
+        the results one at a time as they are read from the connection,
+        rather than loading each page whole. See package_search.
+    :param hooks: default *None*. A list of ckanclient.hooks.RequestHook
+        objects called around every request.
+    :param transfer_stats: default *None*, which makes a new one. The
+        TransferStats counting the bytes received, before and after gzip or
+        deflate responses are decoded.
+    :param circuit_breaker: default *None*. A CircuitBreaker that stops
+        requests once the server keeps failing.
+    :param lookup_cache: default *None*. A ckanclient.cache.LookupCache
+        answering group_entity_get from memory. Groups written through the
+        client are invalidated in it.
+    """
+    base_location = 'http://thedatahub.org/api'
+    backoff_base = 1
+    lookup_cache = None
+    resource_paths = {
+        'Base': '',
+        'Changeset Register': '/rest/changeset',
+        'Changeset Entity': '/rest/changeset',
+        'Package Register': '/rest/package',
+        'Package Entity': '/rest/package',
+        'Tag Register': '/rest/tag',
+        'Tag Entity': '/rest/tag',
+        'Group Register': '/rest/group',
+        'Group Entity': '/rest/group',
+        'Package Search': '/search/package',
+        'Revision Register': '/rest/revision',
+        'Revision Entity': '/rest/revision',
+        'Revision Search': '/search/revision',
+        'Package Create Form': '/form/package/create',
+        'Package Edit Form': '/form/package/edit',
+    }
+
+    def __init__(self, base_location=None, api_key=None, is_verbose=False,
+                 http_user=None, http_pass=None, transport=None,
+                 prefetch_workers=0, response_cache=None, rate_limiter=None,
+                 max_retries=0, stream_search=False, hooks=None,
+                 transfer_stats=None, circuit_breaker=None, lookup_cache=None):
+        if base_location is not None:
+            self.base_location = base_location
+        self.api_key = api_key
+        self.is_verbose = is_verbose
+        if transport is not None:
+            self.transport = transport
+        self.prefetch_workers = prefetch_workers
+        self.writes_avoided = 0
+        self._lock = threading.Lock()
+        self.rate_limiter = rate_limiter
+        self.max_retries = max_retries
+        self.circuit_breaker = circuit_breaker
+        self.stream_search = stream_search
+        if hooks is not None:
+            self.hooks = list(hooks)
+        self.transfer_stats = transfer_stats or TransferStats()
+        if response_cache is not None:
+            self.response_cache = response_cache
+        if lookup_cache is not None:
+            self.lookup_cache = lookup_cache
+        if http_user and http_pass:
+            password_mgr = HTTPPasswordMgrWithDefaultRealm()
+            password_mgr.add_password(None, base_location,
+                                      http_user, http_pass)
+            handler = HTTPBasicAuthHandler(password_mgr)
+            opener = build_opener(handler)
+            install_opener(opener)
+            # Transports other than urlopen don't use the opener installed,
+            # so the credentials go with each request too.
+            self.basic_auth = 'Basic ' + base64.b64encode(
+                '%s:%s' % (http_user, http_pass))
+
+    def _auth_headers(self):
+        return {
+            'Authorization': self.api_key,
+            'X-CKAN-API-Key': self.api_key
+            }
+
+    _probing = _per_thread('_probing')
+
+    def open_url(self, url, *args, **kwargs):
+        breaker = self.circuit_breaker
+        if self._probing:
+            breaker = None
+        retries = 0
+        while True:
+            if breaker is not None:
+                breaker.allow(self._probe_circuit)
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            result = super(CkanClient, self).open_url(url, *args, **kwargs)
+            if breaker is not None:
+                breaker.record(self.last_url_error is None and
+                               (self.last_status or 0) < 500)
+            if self.last_status not in (429, 503) or \
+                    retries >= self.max_retries:
+                break
+            delay = self._retry_after()
+            if delay is None:
+                delay = self.backoff_base * 2 ** retries
+            self._print("ckanclient: Status %s, retrying in %s seconds", self.last_status, delay)
+            if self.rate_limiter is not None:
+                self.rate_limiter.pause(delay)
+            else:
+                time.sleep(delay)
+            retries += 1
+        if self.last_status not in (200, 201):
+            if self.last_status == 404:
+                raise CkanApiNotFoundError(self.last_status)
+            elif self.last_status == 403:
+                raise CkanApiNotAuthorizedError(self.last_status)
+            elif self.last_status == 409:
+                raise CkanApiConflictError(self.last_status)
+            else:
+                raise CkanApiError(self.last_message)
+        return result
+
+    def _probe_circuit(self):
+        '''Checks the server answers, bypassing the circuit breaker.'''
+        self._probing = True
+        try:
+            self.api_version_get()
+        finally:
+            self._probing = False
+
+    def _retry_after(self):
+        '''Returns the seconds to wait from a Retry-After header, if any.'''
+        if self.last_http_error is None:
+            return None
+        retry_after = self.last_http_error.hdrs.get('retry-after')
+        if not retry_after:
+            return None
+        if retry_after.strip().isdigit():
+            return int(retry_after)
+        date = parsedate_tz(retry_after)
+        if date is None:
+            return None
+        return max(0, mktime_tz(date) - time.time())
+            
+    def api_version_get(self):
+        self.reset()
+        url = self.get_location('Base')
+        self.open_url(url)
+        version = self.last_message['version']
+        return version    
+
+
+    #
+    # Model API
+    #
+
+    def package_register_get(self):
+        self.reset()
+        url = self.get_location('Package Register')
+        self.open_url(url)
+        return self.last_message
+
+    def package_register_post(self, package_dict):
+        self.reset()
+        url = self.get_location('Package Register')
+        data = self._dumpstr(package_dict)
+        headers = self._auth_headers()
+        self.open_url(url, data, headers)
+        return self.last_message
+
+    def package_entity_get(self, package_name):
+        self.reset()
+        url = self.get_location('Package Entity', package_name)
+        headers = self._auth_headers()
+        self.open_url(url, headers=headers)
+        return self.last_message
+
+    def package_entity_put(self, package_dict, package_name=None):
+        # You only need to specify the current package_name if you
+        # are giving it a new package_name in the package_dict.
+        self.reset()
+        if not package_name:
+            package_name = package_dict['name']
+        url = self.get_location('Package Entity', package_name)
+        data = self._dumpstr(package_dict)
+        headers = self._auth_headers()
+        self.open_url(url, data, headers, method='PUT')
+        return self.last_message
+
+    def package_entity_put_if_changed(self, package_dict_remote,
+                                      package_dict, package_name=None):
+        '''PUTs package_dict only if it differs from package_dict_remote, the
+        package as last read from CKAN. Returns the differences, which are
+        empty when the write was skipped (counted in writes_avoided).'''
+        diff = self.package_entity_diff(package_dict_remote, package_dict)
+        if not diff:
+            self._lock.acquire()
+            try:
+                self.writes_avoided += 1
+            finally:
+                self._lock.release()
+            return diff
+        self.package_entity_put(package_dict, package_name)
+        return diff
+
+    def package_entity_diff(self, package_dict_remote, package_dict):
+        '''Returns {field: (remote value, new value)} for each field of
+        package_dict that differs from package_dict_remote.
+
+        Tags and groups compare as sets. Resources are matched by id, or
+        else by format, and compared on the fields given in package_dict.'''
+        diff = {}
+        for key, value in package_dict.items():
+            remote_value = package_dict_remote.get(key)
+            if key in ('tags', 'groups'):
+                changed = set(value or []) != set(remote_value or [])
+            elif key == 'resources':
+                changed = self._resources_differ(remote_value or [],
+                                                 value or [])
+            else:
+                changed = self._normalize(value) != \
+                          self._normalize(remote_value)
+            if changed:
+                diff[key] = (remote_value, value)
+        return diff
+
+    def _resources_differ(self, resources_remote, resources):
+        if len(resources) != len(resources_remote):
+            return True
+        unmatched = list(resources_remote)
+        for resource in resources:
+            match = None
+            for resource_remote in unmatched:
+                if resource.get('id'):
+                    if resource_remote.get('id') == resource['id']:
+                        match = resource_remote
+                        break
+                elif (resource_remote.get('format') or '').lower() == \
+                     (resource.get('format') or '').lower():
+                    match = resource_remote
+                    break
+            if match is None:
+                return True
+            unmatched.remove(match)
+            for key, value in resource.items():
+                if self._normalize(value) != self._normalize(match.get(key)):
+                    return True
+        return False
+
+    def _normalize(self, value):
+        # CKAN hands back empty fields as '' and numbers (e.g. resource
+        # size) as strings, so don't count those as changes.
+        if value is None:
+            return u''
+        if isinstance(value, (int, long, float)) and \
+                not isinstance(value, bool):
+            return unicode(value)
+        return value
+
+    def package_entity_delete(self, package_name):
+        self.reset()
+        url = self.get_location('Package Register', package_name)
+        headers = self._auth_headers()
+        self.open_url(url, headers=headers, method='DELETE')
+        return self.last_message
+
+    def package_relationship_register_get(self, package_name,
+                relationship_type='relationships', 
+                relationship_with_package_name=None):
+        self.reset()
+        url = self.get_location('Package Entity',
+           entity_id=package_name,
+           subregister=relationship_type,
+           entity2_id=relationship_with_package_name)
+        headers = self._auth_headers()
+        self.open_url(url, headers=headers)
+        return self.last_message
+
+    def package_relationship_entity_post(self, subject_package_name,
+                relationship_type, object_package_name, comment=u''):
+        self.reset()
+        url = self.get_location('Package Entity',
+            entity_id=subject_package_name,
+            subregister=relationship_type,
+            entity2_id=object_package_name)
+        data = self._dumpstr({'comment':comment})
+        headers = self._auth_headers()
+        self.open_url(url, data, headers, method='POST')
+        return self.last_message
+
+    def package_relationship_entity_put(self, subject_package_name,
+                relationship_type, object_package_name, comment=u''):
+        self.reset()
+        url = self.get_location('Package Entity',
+            entity_id=subject_package_name,
+            subregister=relationship_type,
+            entity2_id=object_package_name)
+        data = self._dumpstr({'comment':comment})
+        headers = self._auth_headers()
+        self.open_url(url, data, headers, method='PUT')
+        return self.last_message
+
+    def package_relationship_entity_delete(self, subject_package_name,
+                relationship_type, object_package_name):
+        self.reset()
+        url = self.get_location('Package Entity',
+            entity_id=subject_package_name,
+            subregister=relationship_type,
+            entity2_id=object_package_name)
+        headers = self._auth_headers()
+        self.open_url(url, headers=headers, method='DELETE')
+        return self.last_message
+
+    def tag_register_get(self):
+        self.reset()
+        url = self.get_location('Tag Register')
+        self.open_url(url)
+        return self.last_message
+
+    def tag_entity_get(self, tag_name):
+        self.reset()
+        url = self.get_location('Tag Entity', tag_name)
+        self.open_url(url)
+        return self.last_message
+
+    def group_register_post(self, group_dict):
+        self.reset()
+        url = self.get_location('Group Register')
+        data = self._dumpstr(group_dict)
+        headers = self._auth_headers()
+        try:
+            self.open_url(url, data, headers)
+        finally:
+            self._invalidate_group(group_dict.get('name'))
+        return self.last_message
+
+    def group_register_get(self):
+        self.reset()
+        url = self.get_location('Group Register')
+        self.open_url(url)
+        return self.last_message
+
+    def group_entity_get(self, group_name):
+        """Returns the group. With a lookup_cache, a group looked up in the
+        last `ttl` seconds is returned without a request, and the last_*
+        attributes are left as they were."""
+        if self.lookup_cache is not None:
+            return self.lookup_cache.get('group', group_name,
+                lambda: self._group_entity_get(group_name))
+        return self._group_entity_get(group_name)
+
+    def _group_entity_get(self, group_name):
+        self.reset()
+        url = self.get_location('Group Entity', group_name)
+        self.open_url(url)
+        return self.last_message
+
+    def _invalidate_group(self, group_name):
+        if self.lookup_cache is not None:
+            self.lookup_cache.invalidate('group', group_name)
+
+    def group_entity_put(self, group_dict, group_name=None):
+        # You only need to specify the current group_name if you
+        # are giving it a new group_name in the group_dict.
+        self.reset()
+        if not group_name:
+            group_name = group_dict['name']
+        url = self.get_location('Group Entity', group_name)
+        data = self._dumpstr(group_dict)
+        headers = self._auth_headers()
+        try:
+            self.open_url(url, data, headers, method='PUT')
+        finally:
+            self._invalidate_group(group_name)
+            new_name = group_dict.get('name')
+            if new_name and new_name != group_name:
+                self._invalidate_group(new_name)
+        return self.last_message
+
+    #
+    # Search API
+    #
+
+    def package_search(self, q, search_options=None, prefetch_workers=None,
+                       stream=None):
+        '''Searches for packages. Returns a dict with the 'count' and a
+        generator of the 'results', which pages through the whole search.
+
+        With stream (default self.stream_search) each result is decoded as
+        it is read, so a page is never held in memory whole. The count is
+        None if the server sends it after the results, and pages are not
+        prefetched.'''
+        if stream is None:
+            stream = self.stream_search
+        self.reset()
+        search_options = search_options.copy() if search_options else {}
+        url = self.get_location('Package Search')
+        search_options['q'] = q
+        if not search_options.get('limit'):
+            search_options['limit'] = PAGE_SIZE
+        data = self._dumpstr(search_options)
+        headers = self._auth_headers()
+        self.open_url(url, data, headers, stream=stream)
+        if stream:
+            results = JsonArrayStream(self.url_response, 'results').start()
+            result_dict = dict(results.members, results=results)
+            result_dict.setdefault('count', None)
+        else:
+            result_dict = self.last_message
+        if not search_options.get('offset'):
+            if prefetch_workers is None:
+                prefetch_workers = self.prefetch_workers
+            result_dict['results'] = self._result_generator(result_dict['count'], result_dict['results'], self.package_search, q, search_options, prefetch_workers)
+        return result_dict
+
+    def _result_generator(self, count, results, func, q, search_options,
+                          prefetch_workers=0):
+        '''Returns a generator that will make the necessary calls to page
+        through results.'''
+        if isinstance(results, JsonArrayStream):
+            return self._streamed_result_generator(count, results, func, q,
+                                                   search_options)
+        limit = search_options['limit']
+        num_pages = (count + limit - 1) // limit
+        if prefetch_workers and num_pages > 1:
+            return self._prefetch_result_generator(num_pages, results, q,
+                search_options, prefetch_workers)
+        return self._paged_result_generator(num_pages, results, func, q,
+                                            search_options)
+
+    def _paged_result_generator(self, num_pages, results, func, q,
+                                search_options):
+        page = 0
+        while True:
+            for res in results:
+                yield res
+
+            # go to next page?
+            page += 1
+            if page >= num_pages:
+                break
+
+            # retrieve next page
+            search_options['offset'] = page * search_options['limit']
+            result_dict = func(q, search_options)
+            results = result_dict['results']
+
+    def _streamed_result_generator(self, count, results, func, q,
+                                   search_options):
+        '''Yields results from each page as they are decoded, going on to
+        the next page until one comes back short.'''
+        limit = search_options['limit']
+        offset = 0
+        try:
+            while True:
+                received = 0
+                for res in results:
+                    received += 1
+                    yield res
+                offset += limit
+                if received < limit or (count is not None and offset >= count):
+                    break
+                options = dict(search_options, offset=offset)
+                results = func(q, options, stream=True)['results']
+        finally:
+            # Drops the connection if the caller stopped part way.
+            results.fp.close()
+
+    def _prefetch_result_generator(self, num_pages, results, q,
+                                   search_options, workers):
+        '''Fetches the remaining pages on a pool of threads and yields them
+        in order. At most two pages per worker are held in memory.'''
+        limit = search_options['limit']
+        def fetch_page(offset):
+            options = dict(search_options, offset=offset)
+            return self.package_search(q, options)['results']
+        pool = WorkerPool(min(workers, num_pages - 1))
+        pages = pool.map_ordered(fetch_page,
+            [page * limit for page in range(1, num_pages)])
+        try:
+            for res in results:
+                yield res
+            for results in pages:
+                for res in results:
+                    yield res
+        finally:
+            pages.close()
+            pool.shutdown(wait=False)
+
+    def package_bulk_get(self, batch_size=1000, workers=4):
+        '''Returns a generator of the full dict of every package.
+
+        Pages through package_search with all_fields, batch_size packages at
+        a time, if the server returns full package dicts from the search.
+        Otherwise gets each package in the register on `workers` threads.
+        Either way only a few batches are held in memory at once.'''
+        probe = self.package_search(None, {'all_fields': 1, 'limit': 1},
+                                    prefetch_workers=0)
+        first = list(itertools.islice(probe['results'], 1))
+        if first and isinstance(first[0], dict) and 'resources' in first[0]:
+            search = self.package_search(None, {'all_fields': 1,
+                                                'limit': batch_size},
+                                         prefetch_workers=workers)
+            return search['results']
+        return self._package_entity_generator(self.package_register_get(),
+                                              workers)
+
+    def _package_entity_generator(self, package_names, workers):
+        def fetch_package(package_name):
+            try:
+                return self.package_entity_get(package_name)
+            except CkanApiNotFoundError:
+                # Deleted since the register was read.
+                return None
+        pool = WorkerPool(workers)
+        packages = pool.map_ordered(fetch_package, package_names)
+        try:
+            for package in packages:
+                if package is not None:
+                    yield package
+        finally:
+            packages.close()
+            pool.shutdown(wait=False)
+
+    #
+    # Form API
+    #
+
+    def package_create_form_get(self):
+        self.reset()
+        url = self.get_location('Package Create Form')
+        self.open_url(url)
+        return self.last_message
+
+    def package_create_form_post(self, form_submission):
+        self.reset()
+        url = self.get_location('Package Create Form')
+        data = self._dumpstr(form_submission)
+        headers = self._auth_headers()
+        self.open_url(url, data, headers)
+        return self.last_message
+
+    def package_edit_form_get(self, package_ref):
+        self.reset()
+        url = self.get_location('Package Edit Form', package_ref)
+        self.open_url(url)
+        return self.last_message
+
+    def package_edit_form_post(self, package_ref, form_submission):
+        self.reset()
+        url = self.get_location('Package Edit Form', package_ref)
+        data = self._dumpstr(form_submission)
+        headers = self._auth_headers()
+        self.open_url(url, data, headers)
+        return self.last_message
+
+    #
+    # Changeset API
+    #
+    
+    def changeset_register_get(self):
+        self.reset()
+        url = self.get_location('Changeset Register')
+        self.open_url(url)
+        return self.last_message
+
+    def changeset_entity_get(self, changeset_name):
+        self.reset()
+        url = self.get_location('Changeset Entity', changeset_name)
+        self.open_url(url)
+        return self.last_message
+
+    #
+    # Revision API
+    #
+
+    def revision_entity_get(self, revision_id):
+        self.reset()
+        url = self.get_location('Revision Entity', revision_id)
+        self.open_url(url)
+        return self.last_message
+
+    def revision_search(self, since_time=None, since_id=None):
+        '''Returns the ids of the revisions made after since_time (an ISO
+        8601 UTC timestamp) or after the revision since_id.'''
+        self.reset()
+        url = self.get_location('Revision Search')
+        params = {}
+        if since_time is not None:
+            params['since_time'] = since_time
+        if since_id is not None:
+            params['since_id'] = since_id
+        if params:
+            url += '?' + urlencode(params)
+        self.open_url(url)
+        return self.last_message
+
+    #
+    # data API
+    #
+    def _storage_metadata_url(self, path):
+        url = self.base_location
+        if not url.endswith("/"): url += "/"
+        url += "storage/metadata"
+        if not path.startswith("/"): url += "/"
+        url += path
+        return url
+    def storage_metadata_get(self, path):
+        url = self._storage_metadata_url(path)
+        self.open_url(url)
+        return self._loadstr(self.last_message)
+    def storage_metadata_set(self, path, metadata):
+        url = self._storage_metadata_url(path)
+        payload = self._dumpstr(metadata)
+        self.open_url(url, payload, method="PUT")
+        return self._loadstr(self.last_message)
+    def storage_metadata_update(self, path, metadata):
+        url = self._storage_metadata_url(path)
+        payload = self._dumpstr(metadata)
+        self.open_url(url, payload, method="POST")
+        return self._loadstr(self.last_message)
+
+    def _storage_auth_url(self, path):
+        url = self.base_location
+        if not url.endswith("/"): url += "/"
+        url += "storage/auth"
+        if not path.startswith("/"): url += "/"
+        url += path
+        return url
+    def storage_auth_get(self, path, headers):
+        url = self._storage_auth_url(path)
+        payload = self._dumpstr(headers)
+        self.open_url(url, payload, method="POST")
+        return self._loadstr(self.last_message)
+
+    def storage_auth_form_get(self, label):
+        '''Returns the form to upload a file as label with: a dict of the
+        'action' URL to POST to and the hidden 'fields' to send.'''
+        self.reset()
+        url = self._storage_auth_url('form/' + label)
+        self.open_url(url, headers=self._auth_headers())
+        return self.last_message
+
+    def storage_file_url(self, label):
+        '''Returns the URL a stored file is downloaded from.'''
+        site = self.base_location
+        if '/api' in site:
+            site = site[:site.rindex('/api')]
+        return site.rstrip('/') + '/storage/f/' + label
+
+    def storage_file_upload(self, file_path, label, chunk_size=1048576,
+                            progress=None, skip_unchanged=True):
+        '''Uploads the file at file_path to CKAN storage as label, reading
+        it from disk chunk_size bytes at a time so that it is never held in
+        memory whole. progress(bytes_sent, file_size) is called after each
+        chunk.
+
+        CKAN storage has no resumable uploads, so a failed upload has to be
+        sent again from the start. With skip_unchanged, a file that is
+        already stored with the same size and MD5 is not sent again, so
+        rerunning a publish only sends the files that did not make it.
+
+        Returns a dict of the file's storage 'url', the 'bytes' sent,
+        the 'seconds' taken and the 'bytes_per_second', with 'skipped'
+        True if it was already stored.'''
+        result = {'url': self.storage_file_url(label), 'bytes': 0,
+                  'seconds': 0.0, 'bytes_per_second': None, 'skipped': False}
+        if skip_unchanged and self._storage_file_matches(file_path, label):
+            result['skipped'] = True
+            return result
+        form = self.storage_auth_form_get(label)
+        fields = [(field['name'], field['value'])
+                  for field in form.get('fields', [])]
+        body = _MultipartBody(fields, 'file', file_path, chunk_size, progress)
+        headers = self._auth_headers()
+        headers['Content-Type'] = body.content_type
+        headers['Content-Length'] = str(body.length)
+        if self.basic_auth:
+            headers['Authorization'] = self.basic_auth
+        request = ApiRequest(urljoin(self.base_location, form['action']),
+                             body, headers, method='POST')
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        self._print("ckanclient: Uploading %s to %s", file_path, label)
+        start = time.time()
+        try:
+            try:
+                response = self.transport.open(request)
+                response.read()
+            except HTTPError, inst:
+                if inst.code == 403:
+                    raise CkanApiNotAuthorizedError(inst.code)
+                raise CkanApiError('Upload of %s failed: %s %s' % (
+                    label, inst.code, inst.read()))
+            except URLError, inst:
+                raise CkanApiError('Upload of %s failed: %s' % (
+                    label, inst.reason))
+        finally:
+            body.close()
+        result['seconds'] = time.time() - start
+        result['bytes'] = body.file_size
+        if result['seconds']:
+            result['bytes_per_second'] = body.file_size / result['seconds']
+        return result
+
+    def _storage_file_matches(self, file_path, label):
+        '''Returns whether the file stored as label has the size and MD5
+        of the file at file_path.'''
+        self.reset()
+        try:
+            self.open_url(self._storage_metadata_url(label))
+        except CkanApiError:
+            return False
+        metadata = self.last_message
+        if isinstance(metadata, basestring):
+            metadata = self._loadstr(metadata)
+        if not isinstance(metadata, dict) or \
+                str(metadata.get('_content_length')) != \
+                str(os.path.getsize(file_path)):
+            return False
+        md5 = hashlib.md5()
+        local_file = open(file_path, 'rb')
+        try:
+            for chunk in iter(lambda: local_file.read(1048576), ''):
+                md5.update(chunk)
+        finally:
+            local_file.close()
+        return metadata.get('_checksum') == 'md5:' + md5.hexdigest()
+    
+    #
+    # Utils
+    #
+    def is_id(self, id_string):
+        '''Tells the client if the string looks like an id or not'''
+        return bool(re.match('^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$', id_string))
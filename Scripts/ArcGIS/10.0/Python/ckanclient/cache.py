@@ -0,0 +1,288 @@
+'''On-disk cache of GET responses for conditional requests, and in-memory
+cache of lookups.
+
+A client given a ResponseCache sends If-None-Match / If-Modified-Since for
+URLs it has seen before, and a 304 Not Modified reply is answered from the
+cached body:
+
+    cache = ResponseCache('/var/cache/ckanclient', max_bytes=50 * 1024 * 1024)
+    ckan = CkanClient(api_key=my_key, response_cache=cache)
+
+A client given a LookupCache answers group_entity_get from memory, without
+a request, for `ttl` seconds:
+
+    lookups = LookupCache(ttl=300)
+    ckan = CkanClient(api_key=my_key, lookup_cache=lookups)
+'''
+import os
+import copy
+import time
+import hashlib
+import threading
+
+try: # since python 2.6
+    import json
+except ImportError:
+    import simplejson as json
+
+try: # since python 2.7
+    from collections import OrderedDict
+except ImportError:
+    from ordereddict import OrderedDict
+
+
+class ResponseCache(object):
+    '''Stores response bodies with their ETag and Last-Modified validators.
+
+    Entries are evicted least recently used first once the cached bodies
+    exceed `max_bytes`. Safe to share between threads.
+
+    :param directory: created if it does not exist
+    :param max_bytes: default *64MB*
+    '''
+
+    def __init__(self, directory, max_bytes=64 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self._lock = threading.Lock()
+        self._sizes = OrderedDict()
+        self._bytes = 0
+        self._stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+        self._load_index()
+
+    def validators(self, key):
+        '''Returns the conditional request headers for a cached entry.'''
+        meta = self._read_meta(self._digest(key))
+        headers = {}
+        if meta is None:
+            return headers
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+        return headers
+
+    def hit(self, key):
+        '''Returns (body, content_type) for a 304 reply, or None if the entry
+        has been evicted in the meantime.'''
+        digest = self._digest(key)
+        meta = self._read_meta(digest)
+        try:
+            body = self._read(digest, 'body')
+        except IOError:
+            return None
+        if meta is None:
+            return None
+        self._lock.acquire()
+        try:
+            self._stats['hits'] += 1
+            if digest in self._sizes:
+                self._sizes[digest] = self._sizes.pop(digest)
+        finally:
+            self._lock.release()
+        try:
+            os.utime(self._path(digest, 'meta'), None)
+        except OSError:
+            pass
+        return body, meta.get('content_type')
+
+    def store(self, key, body, headers):
+        '''Caches a full response body if it carries any validators.'''
+        self._lock.acquire()
+        try:
+            self._stats['misses'] += 1
+        finally:
+            self._lock.release()
+        etag = headers.get('etag')
+        last_modified = headers.get('last-modified')
+        if not etag and not last_modified or len(body) > self.max_bytes:
+            return
+        digest = self._digest(key)
+        meta = {'key': key, 'etag': etag, 'last_modified': last_modified,
+                'content_type': headers.get('content-type')}
+        self._write(digest, 'body', body)
+        self._write(digest, 'meta', json.dumps(meta))
+        self._lock.acquire()
+        try:
+            self._stats['stores'] += 1
+            self._bytes += len(body) - self._sizes.pop(digest, 0)
+            self._sizes[digest] = len(body)
+            evicted = self._evict()
+        finally:
+            self._lock.release()
+        for digest in evicted:
+            self._remove(digest)
+
+    def stats(self):
+        '''Returns a copy of the counters, with the hit rate of conditional
+        reads and the number of bytes cached.'''
+        self._lock.acquire()
+        try:
+            stats = dict(self._stats, bytes=self._bytes)
+        finally:
+            self._lock.release()
+        reads = stats['hits'] + stats['misses']
+        stats['hit_rate'] = float(stats['hits']) / reads if reads else 0.0
+        return stats
+
+    def clear(self):
+        self._lock.acquire()
+        try:
+            digests = list(self._sizes.keys())
+            self._sizes.clear()
+            self._bytes = 0
+        finally:
+            self._lock.release()
+        for digest in digests:
+            self._remove(digest)
+
+    def _evict(self):
+        evicted = []
+        while self._bytes > self.max_bytes and self._sizes:
+            digest, size = self._sizes.popitem(last=False)
+            self._bytes -= size
+            self._stats['evictions'] += 1
+            evicted.append(digest)
+        return evicted
+
+    def _load_index(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.meta'):
+                continue
+            digest = name[:-len('.meta')]
+            try:
+                mtime = os.path.getmtime(self._path(digest, 'meta'))
+                size = os.path.getsize(self._path(digest, 'body'))
+            except OSError:
+                continue
+            entries.append((mtime, digest, size))
+        for mtime, digest, size in sorted(entries):
+            self._sizes[digest] = size
+            self._bytes += size
+        for digest in self._evict():
+            self._remove(digest)
+
+    def _read_meta(self, digest):
+        try:
+            return json.loads(self._read(digest, 'meta'))
+        except (IOError, ValueError):
+            return None
+
+    def _read(self, digest, suffix):
+        entry_file = open(self._path(digest, suffix), 'rb')
+        try:
+            return entry_file.read()
+        finally:
+            entry_file.close()
+
+    def _write(self, digest, suffix, data):
+        entry_file = open(self._path(digest, suffix), 'wb')
+        try:
+            entry_file.write(data)
+        finally:
+            entry_file.close()
+
+    def _remove(self, digest):
+        for suffix in ('meta', 'body'):
+            try:
+                os.remove(self._path(digest, suffix))
+            except OSError:
+                pass
+
+    def _digest(self, key):
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def _path(self, digest, suffix):
+        return os.path.join(self.directory, '%s.%s' % (digest, suffix))
+
+
+class LookupCache(object):
+    '''Entities that seldom change, such as groups, by kind and name, held
+    in memory for `ttl` seconds. Callers get their own copy of an entity.
+
+    Concurrent lookups of an entity that is not cached wait for the first
+    one to finish, rather than each asking the server. Failed lookups are
+    not cached. Safe to share between threads and clients of the same site.
+
+    :param ttl: seconds, default *300*
+    '''
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._cond = threading.Condition()
+        self._entries = {}
+        self._loading = set()
+        # Bumped by invalidate(), so lookups under way are not cached.
+        self._generation = 0
+        self._stats = {'hits': 0, 'misses': 0, 'expired': 0,
+                       'invalidations': 0}
+
+    def get(self, kind, name, lookup):
+        '''Returns the cached entity, or else the one lookup() returns,
+        caching it.'''
+        key = (kind, name)
+        self._cond.acquire()
+        try:
+            while True:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    expires, entity = entry
+                    if expires > time.time():
+                        self._stats['hits'] += 1
+                        return copy.deepcopy(entity)
+                    del self._entries[key]
+                    self._stats['expired'] += 1
+                if key not in self._loading:
+                    break
+                self._cond.wait()
+            self._loading.add(key)
+            self._stats['misses'] += 1
+            generation = self._generation
+        finally:
+            self._cond.release()
+        loaded = False
+        try:
+            entity = lookup()
+            loaded = True
+        finally:
+            self._cond.acquire()
+            try:
+                self._loading.discard(key)
+                if loaded and generation == self._generation:
+                    self._entries[key] = (time.time() + self.ttl,
+                                          copy.deepcopy(entity))
+                self._cond.notify_all()
+            finally:
+                self._cond.release()
+        return entity
+
+    def invalidate(self, kind=None, name=None):
+        '''Forgets the entity of that kind and name, all those of the kind
+        if no name is given, or else everything.'''
+        self._cond.acquire()
+        try:
+            self._generation += 1
+            for key in list(self._entries):
+                if kind is not None and key[0] != kind:
+                    continue
+                if name is not None and key[1] != name:
+                    continue
+                del self._entries[key]
+                self._stats['invalidations'] += 1
+        finally:
+            self._cond.release()
+
+    def stats(self):
+        '''Returns a copy of the counters, with the hit rate and the number
+        of entities cached.'''
+        self._cond.acquire()
+        try:
+            stats = dict(self._stats, entries=len(self._entries))
+        finally:
+            self._cond.release()
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = float(stats['hits']) / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,105 @@
+'''Peak memory of package_search, reading whole pages against streaming.
+
+Writes a synthetic search response of full package dicts to a file, then
+in a fresh interpreter per mode runs package_search over it with a
+transport that serves the file, and reports the peak RSS above that of an
+interpreter that makes no search.
+
+    python -m ckanclient.tests.bench_stream_search [packages]
+'''
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from urllib import addinfourl
+
+from ckanclient import CkanClient
+
+try: # since python 2.6
+    import json
+except ImportError:
+    import simplejson as json
+
+
+class FileTransport(object):
+    '''Answers every request with the contents of a file.'''
+
+    def __init__(self, path):
+        self.path = path
+
+    def open(self, request):
+        return addinfourl(open(self.path, 'rb'),
+                          {'Content-Type': 'application/json'},
+                          request.get_full_url(), 200)
+
+
+def write_response(path, packages):
+    out = open(path, 'wb')
+    out.write('{"count": %d, "results": [' % packages)
+    for i in range(packages):
+        if i:
+            out.write(', ')
+        out.write(json.dumps({
+            'id': '%032x' % i,
+            'name': 'package%05d' % i,
+            'title': 'Synthetic package %d' % i,
+            'notes': 'Lorem ipsum dolor sit amet. ' * 40,
+            'tags': ['tag%d' % t for t in range(10)],
+            'groups': ['drcog'],
+            'extras': dict(('extra%d' % e, 'value %d' % e) for e in range(10)),
+            'resources': [{'url': 'http://example.com/%d/%d.zip' % (i, r),
+                           'format': 'SHP',
+                           'description': 'Resource %d' % r}
+                          for r in range(5)],
+            }))
+    out.write(']}')
+    out.close()
+
+
+def child(mode, path, packages):
+    '''Runs one search and prints the peak RSS in KB and seconds taken.'''
+    start = time.time()
+    if mode != 'baseline':
+        client = CkanClient(base_location='http://ckan.invalid/api',
+                            transport=FileTransport(path))
+        res = client.package_search(None, {'all_fields': 1,
+                                           'limit': packages},
+                                    stream=(mode == 'stream'))
+        for package in res['results']:
+            pass
+    print resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, \
+        time.time() - start
+
+
+def measure(mode, path, packages):
+    output = subprocess.check_output([sys.executable, '-m',
+        'ckanclient.tests.bench_stream_search', '--child', mode, path,
+        str(packages)])
+    peak, elapsed = output.split()
+    return int(peak), float(elapsed)
+
+
+def main():
+    if sys.argv[1:2] == ['--child']:
+        child(sys.argv[2], sys.argv[3], int(sys.argv[4]))
+        return
+    packages = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    fd, path = tempfile.mkstemp(suffix='.json')
+    os.close(fd)
+    try:
+        write_response(path, packages)
+        print 'package_search of %d packages, %.1f MB response' % (
+            packages, os.path.getsize(path) / 1048576.0)
+        baseline = measure('baseline', path, packages)[0]
+        for mode in ('whole', 'stream'):
+            peak, elapsed = measure(mode, path, packages)
+            print '%-8s peak RSS +%7.1f MB  %6.2f s' % (
+                mode, (peak - baseline) / 1024.0, elapsed)
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+import copy
+
+from nose.tools import assert_equal
+
+from ckanclient import CkanClient
+from ckanclient.tests.fake_ckan import FakeCkanServer
+
+
+REMOTE = {
+    'name': 'drcog-parcels',
+    'title': 'DRCOG: Parcels',
+    'notes': None,
+    'tags': ['parcels', 'gis'],
+    'groups': ['id-drcog'],
+    'extras': {'source': 'drcog'},
+    'resources': [
+        {'id': 'r1', 'format': 'SHP', 'url': 'http://x/parcels.zip',
+         'size': '1024'},
+        {'id': 'r2', 'format': 'KML', 'url': 'http://x/parcels.kmz'},
+    ],
+}
+
+
+class TestPackageEntityDiff(object):
+
+    def setup(self):
+        self.c = CkanClient(base_location='http://ckan.invalid/api')
+        self.desired = copy.deepcopy(REMOTE)
+
+    def test_01_unchanged(self):
+        self.desired['tags'].reverse()
+        self.desired['notes'] = ''
+        self.desired['resources'][0]['size'] = 1024
+        self.desired['resources'].reverse()
+        assert_equal(self.c.package_entity_diff(REMOTE, self.desired), {})
+
+    def test_02_field_changed(self):
+        self.desired['title'] = 'DRCOG: Land Parcels'
+        assert_equal(self.c.package_entity_diff(REMOTE, self.desired),
+                     {'title': ('DRCOG: Parcels', 'DRCOG: Land Parcels')})
+
+    def test_03_tags_changed(self):
+        self.desired['tags'].append('land')
+        assert_equal(self.c.package_entity_diff(REMOTE, self.desired).keys(),
+                     ['tags'])
+
+    def test_04_resources_matched_by_format(self):
+        for resource in self.desired['resources']:
+            del resource['id']
+        assert_equal(self.c.package_entity_diff(REMOTE, self.desired), {})
+        self.desired['resources'][0]['size'] = 2048
+        assert_equal(self.c.package_entity_diff(REMOTE, self.desired).keys(),
+                     ['resources'])
+
+    def test_05_resource_added(self):
+        self.desired['resources'].append({'format': 'PDF', 'url': 'http://x'})
+        assert_equal(self.c.package_entity_diff(REMOTE, self.desired).keys(),
+                     ['resources'])
+
+
+class TestPackageEntityPutIfChanged(object):
+
+    @classmethod
+    def setup_class(self):
+        self.server = FakeCkanServer()
+        self.server.add_package('annakarenina', title='A Novel By Tolstoy')
+        self.server.start()
+
+    @classmethod
+    def teardown_class(self):
+        self.server.stop()
+
+    def test_01_put_skipped(self):
+        c = CkanClient(base_location=self.server.base_location)
+        remote = c.package_entity_get('annakarenina')
+        package = copy.deepcopy(remote)
+        package['tags'] = []
+        assert_equal(c.package_entity_put_if_changed(remote, package), {})
+        assert_equal(c.writes_avoided, 1)
+        package['title'] = 'Anna Karenina'
+        assert c.package_entity_put_if_changed(remote, package)
+        assert_equal(c.writes_avoided, 1)
+        puts = [r for r in self.server.requests if r[0] == 'PUT']
+        assert_equal(len(puts), 1)
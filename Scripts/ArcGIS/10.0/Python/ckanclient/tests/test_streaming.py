@@ -0,0 +1,32 @@
+from StringIO import StringIO
+
+from nose.tools import assert_equal, assert_raises
+
+from ckanclient.streaming import JsonArrayStream
+
+
+def _stream(body, chunk_size=3):
+    return JsonArrayStream(StringIO(body), 'results', chunk_size=chunk_size)
+
+
+class TestJsonArrayStream(object):
+
+    def test_01_items_across_chunks(self):
+        body = '{"count": 3, "results": [{"name": "a\\u00e9"}, 12345, "x y"]}'
+        stream = _stream(body).start()
+        assert_equal(stream.members, {'count': 3})
+        assert_equal(list(stream), [{'name': u'a\xe9'}, 12345, u'x y'])
+
+    def test_02_members_after_array(self):
+        stream = _stream(' { "results" : [ 1 , 2 ] , "count" : 2 } ')
+        assert_equal(list(stream), [1, 2])
+        assert_equal(stream.members, {'count': 2})
+
+    def test_03_empty(self):
+        assert_equal(list(_stream('{"results": []}')), [])
+        assert_equal(list(_stream('{}')), [])
+
+    def test_04_truncated(self):
+        stream = _stream('{"results": [1, {"name": ')
+        assert_equal(next(stream), 1)
+        assert_raises(ValueError, next, stream)
@@ -0,0 +1,63 @@
+import time
+
+from nose.tools import assert_raises, assert_equal
+
+from ckanclient import CkanClient, CkanApiError, RateLimiter
+from ckanclient.tests.fake_ckan import FakeCkanServer
+
+
+class TestRateLimiter(object):
+
+    def test_01_burst_then_rate(self):
+        limiter = RateLimiter(rate=20, burst=5)
+        start = time.time()
+        for i in range(10):
+            limiter.acquire()
+        elapsed = time.time() - start
+        # 5 straight away, then 5 more at 20 per second
+        assert 0.2 <= elapsed < 0.5, elapsed
+        stats = limiter.stats()
+        assert_equal(stats['requests'], 10)
+        assert stats['throttled_seconds'] > 0.2, stats
+        assert_equal(stats['backoffs'], 0)
+
+    def test_02_pause(self):
+        limiter = RateLimiter()
+        limiter.pause(0.2)
+        start = time.time()
+        limiter.acquire()
+        assert time.time() - start >= 0.19
+        assert limiter.stats()['backoff_seconds'] > 0.19
+
+
+class TestRetryOnBusyServer(object):
+
+    @classmethod
+    def setup_class(self):
+        self.server = FakeCkanServer()
+        self.server.add_package('annakarenina')
+        self.server.start()
+
+    @classmethod
+    def teardown_class(self):
+        self.server.stop()
+
+    def test_01_retry_after_honoured(self):
+        limiter = RateLimiter()
+        c = CkanClient(base_location=self.server.base_location,
+                       rate_limiter=limiter, max_retries=2)
+        self.server.inject_error(429, headers={'Retry-After': '1'})
+        start = time.time()
+        assert_equal(c.package_entity_get('annakarenina')['name'],
+                     'annakarenina')
+        assert time.time() - start >= 0.9
+        assert_equal(limiter.stats()['backoffs'], 1)
+
+    def test_02_gives_up(self):
+        c = CkanClient(base_location=self.server.base_location,
+                       max_retries=2)
+        c.backoff_base = 0.01
+        self.server.inject_error(503, count=3)
+        assert_raises(CkanApiError, c.package_entity_get, 'annakarenina')
+        assert_equal(c.last_status, 503)
+        assert_equal(self.server.errors, [])
@@ -0,0 +1,165 @@
+'''Thread pool helpers for running CKAN requests concurrently.
+
+    pool = WorkerPool(4)
+    for package in pool.map_ordered(ckan.package_entity_get, names):
+        print package['name']
+    pool.shutdown()
+'''
+import sys
+import threading
+from collections import deque
+from itertools import islice
+
+try:
+    from Queue import Queue
+except ImportError:
+    # Forward compatibility with Py3k
+    from queue import Queue
+
+
+class Future(object):
+    '''The pending result of a call submitted to a WorkerPool.'''
+
+    def __init__(self):
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._result = None
+        self._exc_info = None
+        self._cancelled = False
+        self._callbacks = []
+
+    def cancel(self):
+        '''Stops the call from running if it has not started yet.'''
+        self._lock.acquire()
+        try:
+            if not self._done.is_set():
+                self._cancelled = True
+            return self._cancelled
+        finally:
+            self._lock.release()
+
+    def cancelled(self):
+        return self._cancelled
+
+    def done(self):
+        return self._done.is_set()
+
+    def result(self):
+        '''Waits for the call and returns its result, re-raising any
+        exception it raised.'''
+        # Wait in slices so that KeyboardInterrupt still gets through.
+        while not self._done.wait(0.5):
+            pass
+        if self._exc_info is not None:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._result
+
+    def exception(self):
+        while not self._done.wait(0.5):
+            pass
+        if self._exc_info is not None:
+            return self._exc_info[1]
+
+    def add_done_callback(self, callback):
+        '''Calls callback(future) once the call finishes (or straight away
+        if it already has).'''
+        self._lock.acquire()
+        try:
+            if not self._done.is_set():
+                self._callbacks.append(callback)
+                return
+        finally:
+            self._lock.release()
+        callback(self)
+
+    def set_result(self, result):
+        self._result = result
+        self._finish()
+
+    def set_exception(self, exc_info):
+        self._exc_info = exc_info
+        self._finish()
+
+    def _finish(self):
+        self._lock.acquire()
+        try:
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        finally:
+            self._lock.release()
+        for callback in callbacks:
+            callback(self)
+
+
+class WorkerPool(object):
+    '''A fixed number of daemon threads running submitted calls.
+
+    :param workers: number of threads
+    :param queue_size: maximum number of calls waiting for a thread, default
+        *0* (unbounded). With a bound, submit() blocks while the queue is full.
+    '''
+
+    def __init__(self, workers, queue_size=0):
+        self.workers = workers
+        self._queue = Queue(queue_size)
+        self._threads = []
+        for i in range(workers):
+            thread = threading.Thread(target=self._work)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+
+    def submit(self, func, *args, **kwargs):
+        future = Future()
+        self._queue.put((future, func, args, kwargs))
+        return future
+
+    def map_ordered(self, func, iterable, window=None):
+        '''Calls func on each item on the pool and yields the results in
+        input order. At most `window` calls (default twice the number of
+        workers) are pending or held at any time.'''
+        window = window or 2 * self.workers
+        items = iter(iterable)
+        pending = deque()
+        for item in islice(items, window):
+            pending.append(self.submit(func, item))
+        def results():
+            try:
+                while pending:
+                    result = pending.popleft().result()
+                    for item in islice(items, 1):
+                        pending.append(self.submit(func, item))
+                    yield result
+            finally:
+                for future in pending:
+                    future.cancel()
+        return results()
+
+    def shutdown(self, wait=True):
+        '''Stops the threads once the calls already submitted have run.'''
+        for thread in self._threads:
+            self._queue.put(None)
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            future, func, args, kwargs = item
+            if future.cancelled():
+                continue
+            try:
+                result = func(*args, **kwargs)
+            except:
+                future.set_exception(sys.exc_info())
+            else:
+                future.set_result(result)
@@ -7,58 +7,221 @@
 # Imports
 import os
 import sys
-import urllib2
+import argparse
 import ckanclient
-import logging
+import ckanclient.batch
+import ckanclient.cache
+import ckanclient.hooks
+import ckanclient.mirror
 import time
-from bs4 import BeautifulSoup
+import urllib
+import urlparse
+import checkpoint
+import crawler
+import extraction
+import fetch
+import pipeline
+import reconcile
+import syncstate
 
 # Global variables
 base_url = "http://gis.drcog.org"
 data_catalog_prefix = "/datacatalog"
 subjects_url_prefix = "/datacatalog/subjects/"
 dataset_url_prefix = "/datacatalog/content/"
-ckan_client = None
+ckan_cache_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache")
+ckan_rate = 5
+ckan_max_retries = 3
 
 ckan_host = "http://data.opencolorado.org/api/2"
-ckan_key = sys.argv[1]
+ckan_key = None
 ckan_group = "drcog"
 ckan_title_prefix = "DRCOG: "
 ckan_name_prefix = "drcog-"
 ckan_license = "cc-by"
+ckan_workers = 4
+drcog_workers = 8
+drcog_host_connections = 4
+# The elements read from each kind of DRCOG page, so that only those are parsed
+subjects_page_spec = extraction.ExtractionSpec(
+    ("a", {"href": lambda href: href.startswith(subjects_url_prefix)}))
+dataset_list_page_spec = extraction.ExtractionSpec(
+    ("div", {"class": "node"}),
+    ("li", {"class": "pager-next"}),
+    ("li", {"class": "pager-last"}))
+dataset_page_spec = extraction.ExtractionSpec(
+    ("h1", {"id": "page-title"}),
+    ("div", {"class": "terms"}),
+    ("div", {"class": "field-item"}),
+    ("div", {"class": "filefield-file"}))
+sync_full = False
+
+# Set up by configure()
+ckan_client = None
+ckan_transport = None
+ckan_cache = None
+ckan_lookup_cache = None
+ckan_rate_limiter = None
+ckan_circuit_breaker = None
+ckan_latency = None
+ckan_latency_file = None
+ckan_mirror = None
+drcog_fetcher = None
+drcog_fetch_file = None
+sync_state = None
+drcog_journal = None
+
+def configure(cache_folder=None):
+    """Sets up the connections, caches and counters of a run, loading what
+    previous runs kept in the cache folder
+    
+    Parameters:
+        cache_folder - The folder of the caches and state kept between runs,
+            by default ckan_cache_folder
+    """
+    global ckan_cache_folder, ckan_rate, drcog_host_connections
+    global ckan_client, ckan_transport, ckan_cache, ckan_lookup_cache, ckan_rate_limiter, ckan_circuit_breaker
+    global ckan_latency, ckan_latency_file, ckan_mirror, drcog_fetcher, drcog_fetch_file, sync_state, drcog_journal
+    
+    cache_folder = cache_folder or ckan_cache_folder
+    ckan_client = None
+    ckan_transport = ckanclient.KeepAliveTransport()
+    ckan_cache = ckanclient.cache.ResponseCache(cache_folder)
+    # The DRCOG group is looked up once for all the datasets created
+    ckan_lookup_cache = ckanclient.cache.LookupCache(ttl=300)
+    ckan_rate_limiter = ckanclient.RateLimiter(rate=ckan_rate, burst=5)
+    ckan_circuit_breaker = ckanclient.CircuitBreaker(threshold=5, cooldown=60)
+    ckan_latency = ckanclient.hooks.LatencyCollector()
+    ckan_latency_file = os.path.join(cache_folder, "ckan_latency.json")
+    ckan_mirror = ckanclient.mirror.CatalogMirror(os.path.join(cache_folder, "catalog.json"))
+    drcog_fetcher = fetch.PageFetcher(connections=drcog_host_connections)
+    drcog_fetch_file = os.path.join(cache_folder, "drcog_fetch.json")
+    sync_state = syncstate.SyncState(os.path.join(cache_folder, "drcog_sync_state.json"))
+    # The work finished by an interrupted run, so that the next run resumes from it
+    drcog_journal = checkpoint.CheckpointJournal(os.path.join(cache_folder, "drcog_journal.jsonl"))
 
 def main():
     
+    global ckan_key, sync_full
+    
+    parser = argparse.ArgumentParser(description='Synchronize datasets from the DRCOG Regional Data Catalog to OpenColorado')
+    parser.add_argument('ckan_key',
+        help='The API key of the CKAN user publishing the datasets')
+    parser.add_argument('--full',
+        action='store_true',
+        dest='full',
+        help='Scrape and publish every dataset, even those unchanged since the last run')
+    parser.add_argument('--restart',
+        action='store_true',
+        dest='restart',
+        help='Start from the beginning, rather than resuming an interrupted run')
+    args = parser.parse_args()
+    ckan_key = args.ckan_key
+    sync_full = args.full
+    
     localtime = time.asctime( time.localtime(time.time())) 
     print "-----------------------------------------------------"
     print str(localtime) + " - starting synchronization"
     print "-----------------------------------------------------"
     
+    configure()
+    
+    # Pick up where an interrupted run left off
+    if args.restart:
+        drcog_journal.complete()
+    elif len(drcog_journal):
+        print "Resuming interrupted run: " + str(drcog_journal.counts())
+    
+    steps = synchronize()
+    
+    print "Steps:"
+    for name, stats in steps:
+        print "  %s: %.2f s, %d items" % (name, stats['seconds'], stats['items'])
+
+    localtime = time.asctime( time.localtime(time.time())) 
+    print "-----------------------------------------------------"
+    print str(localtime) + " - Synchronization complete"
+    print "-----------------------------------------------------"
+
+def synchronize():
+    """Synchronizes the DRCOG datasets to OpenColorado
+    
+    Returns:
+        List of the name of each step and a dict of its counters, with the
+        'seconds' it took and the 'items' it handled
+    """
+    global ckan_name_prefix, drcog_workers, sync_state, drcog_journal
+    
+    steps = []
+    sync_start = time.time()
+    
     # Get the current list of CKAN datasets on OpenColorado
+    start = time.time()
     ckan_datasets = get_ckan_datasets()
+    steps.append(("CKAN catalog", {"seconds": time.time() - start, "items": len(ckan_datasets)}))
     
     # Get the current list of datasets on DRCOG
+    start = time.time()
     drcog_datasets = get_drcog_datasets()
+    steps.append(("DRCOG crawl", {"seconds": time.time() - start, "items": len(drcog_datasets)}))
+
+    # Match the DRCOG datasets to those on OpenColorado
+    plan = reconcile.reconcile(drcog_datasets, ckan_datasets,
+        source_key=lambda drcog_dataset: ckan_name_prefix + drcog_dataset,
+        target_key=lambda ckan_dataset: ckan_dataset["name"])
+    print "DRCOG datasets: %d new, %d on OpenColorado, %d removed" % (
+        len(plan.create), len(plan.update), len(plan.delete))
 
     # Remove datasets from CKAN that are no longer provided by DRCOG
-    delete_removed_datasets(drcog_datasets, ckan_datasets)
-    
-    # Begin syncing each dataset to CKAN
+    start = time.time()
+    delete_removed_datasets(plan.delete)
+    steps.append(("CKAN delete", {"seconds": time.time() - start, "items": len(plan.delete)}))
+    
+    # Begin syncing the planned creates and updates to CKAN, new datasets
+    # first, scraping the DRCOG dataset pages on one set of threads while the
+    # datasets already scraped are written to CKAN on another. Datasets
+    # unchanged since they were last published are dropped after scraping.
     print "Syncing DRCOG datasets to OpenColorado"
-    for drcog_dataset in drcog_datasets:
-        print "------------------------------------------------------------------"
-        print "Dataset: " + drcog_dataset
-        drcog_dataset_entity = get_dataset_entity(drcog_dataset)
-        publish_to_ckan(drcog_dataset_entity)
-        
-        #break #Just do the first dataset for now
+    sync_state.prune(drcog_datasets)
+    datasets_to_sync = [(drcog_dataset, False) for drcog_dataset in plan.create] + \
+        [(drcog_dataset, True) for drcog_dataset, ckan_dataset in plan.update]
+    scraper = pipeline.Stage("DRCOG scrape", lambda work: scrape_dataset(*work), workers=drcog_workers)
+    publisher = get_publisher([ckan_dataset["name"] for drcog_dataset, ckan_dataset in plan.update])
+    changed_datasets = (dataset for dataset in scraper.run(datasets_to_sync) if dataset is not None)
+    try:
+        for result in publisher.run(changed_datasets):
+            print_publish_result(result)
+    finally:
+        sync_state.save()
+    
+    # The run is complete, the next one starts afresh
+    drcog_journal.complete()
+    steps.append((scraper.name, scraper.stats()))
+    steps.append((publisher.name, publisher.stats()))
+    steps.append(("Total", {"seconds": time.time() - sync_start, "items": len(drcog_datasets)}))
 
-    localtime = time.asctime( time.localtime(time.time())) 
-    print "-----------------------------------------------------"
-    print str(localtime) + " - Synchronization complete"
-    print "-----------------------------------------------------"
-    
-def retry(ExceptionToCheck, tries=3, delay=3, backoff=2, logger=None):
+    print "DRCOG datasets unchanged since last published: " + str(scraper.stats()['items'] - publisher.stats()['items'])
+    print "CKAN datasets published: " + str(publisher.writer.counts())
+    for stage in (scraper, publisher):
+        print stage.name + " stage: " + str(stage.stats())
+    print "CKAN connection pool: " + str(ckan_transport.stats())
+    print "CKAN response cache: " + str(ckan_cache.stats())
+    print "CKAN lookup cache: " + str(ckan_lookup_cache.stats())
+    print "CKAN rate limiter: " + str(ckan_rate_limiter.stats())
+    print "CKAN circuit breaker: " + str(ckan_circuit_breaker.stats())
+    for endpoint, stats in sorted(ckan_latency.stats().items()):
+        print "CKAN %s: %d requests, %.3f s mean, %.3f s max" % (endpoint,
+            stats['requests'], stats['mean_seconds'], stats['max_seconds'])
+    ckan_latency.dump(ckan_latency_file)
+    print "CKAN latency histograms written to " + ckan_latency_file
+    print "DRCOG fetches: " + str(drcog_fetcher.stats())
+    drcog_fetcher.dump(drcog_fetch_file)
+    print "DRCOG fetch counters per URL written to " + drcog_fetch_file
+    
+    return steps
+    
+def retry(ExceptionToCheck, tries=3, delay=3, backoff=2, logger=None,
+          fail_fast=(ckanclient.CkanApiCircuitOpenError,)):
     """Retry calling the decorated function using an exponential backoff.
 
     http://www.saltycrane.com/blog/2009/11/trying-out-retry-decorator-python/
@@ -76,6 +239,9 @@ def retry(ExceptionToCheck, tries=3, delay=3, backoff=2, logger=None):
     :type backoff: int
     :param logger: logger to use. If None, print
     :type logger: logging.Logger instance
+    :param fail_fast: exceptions raised at once without retrying, by
+        default the CKAN circuit breaker being open
+    :type fail_fast: tuple
     """
     def deco_retry(f):
         def f_retry(*args, **kwargs):
@@ -86,6 +252,8 @@ def retry(ExceptionToCheck, tries=3, delay=3, backoff=2, logger=None):
                     return f(*args, **kwargs)
                     try_one_last_time = False
                     break
+                except fail_fast:
+                    raise
                 except ExceptionToCheck, e:
                     msg = "%s, Retrying in %d seconds..." % (str(e), mdelay)
                     if logger:
@@ -101,6 +269,24 @@ def retry(ExceptionToCheck, tries=3, delay=3, backoff=2, logger=None):
         return f_retry  # true decorator
     return deco_retry
 
+def get_ckan_client():
+    """Gets the CKAN client shared by this run, creating it on first use.
+    CkanClient keeps the state of each request per thread, so the one
+    client is safe to use from worker threads too.
+
+    Returns:
+        ckanclient.CkanClient
+    """
+    global ckan_client, ckan_host, ckan_key, ckan_transport, ckan_cache, ckan_rate_limiter, ckan_max_retries, ckan_circuit_breaker, ckan_latency, ckan_lookup_cache
+    
+    if ckan_client is None:
+        ckan_client = ckanclient.CkanClient(base_location=ckan_host, api_key=ckan_key,
+            transport=ckan_transport, response_cache=ckan_cache,
+            rate_limiter=ckan_rate_limiter, max_retries=ckan_max_retries,
+            circuit_breaker=ckan_circuit_breaker, hooks=[ckan_latency],
+            lookup_cache=ckan_lookup_cache)
+    return ckan_client
+
 @retry(Exception)
 def get_ckan_datasets():
     """Gets the current DCROG datasets on OpenColorado
@@ -108,16 +294,27 @@ def get_ckan_datasets():
     Returns:
         None
     """
-    global ckan_group, ckan_client, ckan_host, ckan_key
+    global ckan_group, ckan_client, ckan_host, ckan_key, ckan_mirror
     
     print "Getting DRCOG datasets from OpenColorado"
     
-    # Initialize the CKAN client  
-    ckan_client = ckanclient.CkanClient(base_location=ckan_host,api_key=ckan_key)
-                                        
-    results = ckan_client.package_search(None, search_options={'groups': ckan_group, 'all_fields': 1, 'limit': 5000})
+    # Get the shared CKAN client
+    ckan_client = get_ckan_client()
+
+    # Bring the local copy of the catalog up to date, fetching only the
+    # packages changed since the last run
+    counts = ckan_mirror.refresh(ckan_client)
+    print "Catalog mirror refreshed: " + str(counts)
+    
+    # Packages list their groups by id (or by name, under API v1)
+    group_refs = set([ckan_group])
+    try:
+        group_refs.add(ckan_client.group_entity_get(ckan_group)['id'])
+    except ckanclient.CkanApiNotFoundError:
+        pass
         
-    datasets = list(results["results"])
+    datasets = [dataset for dataset in ckan_mirror.packages()
+        if group_refs.intersection(dataset.get('groups', []))]
     
     print str(len(datasets)) + " datasets found"
     
@@ -129,73 +326,93 @@ def get_drcog_datasets():
     Returns:
         List of datasets
     """
+    global base_url, subjects_url_prefix, drcog_workers, drcog_host_connections, dataset_list_page_spec, drcog_journal
+    
+    # The crawl finished in an interrupted run
+    if drcog_journal.done("crawl", "datasets"):
+        datasets = drcog_journal.get("crawl", "datasets")
+        print str(len(datasets)) + " datasets found by the interrupted run"
+        return datasets
+    
     # Get a list of subjects from the DRCOG catalog
     datasets = []
-    subjects = get_subjects()
+    if drcog_journal.done("crawl", "subjects"):
+        subjects = drcog_journal.get("crawl", "subjects")
+    else:
+        subjects = get_subjects()
+        drcog_journal.record("crawl", "subjects", subjects)
+    subject_urls = [base_url + subjects_url_prefix + subject for subject in subjects]
     
-    # Get all datasets by subject (datasets may be in more than one subject so there could be duplicates here)
+    # Crawl the pages of all subjects at once (datasets may be in more than
+    # one subject, the crawler only returns each once). Pages read by an
+    # interrupted run are not fetched again.
     print "Getting datasets from DRCOG data catalog"
-    for subject in subjects:
+    def fetch_page(url):
+        if drcog_journal.done("page", url):
+            return None
+        return get_soup_from_url(url, dataset_list_page_spec)
+    def parse(url, soup):
+        if soup is None:
+            return drcog_journal.get("page", url)
+        datasets, pages = get_dataset_urls_from_page(url, soup)
+        drcog_journal.record("page", url, [datasets, pages])
+        return datasets, pages
+    drcog_crawler = crawler.Crawler(retry(Exception)(fetch_page),
+        workers=drcog_workers, per_host=drcog_host_connections)
+    for dataset in drcog_crawler.crawl(subject_urls, parse):
         sys.stdout.write('.')
-        datasets = datasets + get_dataset_urls_by_subject(subject)
-        #break # Just do the first subject for now
+        datasets.append(dataset)
     
     print ""
+    print "DRCOG crawl: " + str(drcog_crawler.stats())
     
-    # Remove duplicates
-    datasets = list(set(datasets))
+    datasets.sort()
+    drcog_journal.record("crawl", "datasets", datasets)
     
     print str(len(datasets)) + " datasets found"
     
     return datasets
 
-def delete_removed_datasets(drcog_datasets,ckan_datasets):
-    """Removes datasets from CKAN that are no longer published by DRCOG
+def delete_removed_datasets(ckan_datasets):
+    """Removes datasets from CKAN that are no longer published by DRCOG,
+    several at a time. The shared CKAN client's rate limiter paces the
+    deletes.
 
     Parameters:
-        drcog_datasets - The list of datasets currently provided by DRCOG
-        ckan_datasets - The list of datasets from DRCOG currently on OpenColorado
+        ckan_datasets - The list of datasets from DRCOG on OpenColorado
+            that DRCOG no longer provides
     
     Returns:
         None
     """   
-    global ckan_name_prefix
+    global ckan_workers, drcog_journal
     
-    datasets_to_remove = []
-    
-    print "Checking datasets to remove from OpenColorado"
-    for ckan_dataset in ckan_datasets:
-        ckan_dataset_name = ckan_dataset["name"]
-        found = False
-        
-        for drcog_dataset in drcog_datasets:
-            drcog_dataset_name = ckan_name_prefix + drcog_dataset
-            
-            if (drcog_dataset_name == ckan_dataset_name):
-                found = True
-                break
-        
-        if (found == False):
-            datasets_to_remove.append(ckan_dataset_name)
+    datasets_to_remove = [ckan_dataset["name"] for ckan_dataset in ckan_datasets
+        if not drcog_journal.done("deleted", ckan_dataset["name"])]
     
     print str(len(datasets_to_remove)) + " marked for deletion from OpenColorado:"
     for dataset_to_remove in datasets_to_remove:
         print "  -" + dataset_to_remove
     
     # Delete the datasets
-    for dataset_to_remove in datasets_to_remove:
-        delete_ckan_dataset(dataset_to_remove)
+    deleter = pipeline.Stage("CKAN delete", delete_ckan_dataset, workers=ckan_workers)
+    for deleted in deleter.run(datasets_to_remove):
+        pass
+    
+    if datasets_to_remove:
+        print deleter.name + " stage: " + str(deleter.stats())
         
 @retry(Exception)
 def delete_ckan_dataset(name):
     
-    global ckan_client, ckan_host, ckan_key
+    global ckan_client, ckan_host, ckan_key, drcog_journal
     
-    # Initialize the CKAN client  
-    ckan_client = ckanclient.CkanClient(base_location=ckan_host,api_key=ckan_key)
+    # Get the shared CKAN client
+    ckan_client = get_ckan_client()
             
     print "  Deleting CKAN dataset " + name                            
-    results = ckan_client.package_entity_delete(name)
+    ckan_client.package_entity_delete(name)
+    drcog_journal.record("deleted", name)
         
     
 @retry(Exception)        
@@ -205,14 +422,14 @@ def get_subjects():
     Returns:
         List[string]
     """
-    global base_url, subjects_url_prefix
+    global base_url, subjects_url_prefix, subjects_page_spec
     
     print "Getting list of subjects from DRCOG data catalog"
     
     subjects = []
     subjects_url = base_url + "/datacatalog/content/welcome-regional-data-catalog?quicktabs_tabbed_menu_homepage=1"
     
-    soup = get_soup_from_url(subjects_url)
+    soup = get_soup_from_url(subjects_url, subjects_page_spec)
 
     for link in soup.find_all('a'):
         href = link.get('href')
@@ -224,22 +441,21 @@ def get_subjects():
     
     return subjects
 
-@retry(Exception)
-def get_dataset_urls_by_subject(subject, page_url=None):
-    global base_url, subjects_url_prefix, dataset_url_prefix
+def get_dataset_urls_from_page(page_url, soup):
+    """Gets the datasets listed on a page of a subject, and the other pages
+    of the subject
     
-    datasets = []
-        
-    datasets_url = base_url + subjects_url_prefix + subject
-    
-    if page_url != None:
-        datasets_url = base_url + page_url
-        
-    #print datasets_url
+    Parameters:
+        page_url - The URL of the page
+        soup - The parsed page
     
-    soup = get_soup_from_url(datasets_url)
+    Returns:
+        List of datasets, list of page URLs
+    """
+    global base_url, dataset_url_prefix
     
-    #print(soup.prettify())
+    datasets = []
+    pages = []
     
     # Get all of the dataset links on the current page
     for div in soup.findAll("div", { "class" : "node" }):
@@ -250,24 +466,96 @@ def get_dataset_urls_by_subject(subject, page_url=None):
                 datasets.append(dataset)
                 #print("-- " + dataset)
         
-    # If there is a next link, recursively get the next page of datasets
+    # If there is a last page link, get all of the pages up to it at once
+    pager_last = soup.find("li", { "class" : "pager-last" })
+    
+    if pager_last != None and pager_last.a != None:
+        last_url = urlparse.urljoin(page_url, pager_last.a.get('href'))
+        scheme, netloc, path, query, fragment = urlparse.urlsplit(last_url)
+        params = urlparse.parse_qsl(query, keep_blank_values=True)
+        last_page = dict(params).get('page', '')
+        if last_page.isdigit():
+            for page in range(1, int(last_page) + 1):
+                page_params = [(name, str(page) if name == 'page' else value)
+                               for name, value in params]
+                pages.append(urlparse.urlunsplit((scheme, netloc, path,
+                    urllib.urlencode(page_params), fragment)))
+    
+    # Otherwise follow the next link
     pager_next = soup.find("li", { "class" : "pager-next" })
     
-    if pager_next != None:
-        next_href = pager_next.a.get('href')
-        datasets = datasets + get_dataset_urls_by_subject(subject,next_href)
+    if pager_next != None and pager_next.a != None:
+        pages.append(urlparse.urljoin(page_url, pager_next.a.get('href')))
     
-    return datasets
+    return datasets, pages
 
 @retry(Exception)
-def get_dataset_entity(dataset):
+def scrape_dataset(dataset, on_ckan=True):
+    """Scrapes a dataset from the DRCOG data catalog, unless it is on CKAN
+    and unchanged since it was last published. Its page is only fetched if
+    the server says it has changed, and the dataset is only returned if what
+    is scraped from the page differs from what was published. Datasets
+    scraped or published by an interrupted run are taken from the journal.
+
+    Parameters:
+        dataset - The DRCOG dataset name
+        on_ckan - Whether the dataset is on CKAN. If not, it is scraped and
+            returned whatever the sync state says was published.
+    
+    Returns:
+        A tuple of the dataset name, CKAN dataset entity, its hash and the
+        page validators, or None if unchanged
+    """
+    global base_url, dataset_url_prefix, sync_state, sync_full, dataset_page_spec, drcog_fetcher, drcog_journal
+
+    if drcog_journal.done("published", dataset) or drcog_journal.done("unchanged", dataset):
+        return None
+    if drcog_journal.done("scraped", dataset):
+        return tuple([dataset] + drcog_journal.get("scraped", dataset))
+
+    dataset_url = base_url + dataset_url_prefix + dataset
+    
+    # Only trust what was last published if the dataset is still there
+    skip_unchanged = on_ckan and not sync_full
+    
+    validators = {}
+    if skip_unchanged:
+        validators = sync_state.validators(dataset)
+    
+    page = drcog_fetcher.fetch(dataset_url, dataset_page_spec, validators)
+    if page is None:
+        print "  " + dataset + ": page not modified"
+        drcog_journal.record("unchanged", dataset)
+        return None
+    soup, validators = page
+    
+    dataset_entity = get_dataset_entity(dataset, soup)
+    digest = sync_state.digest(dataset_entity)
+    if skip_unchanged and not sync_state.changed(dataset, digest):
+        # Only the page changed, remember it for next time
+        sync_state.published(dataset, digest, validators)
+        print "  " + dataset + ": unchanged"
+        drcog_journal.record("unchanged", dataset)
+        return None
+    
+    drcog_journal.record("scraped", dataset, [dataset_entity, digest, validators])
+    return dataset, dataset_entity, digest, validators
+
+def get_dataset_entity(dataset, soup):
+    """Scrapes a CKAN dataset entity from a DRCOG dataset page
+
+    Parameters:
+        dataset - The DRCOG dataset name
+        soup - The parsed dataset page
+    
+    Returns:
+        The CKAN dataset entity
+    """
     global base_url, dataset_url_prefix, ckan_title_prefix, ckan_name_prefix, ckan_license, data_catalog_prefix
 
     dataset_url = base_url + dataset_url_prefix + dataset
     
     dataset_entity = {}
-        
-    soup = get_soup_from_url(dataset_url)
     
     # Scrape the content from the dataset page
     dataset_entity['name'] = ckan_name_prefix + dataset
@@ -385,66 +673,82 @@ def get_dataset_entity(dataset):
     
     return dataset_entity
 
-@retry(Exception)
-def publish_to_ckan(dataset_entity):
-    """Updates the dataset in the CKAN repository or creates a new dataset
-
-    Returns:
-        None
-    """
-    global ckan_client, ckan_host, ckan_key
-    
-    print "Publishing dataset to CKAN"
+def get_publisher(existing_datasets):
+    """Gets the pipeline stage that creates or updates datasets in the CKAN
+    repository, several at a time. Datasets already on CKAN are updated and
+    the others created, and unchanged datasets are compared against the
+    catalog mirror and not written.
     
-    # Initialize the CKAN client  
-    ckan_client = ckanclient.CkanClient(base_location=ckan_host,api_key=ckan_key)
+    Takes the tuples returned by scrape_dataset, and records the datasets
+    published in the sync state and the journal.
     
-    # Create the name of the dataset on the CKAN instance
-    dataset_id = dataset_entity["name"]
-    
-    # Get the dataset from CKAN
-    dataset_entity_remote = get_remote_dataset(dataset_id)
+    Parameters:
+        existing_datasets - The names of the datasets on CKAN
     
-    # Check to see if the dataset exists on CKAN or not
-    if dataset_entity_remote is None:
-        # Create a new dataset
-        create_dataset(dataset_entity)
+    Returns:
+        pipeline.Stage, with the ckanclient.batch.BatchWriter as its writer
+    """
+    global ckan_mirror, ckan_workers, sync_state, drcog_journal
+    
+    writer = ckanclient.batch.BatchWriter(get_ckan_client(),
+        remote=ckan_mirror, prepare_create=create_dataset,
+        prepare_update=update_dataset, existing=existing_datasets)
+    
+    def publish_dataset(scraped):
+        dataset, dataset_entity, digest, validators = scraped
+        result = writer.write_package(dataset_entity)
+        if result.outcome in ('created', 'updated', 'unchanged'):
+            sync_state.published(dataset, digest, validators)
+            drcog_journal.record("published", dataset, result.outcome)
+        return result
+    
+    publisher = pipeline.Stage("CKAN publish", publish_dataset, workers=ckan_workers)
+    publisher.writer = writer
+    return publisher
+
+def print_publish_result(result):
+    """Prints the outcome of publishing a dataset
+
+    Parameters:
+        result - A ckanclient.batch.BatchResult
+    """
+    if result.error is not None:
+        print "  " + result.name + ": " + result.outcome + " - " + str(result.error)
+    elif result.changes:
+        print "  " + result.name + ": updated " + ", ".join(sorted(result.changes.keys()))
     else:
-        # Update an existing dataset
-        update_dataset(dataset_entity_remote, dataset_entity)
+        print "  " + result.name + ": " + result.outcome
 
 @retry(Exception)
 def create_dataset(dataset_entity):
-    """Creates a new dataset and registers it to CKAN
+    """Prepares a new dataset to be registered to CKAN
 
     Parameters:
         dataset_entity - A CKAN dataset entity
     
     Returns:
-        None
+        The dataset entity, added to the DRCOG group
     """       
     global ckan_group
     
     try:
-        group_entity = ckan_client.group_entity_get(ckan_group)
+        group_entity = get_ckan_client().group_entity_get(ckan_group)
         if group_entity is not None:
-            print('  Adding dataset to group: ' + ckan_group)      
             dataset_entity['groups'] = [group_entity['id']]
     except ckanclient.CkanApiNotFoundError:
         dataset_entity['groups'] = []     
      
-    ckan_client.package_register_post(dataset_entity)
+    return dataset_entity
     
-@retry(Exception)
 def update_dataset(dataset_entity_remote, dataset_entity):
-    """Updates a dataset
+    """Merges a dataset into the one on CKAN
 
     Parameters:
-        dataset_entity_remote - The target dataset
+        dataset_entity_remote - A copy of the target dataset
         dataset_entity - The updated dataset
     
     Returns:
-        None
+        The remote dataset entity, updated
     """    
     dataset_entity_remote['url'] = dataset_entity["url"]
     dataset_entity_remote['license_id'] = dataset_entity["license_id"]
@@ -460,8 +764,6 @@ def update_dataset(dataset_entity_remote, dataset_entity):
     if not 'resources' in dataset_entity_remote:
        dataset_entity_remote['resources'] = []
         
-
-    print "    Updating resources:"
     for resource in dataset_entity['resources']:
         
         mimetype = ""
@@ -477,45 +779,29 @@ def update_dataset(dataset_entity_remote, dataset_entity):
                 break
         
         if (found) :
-            print "      Resource found (" + mimetype + ").  Updating..."
             resource_remote["url"] = resource["url"]
             resource_remote["name"] = resource["name"]
             resource_remote["format"] = resource["format"]
             resource_remote["mimetype"] = resource["mimetype"]
         else:
-            print "      Resource not found (" + mimetype + ").  Adding..."
             dataset_entity_remote['resources'].append(resource)
             
-    ckan_client.package_entity_put(dataset_entity_remote)
-
-@retry(Exception)
-def get_remote_dataset(dataset_id):
-    """Gets the dataset from CKAN repository
+    return dataset_entity_remote
 
+def get_soup_from_url(url, spec=None):
+    """Gets a page, parsing it as it is read
+    
     Parameters:
-        dataset_id - A string representing the unique dataset name
+        url - The URL of the page
+        spec - An extraction.ExtractionSpec of the elements to parse, or
+            None to parse the whole page
     
     Returns:
-        An object structured the same as the JSON dataset output from
-        the CKAN REST API. For more information on the structure look at the
-        web service JSON output, or reference:
-        http://docs.ckan.org/en/latest/api-v2.html#model-api
+        BeautifulSoup
     """
-    dataset_entity = None
-
-    try:
-        # Get the dataset
-        dataset_entity = ckan_client.package_entity_get(dataset_id)
-        print("  Dataset found on OpenColorado")
-        
-    except ckanclient.CkanApiNotFoundError:
-        print("  Dataset not found on OpenColorado")
-
-    return dataset_entity
-
-def get_soup_from_url(url):
-    html = "".join(urllib2.urlopen(url).readlines())
-    soup = BeautifulSoup(html)
+    global drcog_fetcher
+    
+    soup, validators = drcog_fetcher.fetch(url, spec)
     return soup
 
 #Execute main function    
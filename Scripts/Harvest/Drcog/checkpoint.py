@@ -0,0 +1,125 @@
+'''Journal of the work a run has finished, so an interrupted run can resume.
+
+    journal = CheckpointJournal('cache/drcog_journal.jsonl')
+    for url in urls:
+        if journal.done('page', url):
+            page = journal.get('page', url)
+        else:
+            page = fetch(url)
+            journal.record('page', url, page)
+    journal.complete()
+
+Each unit of work is appended to the file as one JSON line as soon as it is
+finished, so the journal survives the process being killed at any point; a
+line cut short by the crash is dropped when the journal is loaded. Once the
+run completes the journal is removed and the next run starts afresh.
+'''
+import os
+import threading
+
+try: # since python 2.6
+    import json
+except ImportError:
+    import simplejson as json
+
+
+class CheckpointJournal(object):
+    '''Values of finished units of work, by kind and key, appended to the
+    JSON lines file at `path`. Safe to use from many threads.'''
+
+    def __init__(self, path):
+        self.path = path
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._file = None
+        self.load()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def done(self, kind, key):
+        '''Returns whether the unit of work was recorded.'''
+        self._lock.acquire()
+        try:
+            return (kind, key) in self._entries
+        finally:
+            self._lock.release()
+
+    def get(self, kind, key, default=None):
+        '''Returns the value recorded for the unit of work.'''
+        self._lock.acquire()
+        try:
+            return self._entries.get((kind, key), default)
+        finally:
+            self._lock.release()
+
+    def record(self, kind, key, value=None):
+        '''Records that the unit of work is finished, with a value that can
+        be written as JSON, and writes it to the file straight away.'''
+        line = json.dumps({'kind': kind, 'key': key, 'value': value},
+                          sort_keys=True) + '\n'
+        self._lock.acquire()
+        try:
+            if self._file is None:
+                self._open()
+            self._file.write(line)
+            self._file.flush()
+            self._entries[(kind, key)] = value
+        finally:
+            self._lock.release()
+
+    def counts(self):
+        '''Returns the number of units of work recorded, by kind.'''
+        self._lock.acquire()
+        try:
+            counts = {}
+            for kind, key in self._entries:
+                counts[kind] = counts.get(kind, 0) + 1
+            return counts
+        finally:
+            self._lock.release()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        journal_file = open(self.path, 'rb')
+        try:
+            valid_bytes = 0
+            for line in journal_file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Cut short when the last run was killed.
+                    break
+                if not line.endswith('\n'):
+                    break
+                self._entries[(entry['kind'], entry['key'])] = entry['value']
+                valid_bytes += len(line)
+        finally:
+            journal_file.close()
+        if valid_bytes < os.path.getsize(self.path):
+            journal_file = open(self.path, 'r+b')
+            try:
+                journal_file.truncate(valid_bytes)
+            finally:
+                journal_file.close()
+
+    def _open(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self._file = open(self.path, 'ab')
+
+    def complete(self):
+        '''Forgets all the work recorded, removing the file, once the run
+        has finished.'''
+        self._lock.acquire()
+        try:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self._entries = {}
+            if os.path.exists(self.path):
+                os.remove(self.path)
+        finally:
+            self._lock.release()
@@ -0,0 +1,128 @@
+'''Request hooks for CkanClient.
+
+A hook is an object with before_request and after_response methods, which
+the client calls around every HTTP request it makes:
+
+    latency = LatencyCollector()
+    ckan = CkanClient(base_location=url, hooks=[latency])
+    ...
+    latency.dump('ckan_latency.json')
+
+`resource` is the CkanClient.resource_paths key the URL was made from (e.g.
+'Package Entity'), or None for URLs outside the API. Hooks are called on
+the thread making the request, so those shared between threads must lock.
+'''
+import threading
+
+try: # since python 2.6
+    import json
+except ImportError:
+    import simplejson as json
+
+
+class RequestHook(object):
+    '''Base class for hooks, with methods that do nothing.'''
+
+    def before_request(self, resource, method, location, bytes_sent):
+        pass
+
+    def after_response(self, resource, method, location, status, bytes_sent,
+                       bytes_received, elapsed):
+        '''status is None if no response was received, and bytes_received
+        is None when the body is streamed to the caller. elapsed is in
+        seconds.'''
+        pass
+
+
+class LatencyCollector(RequestHook):
+    '''Collects a latency histogram per endpoint, an endpoint being the
+    resource and HTTP method, e.g. "Package Entity GET".
+
+    :param buckets: upper bounds of the histogram buckets in milliseconds.
+        Slower requests are counted in a last, unbounded bucket.
+    '''
+
+    buckets = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+    def __init__(self, buckets=None):
+        if buckets is not None:
+            self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._endpoints = {}
+
+    def after_response(self, resource, method, location, status, bytes_sent,
+                       bytes_received, elapsed):
+        key = '%s %s' % (resource or 'Other', method)
+        milliseconds = elapsed * 1000
+        bucket = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if milliseconds <= bound:
+                bucket = i
+                break
+        self._lock.acquire()
+        try:
+            endpoint = self._endpoints.get(key)
+            if endpoint is None:
+                endpoint = self._endpoints[key] = {
+                    'requests': 0, 'errors': 0, 'seconds': 0.0,
+                    'max_seconds': 0.0, 'bytes_sent': 0, 'bytes_received': 0,
+                    'histogram': [0] * (len(self.buckets) + 1)}
+            endpoint['requests'] += 1
+            if status is None or status >= 400:
+                endpoint['errors'] += 1
+            endpoint['seconds'] += elapsed
+            endpoint['max_seconds'] = max(endpoint['max_seconds'], elapsed)
+            endpoint['bytes_sent'] += bytes_sent
+            endpoint['bytes_received'] += bytes_received or 0
+            endpoint['histogram'][bucket] += 1
+        finally:
+            self._lock.release()
+
+    def stats(self):
+        '''Returns a dict of endpoint to its counters, with the histogram as
+        a dict of bucket label to count and approximate percentiles taken
+        from the bucket bounds.'''
+        self._lock.acquire()
+        try:
+            endpoints = dict((key, dict(endpoint))
+                             for key, endpoint in self._endpoints.items())
+        finally:
+            self._lock.release()
+        labels = ['<=%dms' % bound for bound in self.buckets]
+        labels.append('>%dms' % self.buckets[-1])
+        for endpoint in endpoints.values():
+            histogram = endpoint['histogram']
+            endpoint['mean_seconds'] = endpoint['seconds'] / endpoint['requests']
+            for percentile in (50, 95, 99):
+                endpoint['p%d_ms' % percentile] = self._percentile(
+                    histogram, endpoint['requests'], percentile)
+            endpoint['histogram'] = dict(
+                (label, count) for label, count in zip(labels, histogram)
+                if count)
+        return endpoints
+
+    def _percentile(self, histogram, requests, percentile):
+        '''Returns the upper bound of the bucket holding the percentile, or
+        None if it is in the unbounded bucket.'''
+        wanted = requests * percentile / 100.0
+        seen = 0
+        for bound, count in zip(self.buckets, histogram):
+            seen += count
+            if seen >= wanted:
+                return bound
+        return None
+
+    def dump(self, path):
+        '''Writes stats() to path as JSON.'''
+        out = open(path, 'w')
+        try:
+            json.dump(self.stats(), out, indent=2, sort_keys=True)
+        finally:
+            out.close()
+
+    def reset(self):
+        self._lock.acquire()
+        try:
+            self._endpoints = {}
+        finally:
+            self._lock.release()
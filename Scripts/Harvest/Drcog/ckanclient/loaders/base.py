@@ -1,7 +1,7 @@
 from optparse import OptionParser
 from gdata.spreadsheet.service import SpreadsheetsService as GoogleSpreadsheetsService
-from ckanclient import CkanClient, CkanApiError
-from time import sleep
+from ckanclient import CkanClient, CkanApiNotAuthorizedError, RateLimiter
+from ckanclient.batch import BatchWriter
 import string
 import pprint
 
@@ -74,6 +74,24 @@ class CkanLoader(object):
             '--ckan-api-key',
             dest='ckan_api_key',
             help="""A valid CKAN REST API key.""")
+        parser.add_option(
+            '--ckan-rate',
+            dest='ckan_rate',
+            type='float',
+            default=2.0,
+            help="""Maximum number of CKAN requests per second.""")
+        parser.add_option(
+            '--ckan-max-retries',
+            dest='ckan_max_retries',
+            type='int',
+            default=3,
+            help="""Times to retry a request when CKAN is busy (429/503).""")
+        parser.add_option(
+            '--ckan-workers',
+            dest='ckan_workers',
+            type='int',
+            default=4,
+            help="""Number of packages to write to CKAN at once.""")
         parser.add_option(
             '--no-create-confirmation',
             dest='no_create_confimation',
@@ -94,6 +112,8 @@ class CkanLoader(object):
         self.ckanclient = CkanClient(
             base_location=self.options.ckan_api_location,
             api_key=self.options.ckan_api_key,
+            rate_limiter=RateLimiter(rate=self.options.ckan_rate),
+            max_retries=self.options.ckan_max_retries,
         )
 
     def run(self):
@@ -114,99 +134,49 @@ class CkanLoader(object):
 
     def put_packages_on_ckan(self):
         """Uses CKAN client to register (or update) obtained packages."""
-        # Todo: Fix ckan or ckanclient, so this method isn't so long-winded.
+        # Which packages are registered is read once, and the writes go
+        # through a pool of threads, paced by the client's rate limiter.
+        writer = BatchWriter(self.ckanclient, workers=self.options.ckan_workers)
+        existing = writer.existing_names()
+        packages = [package for package in self.packages
+                    if self.confirm_put(package, package['name'] in existing)]
         print ""
-        sleep(1)
-        for package in self.packages:
-            try:
-                registered_package = self.ckanclient.package_entity_get(package['name'])
-            except CkanApiError:
-                pass
-            if self.ckanclient.last_status == 200:
-                print "Package '%s' is already registered" % package['name']
-                print ""
-                pprint.pprint(package)
-                print ""
-                if not self.options.no_update_confimation:
-                    answer = raw_input("Do you want to update this package with CKAN now? [y/N] ")
-                    if not answer or answer.lower()[0] != 'y':
-                        print "Skipping '%s' package..." % package['name']
-                        print ""
-                        sleep(1)
-                        continue
-                print "Updating package..."
-                self.ckanclient.package_entity_put(package)
-                if self.ckanclient.last_status == 200:
-                    print "Updated package '%s' OK." % package['name']
-                    sleep(1)
-                elif self.ckanclient.last_status == 403 or '403' in str(self.ckanclient.last_url_error):
-                    print "Error: Not authorised. Check your API key."
-                    sleep(1)
-                    sleep(1)
-                    sleep(1)
-                    sleep(1)
-                elif self.ckanclient.last_http_error:
-                    print "Error: CKAN returned status code %s: %s" % (
-                        self.ckanclient.last_status, self.ckanclient.last_http_error)
-                    sleep(1)
-                    sleep(1)
-                    sleep(1)
-                elif self.ckanclient.last_url_error:
-                    print "Error: URL problems: %s" % self.ckanclient.last_url_error
-                    sleep(1)
-                    sleep(1)
-                    sleep(1)
-                else:
-                    raise Exception, "Error: CKAN request didn't work at all."
-            elif self.ckanclient.last_status == 404 or '404' in str(self.ckanclient.last_url_error):
-                print "Package '%s' not currently registered" % package['name']
-                print ""
-                pprint.pprint(package)
-                print ""
-                if not self.options.no_create_confimation:
-                    answer = raw_input("Do you want to register this package with CKAN now? [y/N] ")
-                    if not answer or answer.lower()[0] != 'y':
-                        print "Skipping '%s' package..." % package['name']
-                        print ""
-                        sleep(1)
-                        continue
-                print "Registering package..."
-                self.ckanclient.package_register_post(package)
-                if self.ckanclient.last_status in [200, 201]:
-                    print "Registered package '%s' OK." % package['name']
-                    sleep(1)
-                elif self.ckanclient.last_status == 403 or '403' in str(self.ckanclient.last_url_error):
-                    print "Error: Not authorised. Check your API key."
-                    sleep(1)
-                    sleep(1)
-                    sleep(1)
-                    sleep(1)
-                elif self.ckanclient.last_http_error:
-                    print "Error: CKAN returned status code %s: %s" % (
-                        self.ckanclient.last_status, self.ckanclient.last_http_error)
-                    sleep(1)
-                    sleep(1)
-                    sleep(1)
-                elif self.ckanclient.last_url_error:
-                    print "Error: URL problems: %s" % self.ckanclient.last_url_error
-                    sleep(1)
-                    sleep(1)
-                    sleep(1)
-                else:
-                    raise Exception, "Error: CKAN request didn't work at all."
-            elif self.ckanclient.last_http_error:
-                print "Error: CKAN returned status code %s: %s" % (
-                    self.ckanclient.last_status, self.ckanclient.last_http_error)
-                sleep(1)
-                sleep(1)
-                sleep(1)
-            elif self.ckanclient.last_url_error:
-                print "Error: URL problems: %s" % self.ckanclient.last_url_error
-                sleep(1)
-                sleep(1)
-                sleep(1)
+        for result in writer.write(packages):
+            if result.outcome == 'created':
+                print "Registered package '%s' OK." % result.name
+            elif result.outcome == 'updated':
+                print "Updated package '%s' OK." % result.name
+            elif result.outcome == 'conflict':
+                print "Error: Package '%s' was registered meanwhile by someone else." % result.name
+            elif isinstance(result.error, CkanApiNotAuthorizedError):
+                print "Error: Not authorised. Check your API key."
             else:
-                raise Exception, "Error: CKAN request didn't work at all."
+                print "Error: Package '%s': CKAN returned %s" % (
+                    result.name, result.error)
+        print "CKAN writes: %s" % writer.counts()
+        print "CKAN rate limiter: %s" % self.ckanclient.rate_limiter.stats()
+
+    def confirm_put(self, package, is_registered):
+        """Asks whether to register or update the package, unless the
+        confirmation for that has been turned off."""
+        if is_registered:
+            print "Package '%s' is already registered" % package['name']
+            question = "Do you want to update this package with CKAN now? [y/N] "
+            no_confirmation = self.options.no_update_confimation
+        else:
+            print "Package '%s' not currently registered" % package['name']
+            question = "Do you want to register this package with CKAN now? [y/N] "
+            no_confirmation = self.options.no_create_confimation
+        print ""
+        pprint.pprint(package)
+        print ""
+        if not no_confirmation:
+            answer = raw_input(question)
+            if not answer or answer.lower()[0] != 'y':
+                print "Skipping '%s' package..." % package['name']
+                print ""
+                return False
+        return True
 
     def create_package(self, name, title='', url='', maintainer='', 
             maintainer_email='', author='', author_email='', notes='', 
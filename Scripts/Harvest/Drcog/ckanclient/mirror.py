@@ -0,0 +1,194 @@
+'''Local copy of every package in a CKAN catalog.
+
+    mirror = CatalogMirror('/var/cache/ckanclient/catalog.json')
+    mirror.refresh(CkanClient(base_location=url))
+    for package in mirror.packages():
+        print package['name'], package['metadata_modified']
+
+The first refresh reads the whole catalog. Later ones only get the packages
+named in the revisions made since, so reading the catalog takes a revision
+search and a few revision and package GETs instead of a full pull. When
+there are more revisions than that is worth, the catalog is read whole
+again.
+'''
+import os
+import datetime
+
+try: # since python 2.6
+    import json
+except ImportError:
+    import simplejson as json
+
+from ckanclient import CkanApiNotFoundError
+from ckanclient.workers import WorkerPool
+
+
+class CatalogMirror(object):
+    '''Package dicts by name, kept in a JSON file at `path`.
+
+    :param path: the snapshot file, whose directory is created if need be
+    :param clock_skew: seconds by which revision searches start before the
+        previous refresh, to allow for the server clock being behind ours.
+        Packages changed in that window are fetched again, harmlessly.
+    '''
+
+    def __init__(self, path, clock_skew=300):
+        self.path = path
+        self.clock_skew = clock_skew
+        self.revision_time = None
+        self._packages = {}
+        self.load()
+
+    def __len__(self):
+        return len(self._packages)
+
+    def __contains__(self, name):
+        return name in self._packages
+
+    def get(self, name):
+        return self._packages.get(name)
+
+    def packages(self):
+        '''Returns the package dicts, sorted by name.'''
+        return [self._packages[name] for name in sorted(self._packages)]
+
+    def index(self):
+        '''Returns a dict of package name to metadata_modified.'''
+        return dict((name, package.get('metadata_modified'))
+                    for name, package in self._packages.items())
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        snapshot_file = open(self.path, 'rb')
+        try:
+            snapshot = json.load(snapshot_file)
+        finally:
+            snapshot_file.close()
+        self.revision_time = snapshot.get('revision_time')
+        self._packages = snapshot['packages']
+
+    def save(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        temp_path = self.path + '.tmp'
+        out = open(temp_path, 'wb')
+        try:
+            json.dump({'revision_time': self.revision_time,
+                       'packages': self._packages}, out)
+        finally:
+            out.close()
+        if os.name == 'nt' and os.path.exists(self.path):
+            # rename does not replace an existing file on Windows.
+            os.remove(self.path)
+        os.rename(temp_path, self.path)
+
+    def refresh(self, client, workers=4, batch_size=1000, max_revisions=100):
+        '''Brings the snapshot up to date and saves it. Returns a dict
+        counting the packages added, updated, deleted and unchanged.
+
+        Uses a revision search if the snapshot has been refreshed before,
+        the server supports one and it finds at most `max_revisions`
+        revisions. Otherwise reads the package search and only GETs the
+        packages whose metadata_modified changed.'''
+        started = datetime.datetime.utcnow()
+        counts = None
+        if self.revision_time is not None:
+            try:
+                counts = self._refresh_from_revisions(client, workers,
+                                                      max_revisions)
+            except CkanApiNotFoundError:
+                # No revision search on this server.
+                pass
+        if counts is None:
+            counts = self._refresh_from_search(client, workers, batch_size)
+        since = started - datetime.timedelta(seconds=self.clock_skew)
+        self.revision_time = since.isoformat()
+        self.save()
+        return counts
+
+    def _refresh_from_revisions(self, client, workers, max_revisions):
+        revision_ids = client.revision_search(since_time=self.revision_time)
+        if len(revision_ids) > max_revisions:
+            return None
+        # Revisions list their packages by id under API v2, and by name
+        # under v1.
+        refs = set()
+        pool = WorkerPool(workers)
+        revisions = pool.map_ordered(client.revision_entity_get, revision_ids)
+        try:
+            for revision in revisions:
+                refs.update(revision['packages'])
+        finally:
+            revisions.close()
+            pool.shutdown(wait=False)
+        names_by_id = dict((package['id'], name)
+                           for name, package in self._packages.items()
+                           if package.get('id'))
+        counts = {'added': 0, 'updated': 0, 'deleted': 0}
+        before = len(self._packages)
+        found = set()
+        for package in client._package_entity_generator(sorted(refs),
+                                                        workers):
+            if package.get('state', 'active') != 'active':
+                continue
+            found.add(package['name'])
+            # A renamed package is dropped under its old name.
+            old_name = names_by_id.get(package.get('id'))
+            if old_name not in (None, package['name']) and \
+                    self._packages.pop(old_name, None) is not None:
+                counts['deleted'] += 1
+            self._store(package, counts)
+        for ref in refs:
+            name = names_by_id.get(ref, ref)
+            if name not in found and \
+                    self._packages.pop(name, None) is not None:
+                counts['deleted'] += 1
+        counts['unchanged'] = before - counts['updated'] - counts['deleted']
+        return counts
+
+    def _refresh_from_search(self, client, workers, batch_size):
+        counts = {'added': 0, 'updated': 0, 'deleted': 0, 'unchanged': 0}
+        seen = set()
+        stale = []
+        results = client.package_search(None, {'all_fields': 1,
+                                               'limit': batch_size},
+                                        stream=True)['results']
+        for result in results:
+            if not isinstance(result, dict):
+                # Only names, so every package has to be fetched.
+                result = {'name': result}
+            name = result['name']
+            seen.add(name)
+            current = self._packages.get(name)
+            modified = result.get('metadata_modified')
+            if current is not None and modified is not None and \
+                    current.get('metadata_modified') == modified:
+                counts['unchanged'] += 1
+            elif 'resources' in result:
+                if not self._store(result, counts):
+                    counts['unchanged'] += 1
+            else:
+                stale.append(name)
+        for package in client._package_entity_generator(stale, workers):
+            if not self._store(package, counts):
+                counts['unchanged'] += 1
+        for name in set(self._packages) - seen:
+            del self._packages[name]
+            counts['deleted'] += 1
+        return counts
+
+    def _store(self, package, counts):
+        '''Keeps the package if it is new or modified, counting which.
+        Returns False if it is unchanged.'''
+        current = self._packages.get(package['name'])
+        if current is None:
+            counts['added'] += 1
+        elif current.get('metadata_modified') != \
+                package.get('metadata_modified'):
+            counts['updated'] += 1
+        else:
+            return False
+        self._packages[package['name']] = package
+        return True
@@ -0,0 +1,107 @@
+'''Micro-benchmark of the debug output cost in ApiClient.open_url.
+
+Decodes a canned package_search response with all_fields through
+CkanClient.package_search, once with debug output formatted eagerly (how
+_print used to be called) and once with the lazy _print. No network is
+involved.
+
+    python -m ckanclient.tests.bench_trace [packages] [repeat]
+'''
+import sys
+import json
+import timeit
+from StringIO import StringIO
+from mimetools import Message
+
+from ckanclient import CkanClient
+
+
+def make_search_body(packages):
+    results = []
+    for i in range(packages):
+        name = 'dataset-%05d' % i
+        results.append({
+            'id': '%08d-0000-0000-0000-000000000000' % i,
+            'name': name,
+            'title': 'Dataset %d' % i,
+            'notes': 'Description of the dataset. ' * 20,
+            'tags': ['gis', 'transportation', 'drcog'],
+            'extras': {},
+            'resources': [{'url': 'http://example.com/%s.%s' % (name, fmt),
+                           'format': fmt.upper(), 'name': name,
+                           'mimetype': 'application/zip'}
+                          for fmt in ('shp', 'kml', 'csv', 'dwg')],
+        })
+    return json.dumps({'count': packages, 'results': results})
+
+
+class CannedResponse(object):
+
+    code = 200
+
+    def __init__(self, url, body):
+        self.url = url
+        self.body = StringIO(body)
+        self.headers = Message(StringIO('Content-Type: application/json\n'))
+
+    def geturl(self):
+        return self.url
+
+    def read(self, amt=-1):
+        return self.body.read(amt)
+
+    def close(self):
+        pass
+
+
+class CannedTransport(object):
+
+    def __init__(self, body):
+        self.body = body
+
+    def open(self, request):
+        return CannedResponse(request.get_full_url(), self.body)
+
+
+class EagerClient(CkanClient):
+    '''Formats every debug message and throws it away, as open_url did
+    before formatting was deferred.'''
+
+    formatted_bytes = 0
+
+    def _print(self, msg, *args):
+        if args:
+            msg = msg % args
+        EagerClient.formatted_bytes += len(msg)
+
+    def _print_body(self, msg, body):
+        self._print(msg, body)
+
+
+def main():
+    packages = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    body = make_search_body(packages)
+    transport = CannedTransport(body)
+    lazy = CkanClient(base_location='http://ckan.invalid/api',
+                      transport=transport)
+    eager = EagerClient(base_location='http://ckan.invalid/api',
+                        transport=transport)
+    options = {'all_fields': 1, 'limit': packages}
+
+    print 'package_search response: %d packages, %.1f MB' % (
+        packages, len(body) / 1048576.0)
+    timings = {}
+    for label, client in (('eager', eager), ('lazy', lazy)):
+        timer = timeit.Timer(lambda: client.package_search(None, options))
+        timings[label] = min(timer.repeat(repeat, 1))
+        print '%-5s %8.1f ms per request' % (label, timings[label] * 1000)
+    print 'saving %8.1f ms per request (%.0f%%)' % (
+        (timings['eager'] - timings['lazy']) * 1000,
+        100 * (timings['eager'] - timings['lazy']) / timings['eager'])
+    print 'eager formatting allocated %.1f MB of strings per request' % (
+        EagerClient.formatted_bytes / float(repeat) / 1048576.0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,347 @@
+'''A small stand-in for the CKAN API, served from a background thread.
+
+It implements enough of the REST and search interfaces for the ckanclient
+tests and benchmarks to run without a real CKAN instance:
+
+    server = FakeCkanServer()
+    server.start()
+    client = CkanClient(base_location=server.base_location)
+    ...
+    server.stop()
+
+API v2 is served under base_location + '/2', where the registers list ids
+rather than names.
+'''
+import cgi
+import json
+import datetime
+import socket
+import hashlib
+import random
+import threading
+import time
+import zlib
+import BaseHTTPServer
+import SocketServer
+from urlparse import urlsplit, parse_qsl
+from StringIO import StringIO
+
+
+class FakeCkanServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+    # Set False to answer all_fields searches with summary dicts (no
+    # resources), as older CKAN versions do.
+    full_search_results = True
+
+    # Content-Encoding ('gzip' or 'deflate') used for the JSON bodies when
+    # the client accepts it.
+    content_encoding = None
+
+    def __init__(self, latency=0, error_rate=0, seed=None):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0),
+                                           FakeCkanHandler)
+        self.latency = latency
+        # Fraction of the requests, beyond those of inject_error(),
+        # answered with a 503.
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.packages = {}
+        self.groups = {}
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.sockets = []
+        self.requests = []
+        # The Authorization header of each request, or None
+        self.authorizations = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.errors = []
+        self.revisions = []
+        # Uploaded file contents by storage label.
+        self.files = {}
+
+    @property
+    def base_location(self):
+        return 'http://127.0.0.1:%s/api' % self.server_address[1]
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        # Drop any keep-alive connections the clients still hold open.
+        for sock in self.sockets:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+
+    def inject_error(self, status, count=1, headers=None):
+        '''Answers the next `count` requests with `status`.'''
+        self.lock.acquire()
+        self.errors.extend([(status, headers or {})] * count)
+        self.lock.release()
+
+    def add_package(self, name, **fields):
+        package = {'id': 'id-' + name, 'name': name, 'title': name,
+                   'tags': [], 'groups': [], 'resources': [], 'extras': {},
+                   'metadata_modified': '2012-01-01T00:00:00'}
+        package.update(fields)
+        self.packages[name] = package
+        return package
+
+    def touch_package(self, name, **fields):
+        '''Changes a package as an edit through the API would.'''
+        self.lock.acquire()
+        try:
+            self.packages[name].update(fields)
+        finally:
+            self.lock.release()
+        self.revise(name)
+
+    def revise(self, name, package_id=None):
+        '''Records a revision of the package, bumping its metadata_modified.
+        Revisions list packages by id, as API v2 does.'''
+        self.lock.acquire()
+        try:
+            timestamp = datetime.datetime.utcnow().isoformat()
+            if package_id is None:
+                package_id = self.packages.get(name, {}).get('id', 'id-' + name)
+            self.revisions.append({'id': 'revision-%d' % len(self.revisions),
+                                   'timestamp': timestamp,
+                                   'packages': [package_id]})
+            if name in self.packages:
+                self.packages[name]['metadata_modified'] = timestamp
+        finally:
+            self.lock.release()
+
+    def add_group(self, name, **fields):
+        group = {'id': 'id-' + name, 'name': name, 'title': name,
+                 'packages': []}
+        group.update(fields)
+        self.groups[name] = group
+        return group
+
+
+class FakeCkanHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    # Buffer each response into one write, so that small header packets
+    # don't meet delayed ACKs on keep-alive connections.
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        self.server.lock.acquire()
+        self.server.connections += 1
+        self.server.sockets.append(self.connection)
+        self.server.lock.release()
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_PUT(self):
+        self._dispatch('PUT')
+
+    def do_DELETE(self):
+        self._dispatch('DELETE')
+
+    def _dispatch(self, method):
+        length = int(self.headers.get('content-length') or 0)
+        body = self.rfile.read(length) if length else ''
+        path, query = urlsplit(self.path)[2:4]
+        server = self.server
+        server.lock.acquire()
+        server.requests.append((method, self.path))
+        server.authorizations.append(self.headers.getheader('Authorization'))
+        server.in_flight += 1
+        server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        error = server.errors.pop(0) if server.errors else None
+        if error is None and server.random.random() < server.error_rate:
+            error = (503, {})
+        server.lock.release()
+        try:
+            if server.latency:
+                time.sleep(server.latency)
+            if error is None and path == '/storage/upload_handle':
+                status, result = self._upload(body)
+            elif error is None:
+                parts = [part for part in path.split('/') if part][1:]
+                data = self._decode(body) if body else dict(parse_qsl(query))
+                status, result = self._route(method, parts, data)
+        finally:
+            server.lock.acquire()
+            server.in_flight -= 1
+            server.lock.release()
+        if error is not None:
+            status, headers = error
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header('Content-Type', 'text/plain')
+            self.send_header('Content-Length', '5')
+            self.end_headers()
+            self.wfile.write('Error')
+            return
+        self._send(status, result, method)
+
+    def _decode(self, body):
+        # ckanclient form-encodes the JSON document as a single key.
+        return json.loads(parse_qsl(body, keep_blank_values=True)[0][0])
+
+    def _route(self, method, parts, data):
+        server = self.server
+        by_id = parts[:1] == ['2']
+        if by_id:
+            parts = parts[1:]
+        if not parts:
+            return 200, {'version': 2}
+        if parts[:2] == ['rest', 'package']:
+            package = None
+            if len(parts) > 2:
+                package = self._find(server.packages, parts[2])
+            status, result = self._entity(method, parts[2:], data,
+                                          server.packages, by_id)
+            if method != 'GET' and status < 400:
+                package = package or result
+                server.revise(package['name'], package.get('id'))
+            return status, result
+        if parts[:2] == ['rest', 'revision'] and len(parts) == 3:
+            for revision in server.revisions:
+                if revision['id'] == parts[2]:
+                    return 200, revision
+            return 404, 'Not found'
+        if parts == ['search', 'revision']:
+            since = data.get('since_time', '')
+            return 200, [revision['id'] for revision in server.revisions
+                         if revision['timestamp'] > since]
+        if parts[:2] == ['rest', 'group']:
+            return self._entity(method, parts[2:], data, server.groups,
+                                by_id)
+        if parts == ['search', 'package']:
+            return 200, self._search(data)
+        if parts[:3] == ['storage', 'auth', 'form']:
+            return 200, {'action': '/storage/upload_handle',
+                         'fields': [{'name': 'key',
+                                     'value': '/'.join(parts[3:])}]}
+        if parts[:2] == ['storage', 'metadata']:
+            content = server.files.get('/'.join(parts[2:]))
+            if content is None:
+                return 404, 'Not found'
+            return 200, {'_content_length': len(content),
+                         '_checksum': 'md5:' + hashlib.md5(content).hexdigest()}
+        return 404, 'Not found'
+
+    def _upload(self, body):
+        form = cgi.FieldStorage(fp=StringIO(body), headers=self.headers,
+                                environ={'REQUEST_METHOD': 'POST'})
+        if 'key' not in form or 'file' not in form:
+            return 400, 'Missing key or file'
+        self.server.lock.acquire()
+        self.server.files[form.getfirst('key')] = form['file'].value
+        self.server.lock.release()
+        return 200, {'key': form.getfirst('key')}
+
+    def _entity(self, method, parts, data, register, by_id=False):
+        if not parts:
+            if method == 'GET' and by_id:
+                return 200, sorted(entity['id'] for entity in register.values())
+            if method == 'GET':
+                return 200, sorted(register.keys())
+            if data['name'] in register:
+                return 409, 'Conflict'
+            data.setdefault('id', 'id-' + data['name'])
+            register[data['name']] = data
+            return 201, data
+        entity = self._find(register, parts[0])
+        if entity is None:
+            return 404, 'Not found'
+        name = entity['name']
+        if method == 'PUT':
+            data.setdefault('id', entity.get('id'))
+            register[name] = data
+        elif method == 'DELETE':
+            del register[name]
+            return 200, None
+        return 200, register[name]
+
+    def _find(self, register, ref):
+        '''Returns the entity by name or id, as CKAN accepts either.'''
+        if ref in register:
+            return register[ref]
+        for entity in register.values():
+            if entity.get('id') == ref:
+                return entity
+        return None
+
+    def _search(self, options):
+        q = options.get('q')
+        group = options.get('groups')
+        # Packages list their groups by id
+        group_refs = set([group])
+        if group in self.server.groups:
+            group_refs.add(self.server.groups[group]['id'])
+        names = sorted(self.server.packages.keys())
+        matches = []
+        for name in names:
+            package = self.server.packages[name]
+            if q and q not in name and q not in package.get('title', ''):
+                continue
+            if group and not group_refs & set(package.get('groups', [])):
+                continue
+            matches.append(package)
+        offset = int(options.get('offset') or 0)
+        limit = int(options.get('limit') or 20)
+        page = matches[offset:offset + limit]
+        if not options.get('all_fields'):
+            page = [package['name'] for package in page]
+        elif not self.server.full_search_results:
+            page = [dict((key, package[key])
+                         for key in ('id', 'name', 'metadata_modified'))
+                    for package in page]
+        return {'count': len(matches), 'results': page}
+
+    def _send(self, status, result, method):
+        if isinstance(result, basestring) and status >= 400:
+            body, content_type = result, 'text/plain'
+        else:
+            body, content_type = json.dumps(result), 'application/json'
+        if method == 'GET' and status == 200:
+            etag = '"%s"' % hashlib.md5(body).hexdigest()
+            if self.headers.get('if-none-match') == etag:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.end_headers()
+                return
+            self.send_response(status)
+            self.send_header('ETag', etag)
+        else:
+            self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        encoding = self.server.content_encoding
+        if encoding and content_type == 'application/json' and \
+                encoding in self.headers.get('accept-encoding', ''):
+            if encoding == 'gzip':
+                compressor = zlib.compressobj(6, zlib.DEFLATED,
+                                              16 + zlib.MAX_WBITS)
+            else:
+                compressor = zlib.compressobj(6)
+            body = compressor.compress(body) + compressor.flush()
+            self.send_header('Content-Encoding', encoding)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
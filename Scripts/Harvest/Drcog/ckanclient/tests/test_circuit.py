@@ -0,0 +1,98 @@
+import socket
+import time
+
+from nose.tools import assert_raises, assert_equal
+
+from ckanclient import CkanClient, CkanApiError, CkanApiNotFoundError, \
+    CkanApiCircuitOpenError, CircuitBreaker
+from ckanclient.tests.fake_ckan import FakeCkanServer
+
+
+class TestCircuitBreaker(object):
+
+    def setup(self):
+        self.server = FakeCkanServer()
+        self.server.add_package('annakarenina')
+        self.server.start()
+        self.breaker = CircuitBreaker(threshold=3, cooldown=0.2)
+        self.c = self._client()
+
+    def teardown(self):
+        self.server.stop()
+
+    def _client(self, base_location=None):
+        return CkanClient(base_location=base_location or
+                          self.server.base_location,
+                          circuit_breaker=self.breaker)
+
+    def _trip(self):
+        self.server.inject_error(500, count=3)
+        for i in range(3):
+            assert_raises(CkanApiError, self.c.package_entity_get,
+                          'annakarenina')
+
+    def test_01_opens_and_fails_fast(self):
+        self._trip()
+        requests = len(self.server.requests)
+        # Shared, so another client fails fast too.
+        other = self._client()
+        for client in (self.c, other):
+            assert_raises(CkanApiCircuitOpenError, client.package_entity_get,
+                          'annakarenina')
+        assert_equal(len(self.server.requests), requests)
+        stats = self.breaker.stats()
+        assert_equal(stats['state'], 'open')
+        assert_equal(stats['opened'], 1)
+        assert_equal(stats['failures'], 3)
+        assert_equal(stats['rejected'], 2)
+
+    def test_02_probe_closes(self):
+        self._trip()
+        time.sleep(0.25)
+        assert_equal(self.c.package_entity_get('annakarenina')['name'],
+                     'annakarenina')
+        assert_equal([path for method, path in self.server.requests[-2:]],
+                     ['/api', '/api/rest/package/annakarenina'])
+        stats = self.breaker.stats()
+        assert_equal(stats['state'], 'closed')
+        assert_equal(stats['probes'], 1)
+        assert_equal(stats['closed'], 1)
+        assert stats['open_seconds'] >= 0.2, stats
+
+    def test_03_failed_probe_stays_open(self):
+        self._trip()
+        time.sleep(0.25)
+        self.server.inject_error(503)
+        assert_raises(CkanApiCircuitOpenError, self.c.package_entity_get,
+                      'annakarenina')
+        assert_equal(self.server.requests[-1][1], '/api')
+        assert_raises(CkanApiCircuitOpenError, self.c.package_entity_get,
+                      'annakarenina')
+        stats = self.breaker.stats()
+        assert_equal(stats['state'], 'open')
+        assert_equal(stats['probe_failures'], 1)
+        assert_equal(stats['opened'], 1)
+
+    def test_04_client_errors_do_not_count(self):
+        for i in range(5):
+            assert_raises(CkanApiNotFoundError, self.c.package_entity_get,
+                          'missing')
+        self.server.inject_error(500, count=2)
+        for i in range(2):
+            assert_raises(CkanApiError, self.c.package_entity_get,
+                          'annakarenina')
+        self.c.package_entity_get('annakarenina')
+        stats = self.breaker.stats()
+        assert_equal(stats['state'], 'closed')
+        assert_equal(stats['consecutive_failures'], 0)
+
+    def test_05_connection_errors_count(self):
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        c = self._client('http://127.0.0.1:%s/api' % port)
+        for i in range(3):
+            assert_raises(CkanApiError, c.package_register_get)
+        assert_raises(CkanApiCircuitOpenError, c.package_register_get)
+        assert_equal(self.breaker.stats()['state'], 'open')
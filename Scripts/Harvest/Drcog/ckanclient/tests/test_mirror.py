@@ -0,0 +1,96 @@
+import os
+import shutil
+import tempfile
+
+from nose.tools import assert_equal
+
+from ckanclient import CkanClient, KeepAliveTransport
+from ckanclient.mirror import CatalogMirror
+from ckanclient.tests.fake_ckan import FakeCkanServer
+
+
+class TestCatalogMirror(object):
+
+    def setup(self):
+        self.server = FakeCkanServer()
+        self.names = ['package%02d' % i for i in range(12)]
+        for name in self.names:
+            self.server.add_package(name)
+        self.server.start()
+        self.c = CkanClient(base_location=self.server.base_location,
+                            transport=KeepAliveTransport())
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'catalog.json')
+
+    def teardown(self):
+        self.server.stop()
+        shutil.rmtree(self.directory)
+
+    def _requests(self, method, path):
+        return len([r for r in self.server.requests
+                    if r[0] == method and path in r[1]])
+
+    def _mirror(self):
+        return CatalogMirror(self.path, clock_skew=0)
+
+    def test_01_first_refresh_from_search(self):
+        counts = self._mirror().refresh(self.c, batch_size=5)
+        assert_equal(counts, {'added': 12, 'updated': 0, 'deleted': 0,
+                              'unchanged': 0})
+        mirror = self._mirror()
+        assert_equal([p['name'] for p in mirror.packages()], self.names)
+        assert_equal(self._requests('GET', '/rest/package/'), 0)
+
+    def test_02_refresh_from_revisions(self):
+        self._mirror().refresh(self.c)
+        self.server.touch_package('package03', title='Changed')
+        self.c.package_entity_delete('package04')
+        self.server.add_package('package99')
+        self.server.revise('package99')
+        searches = self._requests('POST', '/search/package')
+        mirror = self._mirror()
+        counts = mirror.refresh(self.c)
+        assert_equal(counts, {'added': 1, 'updated': 1, 'deleted': 1,
+                              'unchanged': 10})
+        assert_equal(mirror.get('package03')['title'], 'Changed')
+        assert 'package04' not in mirror
+        assert_equal(len(mirror), 12)
+        assert_equal(self._requests('POST', '/search/package'), searches)
+        assert_equal(self._requests('GET', '/rest/package/'), 3)
+        assert_equal(mirror.refresh(self.c)['unchanged'], 12)
+
+    def test_03_summary_search_fetches_modified_only(self):
+        self.server.full_search_results = False
+        self._mirror().refresh(self.c)
+        assert_equal(self._requests('GET', '/rest/package/'), 12)
+        self.server.touch_package('package05', title='Changed')
+        mirror = self._mirror()
+        mirror.revision_time = None
+        counts = mirror.refresh(self.c)
+        assert_equal(counts['updated'], 1)
+        assert_equal(counts['unchanged'], 11)
+        assert_equal(self._requests('GET', '/rest/package/'), 13)
+
+    def test_04_many_revisions_read_from_search(self):
+        self._mirror().refresh(self.c)
+        for name in self.names[:6]:
+            self.server.touch_package(name, title='Changed')
+        self.c.package_entity_delete('package07')
+        searches = self._requests('POST', '/search/package')
+        mirror = self._mirror()
+        counts = mirror.refresh(self.c, max_revisions=5)
+        assert_equal(counts, {'added': 0, 'updated': 6, 'deleted': 1,
+                              'unchanged': 5})
+        assert_equal(self._requests('GET', '/rest/revision/'), 0)
+        assert_equal(self._requests('POST', '/search/package'), searches + 1)
+
+    def test_05_revisions_fetched_concurrently(self):
+        self._mirror().refresh(self.c)
+        for name in self.names:
+            self.server.touch_package(name, title='Changed')
+        self.server.latency = 0.1
+        mirror = self._mirror()
+        counts = mirror.refresh(self.c, workers=12)
+        assert_equal(counts['updated'], 12)
+        # 12 revisions, then 12 packages, 12 at a time
+        assert self.server.max_in_flight >= 6
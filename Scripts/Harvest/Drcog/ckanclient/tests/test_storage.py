@@ -0,0 +1,77 @@
+import os
+import shutil
+import tempfile
+
+from nose.tools import assert_equal, assert_raises
+
+from ckanclient import CkanClient, CkanApiError, KeepAliveTransport, \
+    UrllibTransport
+from ckanclient.tests.fake_ckan import FakeCkanServer
+
+
+class TestStorageUpload(object):
+
+    def setup(self):
+        self.server = FakeCkanServer()
+        self.server.start()
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, 'parcels.zip')
+        self.content = ''.join(chr(i % 256) for i in range(300000))
+        out = open(self.path, 'wb')
+        out.write(self.content)
+        out.close()
+
+    def teardown(self):
+        self.server.stop()
+        shutil.rmtree(self.folder)
+
+    def _client(self, transport=None):
+        return CkanClient(base_location=self.server.base_location,
+                          api_key='key', transport=transport)
+
+    def _uploads(self):
+        return len([r for r in self.server.requests
+                    if r[1] == '/storage/upload_handle'])
+
+    def test_01_upload_in_chunks(self):
+        progress = []
+        c = self._client(KeepAliveTransport())
+        result = c.storage_file_upload(self.path, 'parcels/parcels.zip',
+                                       chunk_size=65536,
+                                       progress=lambda *args: progress.append(args))
+        assert_equal(self.server.files['parcels/parcels.zip'], self.content)
+        assert_equal(result['bytes'], len(self.content))
+        assert_equal(result['skipped'], False)
+        assert result['url'].endswith('/storage/f/parcels/parcels.zip'), \
+            result['url']
+        assert not result['url'].startswith(self.server.base_location)
+        assert_equal([sent for sent, size in progress],
+                     [65536, 131072, 196608, 262144, 300000])
+        assert_equal(set(size for sent, size in progress),
+                     set([len(self.content)]))
+
+    def test_02_urllib_transport(self):
+        c = self._client(UrllibTransport())
+        c.storage_file_upload(self.path, 'parcels.zip')
+        assert_equal(self.server.files['parcels.zip'], self.content)
+
+    def test_03_unchanged_file_skipped(self):
+        c = self._client()
+        c.storage_file_upload(self.path, 'parcels.zip')
+        result = c.storage_file_upload(self.path, 'parcels.zip')
+        assert_equal(result['skipped'], True)
+        assert_equal(self._uploads(), 1)
+        out = open(self.path, 'ab')
+        out.write('more')
+        out.close()
+        result = c.storage_file_upload(self.path, 'parcels.zip')
+        assert_equal(result['skipped'], False)
+        assert_equal(self._uploads(), 2)
+
+    def test_04_failed_upload(self):
+        c = self._client()
+        # The form request passes, the upload fails.
+        self.server.errors.extend([None, (500, {})])
+        assert_raises(CkanApiError, c.storage_file_upload, self.path,
+                      'parcels.zip', skip_unchanged=False)
+        assert 'parcels.zip' not in self.server.files
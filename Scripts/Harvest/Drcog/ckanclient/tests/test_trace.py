@@ -0,0 +1,51 @@
+import logging
+import sys
+from StringIO import StringIO
+
+from nose.tools import assert_equal
+
+import ckanclient
+from ckanclient import CkanClient, KeepAliveTransport
+from ckanclient.tests.fake_ckan import FakeCkanServer
+
+
+class TestTrace(object):
+
+    def setup(self):
+        self.server = FakeCkanServer()
+        self.server.add_package('package00', notes='x' * 5000)
+        self.server.start()
+        # As a logging config with a DEBUG root handler would
+        self.log = StringIO()
+        self.handler = logging.StreamHandler(self.log)
+        self.handler.setLevel(logging.DEBUG)
+        self.root_level = logging.root.level
+        logging.root.addHandler(self.handler)
+        logging.root.setLevel(logging.NOTSET)
+        self.stdout = sys.stdout
+        sys.stdout = StringIO()
+
+    def teardown(self):
+        sys.stdout = self.stdout
+        logging.root.removeHandler(self.handler)
+        logging.root.setLevel(self.root_level)
+        self.server.stop()
+
+    def _get(self, is_verbose):
+        c = CkanClient(base_location=self.server.base_location,
+                       transport=KeepAliveTransport(), is_verbose=is_verbose)
+        c.package_entity_get('package00')
+
+    def test_01_quiet_by_default(self):
+        self._get(False)
+        assert_equal(self.log.getvalue(), '')
+        assert_equal(sys.stdout.getvalue(), '')
+
+    def test_02_verbose_bodies_truncated(self):
+        self._get(True)
+        output = sys.stdout.getvalue()
+        assert 'ckanclient: last body' in output
+        assert 'x' * 5000 not in output
+        assert '... (' in output
+        assert len(output) < 4 * ckanclient.TRACE_LENGTH + 1000
+        assert_equal(self.log.getvalue(), output)
@@ -0,0 +1,149 @@
+'''Concurrent crawl of web pages, limited per host.
+
+    crawler = Crawler(fetch, workers=8, per_host=4)
+    for item in crawler.crawl(start_urls, parse):
+        print item
+    print crawler.stats()
+
+fetch(url) returns a page and parse(url, page) returns the items found on it
+and the URLs of further pages to crawl. Pages are fetched on a pool of
+threads as soon as they are found, and each URL is fetched and each item
+yielded only once. URLs differing only in the order of their query
+parameters or their fragment are the same page, see normalize_url().
+'''
+import threading
+import time
+from urllib import urlencode
+from urlparse import urlsplit, urlunsplit, parse_qsl
+
+try:
+    from Queue import Queue, Empty
+except ImportError:
+    # Forward compatibility with Py3k
+    from queue import Queue, Empty
+
+from ckanclient.workers import WorkerPool
+
+
+def normalize_url(url):
+    '''Returns url with its query parameters sorted and without its
+    fragment, so that links to the same page compare equal.'''
+    scheme, netloc, path, query, fragment = urlsplit(url)
+    query = urlencode(sorted(parse_qsl(query, keep_blank_values=True)))
+    return urlunsplit((scheme, netloc, path, query, ''))
+
+
+class HostLimiter(object):
+    '''Allows at most `connections` requests at a time to any one host, each
+    started at least `delay` seconds after the previous one to that host.'''
+
+    def __init__(self, connections=2, delay=0):
+        self.connections = connections
+        self.delay = delay
+        self._lock = threading.Condition()
+        self._active = {}
+        self._next_start = {}
+        self.wait_seconds = 0.0
+
+    def acquire(self, url):
+        host = urlsplit(url)[1]
+        start = time.time()
+        self._lock.acquire()
+        try:
+            while self._active.get(host, 0) >= self.connections:
+                self._lock.wait()
+            self._active[host] = self._active.get(host, 0) + 1
+            now = time.time()
+            begin = max(now, self._next_start.get(host, 0))
+            self._next_start[host] = begin + self.delay
+        finally:
+            self._lock.release()
+        if begin > now:
+            time.sleep(begin - now)
+        self._lock.acquire()
+        self.wait_seconds += time.time() - start
+        self._lock.release()
+
+    def release(self, url):
+        host = urlsplit(url)[1]
+        self._lock.acquire()
+        try:
+            self._active[host] -= 1
+            self._lock.notify_all()
+        finally:
+            self._lock.release()
+
+
+class Crawler(object):
+    '''Crawls pages on `workers` threads, at most `per_host` at a time from
+    any one host and started `delay` seconds apart.
+
+    A page that cannot be fetched or parsed stops the crawl, raising the
+    error from crawl(), as a partial list of items is not safe to act on.
+    '''
+
+    def __init__(self, fetch, workers=8, per_host=4, delay=0):
+        self.fetch = fetch
+        self.workers = workers
+        self.hosts = HostLimiter(per_host, delay)
+        self._stats = {'pages': 0, 'items': 0, 'duplicate_items': 0,
+                       'duplicate_urls': 0, 'seconds': 0.0}
+
+    def crawl(self, urls, parse):
+        '''Crawls from the start urls, yielding new items as they are
+        found.'''
+        start = time.time()
+        seen_urls = set()
+        seen_items = set()
+        done = Queue()
+        pending = [0]
+        pool = WorkerPool(self.workers)
+
+        def submit(url):
+            key = normalize_url(url)
+            if key in seen_urls:
+                self._stats['duplicate_urls'] += 1
+                return
+            seen_urls.add(key)
+            pending[0] += 1
+            pool.submit(self._visit, url, parse).add_done_callback(done.put)
+
+        try:
+            for url in urls:
+                submit(url)
+            while pending[0]:
+                try:
+                    # Wait in slices so that KeyboardInterrupt gets through.
+                    future = done.get(True, 0.5)
+                except Empty:
+                    continue
+                pending[0] -= 1
+                items, links = future.result()
+                self._stats['pages'] += 1
+                for link in links:
+                    submit(link)
+                for item in items:
+                    if item in seen_items:
+                        self._stats['duplicate_items'] += 1
+                        continue
+                    seen_items.add(item)
+                    self._stats['items'] += 1
+                    yield item
+        finally:
+            self._stats['seconds'] += time.time() - start
+            pool.shutdown(wait=False)
+
+    def _visit(self, url, parse):
+        self.hosts.acquire(url)
+        try:
+            page = self.fetch(url)
+        finally:
+            self.hosts.release(url)
+        return parse(url, page)
+
+    def stats(self):
+        '''Returns a copy of the counters, with the seconds spent waiting
+        on the per host limits.'''
+        stats = dict(self._stats)
+        stats['host_wait_seconds'] = self.hosts.wait_seconds
+        return stats
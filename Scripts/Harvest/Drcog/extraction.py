@@ -0,0 +1,114 @@
+'''Declarative specs of the elements a scraper reads from a page.
+
+    dataset_page = ExtractionSpec(('h1', {'id': 'page-title'}),
+                                  ('div', {'class': 'terms'}))
+    soup = dataset_page.parse(html)
+    soup.find('h1', {'id': 'page-title'})
+
+The spec is compiled once into a SoupStrainer, so parsing a page only builds
+the matching elements and what is inside them, not the whole document.
+
+parse_stream() parses a page as it is read from a file-like object, such as
+an HTTP response, without first reading it into one string.
+'''
+import codecs
+import re
+
+from bs4 import BeautifulSoup, SoupStrainer
+from bs4.builder._htmlparser import HTMLParserTreeBuilder, \
+    BeautifulSoupHTMLParser
+
+META_CHARSET = re.compile(r'<meta[^>]+charset=["\']?([-\w]+)', re.I)
+
+
+class ExtractionSpec(object):
+    '''The elements read from a kind of page, as (tag name, attributes)
+    pairs. An element matches if it has every attribute given. An
+    attribute's value may be a string, True for any value, or a function
+    called with the value. A 'class' string matches any one of the
+    element's classes.'''
+
+    def __init__(self, *elements):
+        self.elements = elements
+        self._attrs_by_name = {}
+        for name, attrs in elements:
+            self._attrs_by_name.setdefault(name, []).append(attrs)
+        self.strainer = SoupStrainer(self.matches)
+
+    def matches(self, name, attrs):
+        '''Returns whether a tag, with attrs as a dict or list of pairs,
+        is one of the elements.'''
+        wanted = self._attrs_by_name.get(name)
+        if wanted is None:
+            return False
+        attrs = dict(attrs)
+        for element_attrs in wanted:
+            for attr, match in element_attrs.items():
+                if not self._matches(attr, attrs.get(attr), match):
+                    break
+            else:
+                return True
+        return False
+
+    def _matches(self, attr, value, match):
+        if value is None:
+            return False
+        if isinstance(value, list):
+            value = ' '.join(value)
+        if match is True:
+            return True
+        if callable(match):
+            return match(value)
+        if attr == 'class':
+            return match in value.split()
+        return value == match
+
+    def parse(self, html):
+        '''Returns the soup of the matching elements of the page.'''
+        return BeautifulSoup(html, parse_only=self.strainer)
+
+    def parse_stream(self, fp, encoding=None, chunk_size=16384):
+        '''Returns the soup of the matching elements of the page read from
+        fp. See parse_stream().'''
+        return parse_stream(fp, self.strainer, encoding, chunk_size)
+
+
+def parse_stream(fp, parse_only=None, encoding=None, chunk_size=16384):
+    '''Returns the soup of the page read from the file-like object fp,
+    chunk_size bytes at a time. Each chunk is decoded and fed to the parser
+    as it is read, so the page is never held whole.
+
+    encoding defaults to the charset of a meta tag in the first chunk, or
+    else UTF-8. The page is always parsed with html.parser, the only
+    builder bs4 can feed a chunk at a time.'''
+    builder = HTMLParserTreeBuilder()
+    soup = BeautifulSoup('', builder=builder, parse_only=parse_only)
+    # BeautifulSoup only parses whole strings, so drive the parser it would
+    # use directly.
+    builder.soup = soup
+    soup.reset()
+    args, kwargs = builder.parser_args
+    parser = BeautifulSoupHTMLParser(*args, **kwargs)
+    parser.soup = soup
+    decoder = None
+    while True:
+        data = fp.read(chunk_size)
+        if decoder is None:
+            if encoding is None:
+                match = META_CHARSET.search(data)
+                encoding = match and match.group(1) or 'utf-8'
+            try:
+                decoder = codecs.getincrementaldecoder(encoding)('replace')
+            except LookupError:
+                decoder = codecs.getincrementaldecoder('utf-8')('replace')
+        if not data:
+            break
+        parser.feed(decoder.decode(data))
+    parser.feed(decoder.decode('', True))
+    parser.close()
+    # Close out any unfinished strings and close all the open tags.
+    soup.endData()
+    while soup.currentTag.name != soup.ROOT_TAG_NAME:
+        soup.popTag()
+    builder.soup = None
+    return soup
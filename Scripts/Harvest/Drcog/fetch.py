@@ -0,0 +1,135 @@
+'''Fetches and parses web pages over pooled keep-alive connections.
+
+    fetcher = PageFetcher()
+    soup, validators = fetcher.fetch(url, spec)
+    print fetcher.stats()
+    fetcher.dump('fetch.json')
+
+Each response is parsed as it arrives, a chunk at a time (see
+extraction.parse_stream), and the bytes and time taken are counted per URL.
+'''
+import re
+import threading
+import time
+import urllib2
+
+try: # since python 2.6
+    import json
+except ImportError:
+    import simplejson as json
+
+from ckanclient import KeepAliveTransport
+import extraction
+
+CHARSET = re.compile(r'charset=["\']?([-\w]+)', re.I)
+
+
+class _CountingReader(object):
+    '''Reads a response, counting the bytes.'''
+
+    def __init__(self, response):
+        self.response = response
+        self.bytes = 0
+
+    def read(self, amt):
+        data = self.response.read(amt)
+        self.bytes += len(data)
+        return data
+
+
+class PageFetcher(object):
+    '''Fetches pages, reusing up to `connections` idle connections per host.
+    Safe to share between threads.
+
+    :param connections: default *4*
+    :param timeout: socket timeout in seconds, default *60*
+    :param chunk_size: bytes read and parsed at a time, default *16KB*
+    '''
+
+    def __init__(self, connections=4, timeout=60, chunk_size=16384):
+        self.transport = KeepAliveTransport(pool_size=connections,
+                                            timeout=timeout)
+        self.chunk_size = chunk_size
+        self._lock = threading.Lock()
+        self._urls = {}
+
+    def fetch(self, url, spec=None, validators=None):
+        '''Fetches and parses the page at url, only building the elements of
+        the extraction.ExtractionSpec if one is given. validators are
+        request headers making the request conditional.
+
+        Returns a tuple of the soup and a dict of the page's 'etag' and
+        'last_modified', or None if the server says it is not modified.'''
+        request = urllib2.Request(url, headers=validators or {})
+        start = time.time()
+        try:
+            response = self.transport.open(request)
+        except urllib2.HTTPError, e:
+            self._count(url, e.code, 0, time.time() - start)
+            if e.code == 304:
+                return None
+            raise
+        except:
+            self._count(url, None, 0, time.time() - start)
+            raise
+        headers = response.info()
+        match = CHARSET.search(headers.get('content-type', ''))
+        reader = _CountingReader(response)
+        try:
+            soup = extraction.parse_stream(reader,
+                spec and spec.strainer or None, match and match.group(1),
+                self.chunk_size)
+        finally:
+            # Only discards the connection if the page was not read to the
+            # end.
+            response.close()
+            self._count(url, response.code, reader.bytes, time.time() - start)
+        return soup, {'etag': headers.get('etag'),
+                      'last_modified': headers.get('last-modified')}
+
+    def _count(self, url, status, received, elapsed):
+        self._lock.acquire()
+        try:
+            counters = self._urls.get(url)
+            if counters is None:
+                counters = self._urls[url] = {
+                    'requests': 0, 'not_modified': 0, 'errors': 0,
+                    'bytes_received': 0, 'seconds': 0.0}
+            counters['requests'] += 1
+            if status == 304:
+                counters['not_modified'] += 1
+            elif status is None or status >= 400:
+                counters['errors'] += 1
+            counters['bytes_received'] += received
+            counters['seconds'] += elapsed
+        finally:
+            self._lock.release()
+
+    def url_stats(self):
+        '''Returns a dict of URL to its counters.'''
+        self._lock.acquire()
+        try:
+            return dict((url, dict(counters))
+                        for url, counters in self._urls.items())
+        finally:
+            self._lock.release()
+
+    def stats(self):
+        '''Returns the counters summed over all URLs, with the connection
+        pool's counters.'''
+        stats = {'urls': 0, 'requests': 0, 'not_modified': 0, 'errors': 0,
+                 'bytes_received': 0, 'seconds': 0.0}
+        for counters in self.url_stats().values():
+            stats['urls'] += 1
+            for key, value in counters.items():
+                stats[key] += value
+        stats['connections'] = self.transport.stats()
+        return stats
+
+    def dump(self, path):
+        '''Writes url_stats() to path as JSON.'''
+        out = open(path, 'w')
+        try:
+            json.dump(self.url_stats(), out, indent=2, sort_keys=True)
+        finally:
+            out.close()
@@ -0,0 +1,130 @@
+'''Stages of work on their own threads, joined by bounded queues.
+
+    scrape = Stage('scrape', get_page, workers=8)
+    publish = Stage('publish', put_page, workers=4)
+    for result in publish.run(scrape.run(urls)):
+        print result
+    print scrape.stats(), publish.stats()
+
+Each stage takes items from the one before as its threads become free. Once
+`queue_size` of its results are waiting, its threads block, so a slow stage
+holds back the stages before it instead of their results piling up.
+'''
+import sys
+import threading
+import time
+
+try:
+    from Queue import Queue, Empty
+except ImportError:
+    # Forward compatibility with Py3k
+    from queue import Queue, Empty
+
+
+class Stage(object):
+    '''Calls func on each item on `workers` threads.
+
+    stats() tells where the stage spends its time: busy in func, starved
+    waiting for items from the stage before, or blocked waiting for the
+    stage after to take its results.
+
+    :param name: names the stage in reports
+    :param func: called with each item, returns the result
+    :param workers: number of threads, default *4*
+    :param queue_size: results held before the threads block, default
+        twice the number of workers
+    '''
+
+    def __init__(self, name, func, workers=4, queue_size=None):
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.queue_size = queue_size or 2 * workers
+        self._lock = threading.Lock()
+        self._stats = {'items': 0, 'seconds': 0.0, 'busy_seconds': 0.0,
+                       'starved_seconds': 0.0, 'blocked_seconds': 0.0}
+
+    def run(self, items):
+        '''Yields the result for each item of the iterable, in the order
+        they finish. An exception raised by func, or by the iterable,
+        stops the stage and is raised here.'''
+        items = iter(items)
+        input_lock = threading.Lock()
+        results = Queue(self.queue_size)
+        stop = threading.Event()
+
+        def work():
+            try:
+                while not stop.is_set():
+                    began = time.time()
+                    input_lock.acquire()
+                    try:
+                        try:
+                            item = next(items)
+                        except StopIteration:
+                            break
+                    finally:
+                        input_lock.release()
+                        self._add('starved_seconds', time.time() - began)
+                    began = time.time()
+                    result = self.func(item)
+                    self._add('busy_seconds', time.time() - began)
+                    began = time.time()
+                    results.put((True, result))
+                    self._add('blocked_seconds', time.time() - began)
+            except:
+                results.put((False, sys.exc_info()))
+            finally:
+                results.put(None)
+
+        start = time.time()
+        threads = []
+        for i in range(self.workers):
+            thread = threading.Thread(target=work)
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+        finished = 0
+        try:
+            while finished < len(threads):
+                try:
+                    # Wait in slices so that KeyboardInterrupt gets through.
+                    entry = results.get(True, 0.5)
+                except Empty:
+                    continue
+                if entry is None:
+                    finished += 1
+                    continue
+                succeeded, value = entry
+                if not succeeded:
+                    raise value[0], value[1], value[2]
+                self._add('items', 1)
+                yield value
+        finally:
+            # Let the threads finish the items they have started.
+            stop.set()
+            while [thread for thread in threads if thread.is_alive()]:
+                try:
+                    results.get(True, 0.1)
+                except Empty:
+                    pass
+            self._add('seconds', time.time() - start)
+
+    def _add(self, stat, value):
+        self._lock.acquire()
+        try:
+            self._stats[stat] += value
+        finally:
+            self._lock.release()
+
+    def stats(self):
+        '''Returns a copy of the counters, with the items per second.'''
+        self._lock.acquire()
+        try:
+            stats = dict(self._stats)
+        finally:
+            self._lock.release()
+        stats['items_per_second'] = None
+        if stats['seconds']:
+            stats['items_per_second'] = stats['items'] / stats['seconds']
+        return stats
@@ -0,0 +1,47 @@
+'''Plans the changes that make a target catalog match its source.
+
+    plan = reconcile(drcog_slugs, ckan_datasets,
+                     source_key=lambda slug: 'drcog-' + slug,
+                     target_key=lambda dataset: dataset['name'])
+    for slug in plan.create: ...
+    for slug, dataset in plan.update: ...
+    for dataset in plan.delete: ...
+
+Each side is indexed by key once, so planning takes time linear in the size
+of the two catalogs.
+'''
+from collections import namedtuple
+
+# create is a list of source items without a target, update a list of
+# (source, target) pairs with the same key, and delete a list of target
+# items without a source. Each list keeps the order of its input.
+Plan = namedtuple('Plan', 'create update delete')
+
+
+def reconcile(source, target, source_key=None, target_key=None):
+    '''Returns the Plan matching the items of the source and target
+    iterables by key. source_key(item) and target_key(item) return the key
+    of an item, by default the item itself.'''
+    source_key = source_key or (lambda item: item)
+    target_key = target_key or (lambda item: item)
+    targets = {}
+    target_order = []
+    for item in target:
+        key = target_key(item)
+        if key not in targets:
+            target_order.append(key)
+        targets[key] = item
+    create = []
+    update = []
+    matched = set()
+    for item in source:
+        key = source_key(item)
+        if key in matched:
+            continue
+        matched.add(key)
+        if key in targets:
+            update.append((item, targets[key]))
+        else:
+            create.append(item)
+    delete = [targets[key] for key in target_order if key not in matched]
+    return Plan(create, update, delete)
@@ -0,0 +1,122 @@
+'''What was last published for each dataset, kept between runs.
+
+    state = SyncState('cache/drcog_sync_state.json')
+    digest = state.digest(entity)
+    if state.changed(slug, digest):
+        publish(entity)
+        state.published(slug, digest, validators)
+    state.save()
+
+For each dataset slug the state holds a hash of the scraped entity, when it
+was last published, and the ETag / Last-Modified of its page, so unchanged
+datasets can be skipped without scraping them or calling CKAN.
+'''
+import datetime
+import hashlib
+import os
+import threading
+
+try: # since python 2.6
+    import json
+except ImportError:
+    import simplejson as json
+
+
+class SyncState(object):
+    '''Dataset states by slug, kept in a JSON file at `path`. Safe to use
+    from many threads.'''
+
+    def __init__(self, path):
+        self.path = path
+        self._datasets = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    def __len__(self):
+        return len(self._datasets)
+
+    def digest(self, entity):
+        '''Returns a hash of the entity, the same whatever the order of its
+        keys and tags.'''
+        entity = dict(entity)
+        if 'tags' in entity:
+            entity['tags'] = sorted(entity['tags'])
+        return hashlib.md5(json.dumps(entity, sort_keys=True)).hexdigest()
+
+    def changed(self, slug, digest):
+        '''Returns whether the dataset differs from when it was last
+        published.'''
+        self._lock.acquire()
+        try:
+            return self._datasets.get(slug, {}).get('hash') != digest
+        finally:
+            self._lock.release()
+
+    def validators(self, slug):
+        '''Returns the request headers to fetch the dataset page only if it
+        has changed since it was last published.'''
+        self._lock.acquire()
+        try:
+            dataset = self._datasets.get(slug, {})
+        finally:
+            self._lock.release()
+        headers = {}
+        if dataset.get('etag'):
+            headers['If-None-Match'] = dataset['etag']
+        if dataset.get('last_modified'):
+            headers['If-Modified-Since'] = dataset['last_modified']
+        return headers
+
+    def published(self, slug, digest, validators=None):
+        '''Records that the dataset with this hash is on CKAN, with the
+        page's ETag and Last-Modified in `validators`.'''
+        validators = validators or {}
+        self._lock.acquire()
+        try:
+            self._datasets[slug] = {
+                'hash': digest,
+                'published': datetime.datetime.utcnow().isoformat(),
+                'etag': validators.get('etag'),
+                'last_modified': validators.get('last_modified')}
+        finally:
+            self._lock.release()
+
+    def prune(self, slugs):
+        '''Forgets the datasets not in `slugs`.'''
+        slugs = set(slugs)
+        self._lock.acquire()
+        try:
+            for slug in list(self._datasets):
+                if slug not in slugs:
+                    del self._datasets[slug]
+        finally:
+            self._lock.release()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        state_file = open(self.path, 'rb')
+        try:
+            self._datasets = json.load(state_file)['datasets']
+        finally:
+            state_file.close()
+
+    def save(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self._lock.acquire()
+        try:
+            datasets = dict(self._datasets)
+        finally:
+            self._lock.release()
+        temp_path = self.path + '.tmp'
+        out = open(temp_path, 'wb')
+        try:
+            json.dump({'datasets': datasets}, out, indent=1, sort_keys=True)
+        finally:
+            out.close()
+        if os.name == 'nt' and os.path.exists(self.path):
+            # rename does not replace an existing file on Windows.
+            os.remove(self.path)
+        os.rename(temp_path, self.path)
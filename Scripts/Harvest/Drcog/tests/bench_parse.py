@@ -0,0 +1,82 @@
+'''Parse time and memory of the DRCOG pages, whole against the DrcogSync
+extraction specs.
+
+For each page fixture, reports the milliseconds per parse, the elements
+built, and the peak RSS of a fresh interpreter holding that many parsed
+copies of the page, above that of one that parses nothing.
+
+    python -m tests.bench_parse [copies]
+'''
+import resource
+import subprocess
+import sys
+import time
+
+from bs4 import BeautifulSoup
+
+import DrcogSync
+from tests.replay import read_fixture
+
+# Fixture file and the DrcogSync spec used to scrape it
+PAGES = [('subjects.html', 'subjects_page_spec'),
+         ('dataset_list.html', 'dataset_list_page_spec'),
+         ('dataset.html', 'dataset_page_spec')]
+
+
+def parse(html, spec_name):
+    if spec_name is None:
+        return BeautifulSoup(html)
+    return getattr(DrcogSync, spec_name).parse(html)
+
+
+def timed(html, spec_name, repeat=20):
+    '''Returns the best milliseconds per parse, and the soup.'''
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        soup = parse(html, spec_name)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best * 1000, soup
+
+
+def child(name, spec_name, copies):
+    '''Parses copies of the page, keeping them, and prints the peak RSS
+    in KB.'''
+    soups = []
+    if spec_name != 'baseline':
+        html = read_fixture(name)
+        if spec_name == 'whole':
+            spec_name = None
+        for i in range(copies):
+            soups.append(parse(html, spec_name))
+    print resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def measure(name, spec_name, copies):
+    output = subprocess.check_output([sys.executable, '-m',
+        'tests.bench_parse', '--child', name, spec_name, str(copies)])
+    return int(output)
+
+
+def main():
+    if sys.argv[1:2] == ['--child']:
+        child(sys.argv[2], sys.argv[3], int(sys.argv[4]))
+        return
+    copies = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    baseline = measure(PAGES[0][0], 'baseline', copies)
+    for name, spec_name in PAGES:
+        html = read_fixture(name)
+        print '%s, %.1f KB, %d copies held' % (name, len(html) / 1024.0,
+                                               copies)
+        for mode, mode_spec in (('whole', None), ('spec', spec_name)):
+            ms, soup = timed(html, mode_spec)
+            elements = len(soup.find_all(True))
+            peak = measure(name, mode_spec or 'whole', copies)
+            print '  %-6s %6.2f ms/page  %5d elements  peak RSS +%6.1f MB' % (
+                mode, ms, elements, (peak - baseline) / 1024.0)
+
+
+if __name__ == '__main__':
+    main()
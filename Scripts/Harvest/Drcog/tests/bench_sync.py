@@ -0,0 +1,184 @@
+'''End to end timing of DrcogSync against local stand-ins for the DRCOG
+catalog (tests.replay) and the CKAN API (ckanclient.tests.fake_ckan).
+
+Runs a sync into an empty CKAN, then a repeat sync with one dataset removed
+from the catalog and nothing else changed, and reports the seconds and items
+of each step. The repeat sync has to delete the removed dataset from CKAN. Each server answers after a
+fixed latency and can fail a fraction of requests with a 503.
+
+    python -m tests.bench_sync [--pages-per-subject 2] [--datasets-per-page 10]
+        [--drcog-latency 0.01] [--ckan-latency 0.01]
+        [--drcog-error-rate 0] [--ckan-error-rate 0] [--ckan-rate R]
+        [--recording DIR] [--save-recording DIR]
+        [--report report.json] [--compare previous-report.json]
+
+Write a report on one commit and compare against it on another to see the
+change in each step.
+'''
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+try: # since python 2.6
+    import json
+except ImportError:
+    import simplejson as json
+
+from ckanclient.tests.fake_ckan import FakeCkanServer
+
+import DrcogSync
+from tests.replay import DATASET_PATH, ReplayServer, synthetic_catalog, \
+    remove_dataset, save_recording, load_recording
+
+RUNS = ('initial', 'repeat')
+
+
+def configure(directory, drcog, ckan, ckan_rate):
+    '''Points DrcogSync at the servers, with fresh connections and counters,
+    keeping its state between runs in directory.'''
+    DrcogSync.base_url = drcog.base_url
+    DrcogSync.ckan_host = ckan.base_location + '/2'
+    DrcogSync.ckan_key = 'bench'
+    DrcogSync.ckan_rate = ckan_rate
+    DrcogSync.sync_full = False
+    DrcogSync.configure(directory)
+
+
+def run(directory, drcog, ckan, ckan_rate, verbose):
+    '''Returns the steps of a sync, and the requests each server got.'''
+    configure(directory, drcog, ckan, ckan_rate)
+    drcog_requests = drcog.stats()['requests']
+    ckan_requests = len(ckan.requests)
+    stdout = sys.stdout
+    if not verbose:
+        sys.stdout = open(os.devnull, 'w')
+    try:
+        steps = DrcogSync.synchronize()
+    finally:
+        if not verbose:
+            sys.stdout.close()
+            sys.stdout = stdout
+    return {'steps': steps,
+            'drcog_requests': drcog.stats()['requests'] - drcog_requests,
+            'ckan_requests': len(ckan.requests) - ckan_requests}
+
+
+def commit():
+    '''Returns the git commit of the working tree, if any.'''
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short',
+            'HEAD'], stderr=open(os.devnull, 'w')).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(report, previous=None):
+    print 'DrcogSync benchmark at %s: %s' % (report['commit'],
+        ', '.join('%s %s' % (key, value) for key, value
+                  in sorted(report['config'].items()) if value is not None))
+    for name in RUNS:
+        result = report['runs'][name]
+        print '%s run: %d DRCOG requests, %d CKAN requests' % (name,
+            result['drcog_requests'], result['ckan_requests'])
+        before = {}
+        if previous is not None and name in previous['runs']:
+            before = dict(previous['runs'][name]['steps'])
+        for step, stats in result['steps']:
+            line = '  %-14s %8.2f s %6d items' % (step, stats['seconds'],
+                                                  stats['items'])
+            if stats['seconds'] and stats['items']:
+                line += ' %8.1f items/s' % (stats['items'] / stats['seconds'])
+            else:
+                line += ' ' * 16
+            old = before.get(step)
+            if old is not None and old['seconds']:
+                line += '  was %8.2f s (%+.0f%%)' % (old['seconds'],
+                    (stats['seconds'] / old['seconds'] - 1) * 100)
+            print line
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Times DrcogSync against '
+        'local stand-ins for the DRCOG catalog and the CKAN API')
+    parser.add_argument('--pages-per-subject', type=int, default=2)
+    parser.add_argument('--datasets-per-page', type=int, default=10)
+    parser.add_argument('--drcog-latency', type=float, default=0.01,
+        help='Seconds the catalog takes to answer each request')
+    parser.add_argument('--ckan-latency', type=float, default=0.01,
+        help='Seconds CKAN takes to answer each request')
+    parser.add_argument('--drcog-error-rate', type=float, default=0,
+        help='Fraction of catalog requests answered with a 503')
+    parser.add_argument('--ckan-error-rate', type=float, default=0,
+        help='Fraction of CKAN requests answered with a 503')
+    parser.add_argument('--ckan-rate', type=float, default=None,
+        help='CKAN requests per second, by default no limit')
+    parser.add_argument('--seed', type=int, default=0,
+        help='Seed of the error injection')
+    parser.add_argument('--recording',
+        help='Replay the catalog recorded in this directory')
+    parser.add_argument('--save-recording',
+        help='Save the catalog replayed to this directory')
+    parser.add_argument('--report', help='Write the report to this file')
+    parser.add_argument('--compare', help='Compare with this report')
+    parser.add_argument('--verbose', action='store_true',
+        help='Show what DrcogSync prints')
+    args = parser.parse_args()
+
+    if args.recording:
+        pages = load_recording(args.recording)
+    else:
+        pages = synthetic_catalog(args.pages_per_subject,
+                                  args.datasets_per_page)
+    if args.save_recording:
+        save_recording(pages, args.save_recording)
+
+    drcog = ReplayServer(pages, latency=args.drcog_latency,
+                         error_rate=args.drcog_error_rate, seed=args.seed)
+    ckan = FakeCkanServer(latency=args.ckan_latency,
+                          error_rate=args.ckan_error_rate, seed=args.seed)
+    ckan.add_group(DrcogSync.ckan_group)
+    directory = tempfile.mkdtemp()
+    drcog.start()
+    ckan.start()
+    try:
+        runs = {}
+        for name in RUNS:
+            if name == 'repeat':
+                removed = sorted(path for path in pages
+                                 if path.startswith(DATASET_PATH))[0]
+                remove_dataset(pages, removed[len(DATASET_PATH):])
+            runs[name] = run(directory, drcog, ckan, args.ckan_rate,
+                             args.verbose)
+    finally:
+        drcog.stop()
+        ckan.stop()
+        shutil.rmtree(directory)
+
+    config = dict((key, value) for key, value in vars(args).items()
+                  if key not in ('report', 'compare', 'verbose',
+                                 'save_recording'))
+    report = {'commit': commit(), 'config': config, 'runs': runs}
+    previous = None
+    if args.compare:
+        previous_file = open(args.compare, 'rb')
+        try:
+            previous = json.load(previous_file)
+        finally:
+            previous_file.close()
+    print_report(report, previous)
+    if args.report:
+        report_file = open(args.report, 'wb')
+        try:
+            json.dump(report, report_file, indent=1, sort_keys=True)
+        finally:
+            report_file.close()
+    deleted = dict(runs['repeat']['steps'])['CKAN delete']['items']
+    if not deleted:
+        sys.exit('The repeat run deleted no datasets from CKAN')
+
+
+if __name__ == '__main__':
+    main()
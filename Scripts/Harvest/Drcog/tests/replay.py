@@ -0,0 +1,266 @@
+'''A stand-in for the DRCOG data catalog, replaying recorded pages from a
+background thread, and the page fixtures the tests and benchmarks share.
+
+    server = ReplayServer(synthetic_catalog(), latency=0.01)
+    server.start()
+    DrcogSync.base_url = server.base_url
+    ...
+    server.stop()
+
+Pages are kept by path and query string, as the body or a (content type,
+body) tuple. A recording is a directory of page files with a pages.json
+manifest of the path of each (see save_recording). fixture_pages() serves
+the fixtures themselves.
+synthetic_catalog() builds a catalog of any size from the page fixtures,
+and remove_dataset() takes a dataset out of one.
+'''
+import hashlib
+import os
+import random
+import re
+import socket
+import threading
+import time
+import BaseHTTPServer
+import SocketServer
+
+try: # since python 2.6
+    import json
+except ImportError:
+    import simplejson as json
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'fixtures')
+
+SUBJECTS_PATH = ('/datacatalog/content/welcome-regional-data-catalog'
+                 '?quicktabs_tabbed_menu_homepage=1')
+SUBJECT_PATH = '/datacatalog/subjects/'
+DATASET_PATH = '/datacatalog/content/'
+
+NODE = re.compile(r'<div id="node-\d+" class="node node-teaser.*?</ul>\n'
+                  r'</div></div>', re.S)
+PAGER = re.compile(r'<div class="item-list"><ul class="pager">.*?</ul></div>',
+                   re.S)
+SUBJECT_LINK = re.compile(r'href="%s([-\w]+)"' % SUBJECT_PATH)
+
+
+def read_fixture(name):
+    fixture = open(os.path.join(FIXTURES, name), 'rb')
+    try:
+        return fixture.read()
+    finally:
+        fixture.close()
+
+
+def fixture_pages():
+    '''Returns the page fixtures, by path /<file name>.'''
+    return dict(('/' + name, read_fixture(name))
+                for name in os.listdir(FIXTURES))
+
+
+def synthetic_catalog(pages_per_subject=2, datasets_per_page=10):
+    '''Returns the pages of a catalog with the subjects of the subjects
+    fixture, each listing a different `pages_per_subject` *
+    `datasets_per_page` datasets, built from the dataset list and dataset
+    page fixtures.'''
+    subjects_page = read_fixture('subjects.html')
+    list_page = read_fixture('dataset_list.html')
+    dataset_page = read_fixture('dataset.html')
+    nodes = list(NODE.finditer(list_page))
+    node = nodes[0].group(0)
+    node_slug = re.search(r'href="%s([-\w]+)"' % DATASET_PATH, node).group(1)
+    before = list_page[:nodes[0].start()]
+    after = PAGER.sub('%(pager)s', list_page[nodes[-1].end():]
+                      .replace('%', '%%'))
+    pages = {SUBJECTS_PATH: subjects_page}
+    subjects = []
+    for subject in SUBJECT_LINK.findall(subjects_page):
+        if subject not in subjects:
+            subjects.append(subject)
+    last = pages_per_subject - 1
+    for subject in subjects:
+        subject_path = SUBJECT_PATH + subject
+        for page in range(pages_per_subject):
+            slugs = ['%s-dataset-%d-%02d' % (subject, page, i)
+                     for i in range(datasets_per_page)]
+            pager = []
+            if page < last:
+                pager.append('<li class="pager-next"><a href="%s?page=%d">'
+                             'next &rsaquo;</a></li>' % (subject_path,
+                                                         page + 1))
+                pager.append('<li class="pager-last last"><a href="%s?page=%d">'
+                             'last &raquo;</a></li>' % (subject_path, last))
+            path = subject_path
+            if page:
+                path += '?page=%d' % page
+            pages[path] = (before +
+                '\n'.join(node.replace(node_slug, slug) for slug in slugs) +
+                after % {'pager': '<div class="item-list"><ul class="pager">'
+                                  '%s</ul></div>' % ''.join(pager)})
+            for slug in slugs:
+                title = slug.replace('-', ' ').title()
+                pages[DATASET_PATH + slug] = dataset_page.replace(
+                    'Regional Roadways', title)
+    return pages
+
+
+def remove_dataset(pages, slug):
+    '''Removes the dataset slug from pages: its page, and its node on the
+    dataset lists.'''
+    del pages[DATASET_PATH + slug]
+    link = 'href="%s%s"' % (DATASET_PATH, slug)
+    def remove_node(node):
+        if link in node.group(0):
+            return ''
+        return node.group(0)
+    for path, body in pages.items():
+        if path.startswith(SUBJECT_PATH) and link in body:
+            pages[path] = NODE.sub(remove_node, body)
+
+
+def save_recording(pages, directory):
+    '''Writes the pages, by path, to a recording in directory.'''
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    manifest = {}
+    for path, body in pages.items():
+        name = '%s.html' % hashlib.md5(path).hexdigest()
+        manifest[path] = name
+        page_file = open(os.path.join(directory, name), 'wb')
+        try:
+            page_file.write(body)
+        finally:
+            page_file.close()
+    manifest_file = open(os.path.join(directory, 'pages.json'), 'wb')
+    try:
+        json.dump(manifest, manifest_file, indent=1, sort_keys=True)
+    finally:
+        manifest_file.close()
+
+
+def load_recording(directory):
+    '''Returns the pages, by path, of the recording in directory.'''
+    manifest_file = open(os.path.join(directory, 'pages.json'), 'rb')
+    try:
+        manifest = json.load(manifest_file)
+    finally:
+        manifest_file.close()
+    pages = {}
+    for path, name in manifest.items():
+        page_file = open(os.path.join(directory, name), 'rb')
+        try:
+            pages[str(path)] = page_file.read()
+        finally:
+            page_file.close()
+    return pages
+
+
+class ReplayServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    '''Serves the pages, by path, over HTTP/1.1 with an ETag so that
+    conditional requests for unchanged pages get a 304. Each response waits `latency` seconds,
+    and `error_rate` of them are a 503.'''
+
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+    def __init__(self, pages, latency=0, error_rate=0, seed=None):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0),
+                                           ReplayHandler)
+        self.pages = pages
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.sockets = []
+        self._stats = {'connections': 0, 'requests': 0, 'not_found': 0,
+                       'not_modified': 0, 'errors': 0, 'bytes_sent': 0}
+
+    @property
+    def base_url(self):
+        return 'http://127.0.0.1:%s' % self.server_address[1]
+
+    def url(self, path):
+        return self.base_url + path
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        # Drop any keep-alive connections the clients still hold open.
+        for sock in self.sockets:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+
+    def count(self, counter, amount=1):
+        self.lock.acquire()
+        try:
+            self._stats[counter] += amount
+        finally:
+            self.lock.release()
+
+    def stats(self):
+        '''Returns a copy of the counters.'''
+        self.lock.acquire()
+        try:
+            return dict(self._stats)
+        finally:
+            self.lock.release()
+
+
+class ReplayHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        self.server.lock.acquire()
+        self.server.sockets.append(self.connection)
+        self.server.lock.release()
+        self.server.count('connections')
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        server.count('requests')
+        if server.latency:
+            time.sleep(server.latency)
+        server.lock.acquire()
+        error = server.random.random() < server.error_rate
+        server.lock.release()
+        page = server.pages.get(self.path)
+        if error or page is None:
+            server.count('errors' if error else 'not_found')
+            self._send(error and 503 or 404, 'Error', 'text/plain')
+            return
+        content_type = 'text/html; charset=utf-8'
+        body = page
+        if isinstance(page, tuple):
+            content_type, body = page
+        etag = '"%s"' % hashlib.md5(body).hexdigest()
+        if self.headers.getheader('If-None-Match') == etag:
+            server.count('not_modified')
+            self._send(304, '', None, etag)
+            return
+        server.count('bytes_sent', len(body))
+        self._send(200, body, content_type, etag)
+
+    def _send(self, status, body, content_type, etag=None):
+        self.send_response(status)
+        if content_type:
+            self.send_header('Content-Type', content_type)
+        if etag:
+            self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
@@ -0,0 +1,67 @@
+import os
+import shutil
+import tempfile
+import threading
+
+from nose.tools import assert_equal
+
+from checkpoint import CheckpointJournal
+
+
+class TestCheckpointJournal(object):
+
+    def setup(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'cache', 'journal.jsonl')
+
+    def teardown(self):
+        shutil.rmtree(self.directory)
+
+    def test_01_resumes_recorded_work(self):
+        journal = CheckpointJournal(self.path)
+        journal.record('crawl', 'subjects', ['transportation', 'land-use'])
+        journal.record('scraped', 'roadways', [{'name': 'drcog-roadways'},
+                                               'abc', {'etag': None}])
+        journal.record('unchanged', 'parcels')
+        resumed = CheckpointJournal(self.path)
+        assert_equal(len(resumed), 3)
+        assert_equal(resumed.get('crawl', 'subjects'),
+                     ['transportation', 'land-use'])
+        assert_equal(resumed.get('scraped', 'roadways')[0]['name'],
+                     'drcog-roadways')
+        assert resumed.done('unchanged', 'parcels')
+        assert_equal(resumed.get('unchanged', 'parcels'), None)
+        assert not resumed.done('published', 'roadways')
+        assert_equal(resumed.counts(),
+                     {'crawl': 1, 'scraped': 1, 'unchanged': 1})
+
+    def test_02_line_cut_short_dropped(self):
+        journal = CheckpointJournal(self.path)
+        journal.record('page', 'http://example.com/1', [['a'], []])
+        journal._file.write('{"kind": "page", "key": "http://exa')
+        journal._file.close()
+        resumed = CheckpointJournal(self.path)
+        assert_equal(len(resumed), 1)
+        resumed.record('page', 'http://example.com/2', [['b'], []])
+        assert_equal(len(CheckpointJournal(self.path)), 2)
+
+    def test_03_complete_starts_afresh(self):
+        journal = CheckpointJournal(self.path)
+        journal.record('published', 'roadways', 'created')
+        journal.complete()
+        assert not os.path.exists(self.path)
+        assert_equal(len(journal), 0)
+        assert_equal(len(CheckpointJournal(self.path)), 0)
+
+    def test_04_record_from_threads(self):
+        journal = CheckpointJournal(self.path)
+        def record(thread):
+            for i in range(100):
+                journal.record('published', '%d-%d' % (thread, i), 'created')
+        threads = [threading.Thread(target=record, args=(thread,))
+                   for thread in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert_equal(len(CheckpointJournal(self.path)), 800)
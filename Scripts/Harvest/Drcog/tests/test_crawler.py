@@ -0,0 +1,51 @@
+import threading
+
+from nose.tools import assert_equal
+from bs4 import BeautifulSoup
+
+import DrcogSync
+from crawler import Crawler, normalize_url
+
+
+class TestCrawler(object):
+
+    def test_01_normalize_url(self):
+        assert_equal(normalize_url('http://h/p?b=2&a=1#top'),
+                     normalize_url('http://h/p?a=1&b=2'))
+        # Repeated and blank parameters are all kept
+        assert_equal(normalize_url('http://h/p?a=2&page=&a=1'),
+                     'http://h/p?a=1&a=2&page=')
+        assert normalize_url('http://h/p?a=1') != \
+            normalize_url('http://h/p?a=1&a=1')
+
+    def test_02_same_page_fetched_once(self):
+        page = 'http://h/list?page=1&sort=name&tag=a&tag=b'
+        links = {'http://h/start': [
+                     page,
+                     'http://h/list?tag=a&sort=name&page=1&tag=b',
+                     'http://h/list?sort=name&tag=a&tag=b&page=1#x'],
+                 page: []}
+        fetched = []
+        lock = threading.Lock()
+        def fetch(url):
+            lock.acquire()
+            fetched.append(url)
+            lock.release()
+            return links[url]
+        def parse(url, page):
+            return [url], page
+        crawler = Crawler(fetch, workers=2)
+        items = list(crawler.crawl(['http://h/start'], parse))
+        assert_equal(sorted(fetched), sorted(links))
+        assert_equal(len(items), 2)
+        assert_equal(crawler.stats()['duplicate_urls'], 2)
+
+    def test_03_pager_keeps_parameter_order(self):
+        soup = BeautifulSoup('<ul><li class="pager-last"><a href="/datacatalog'
+                             '/subjects/roads?sort=title&amp;page=2&amp;tag=a'
+                             '&amp;tag=b">last</a></li></ul>')
+        datasets, pages = DrcogSync.get_dataset_urls_from_page(
+            'http://h/datacatalog/subjects/roads', soup)
+        assert_equal(pages, ['http://h/datacatalog/subjects/roads?sort=title'
+                             '&page=%d&tag=a&tag=b' % page
+                             for page in (1, 2)])
@@ -0,0 +1,68 @@
+from nose.tools import assert_equal
+from bs4 import BeautifulSoup
+
+import DrcogSync
+from extraction import ExtractionSpec
+from tests.replay import read_fixture
+
+
+class TestExtractionSpec(object):
+
+    def test_01_matches(self):
+        spec = ExtractionSpec(('div', {'class': 'node'}),
+                              ('a', {'href': True}),
+                              ('h1', {'id': 'page-title'}))
+        assert spec.matches('div', [('class', 'node node-teaser')])
+        assert not spec.matches('div', {'class': 'nodes'})
+        assert not spec.matches('div', {})
+        assert spec.matches('a', {'href': '/'})
+        assert not spec.matches('a', {'name': 'top'})
+        assert not spec.matches('h1', {'id': 'title'})
+        assert not spec.matches('span', {'class': 'node'})
+
+    def test_02_only_matching_elements_parsed(self):
+        spec = ExtractionSpec(('li', {'class': 'pager-next'}))
+        soup = spec.parse(read_fixture('dataset_list.html'))
+        assert_equal([li.a.get('href') for li in soup.find_all('li')],
+                     ['/datacatalog/subjects/transportation?page=3'])
+
+
+class TestDrcogScrapers(object):
+    '''The DrcogSync specs read the same as parsing whole pages.'''
+
+    def _both(self, name, spec):
+        html = read_fixture(name)
+        return BeautifulSoup(html), spec.parse(html)
+
+    def test_01_subjects_page(self):
+        def subjects(soup):
+            return [link.get('href') for link in soup.find_all('a')
+                    if (link.get('href') or '').startswith(
+                        DrcogSync.subjects_url_prefix)]
+        whole, strained = self._both('subjects.html',
+                                     DrcogSync.subjects_page_spec)
+        assert_equal(subjects(strained), subjects(whole))
+        assert_equal(len(set(subjects(strained))), 24)
+
+    def test_02_dataset_list_page(self):
+        url = DrcogSync.base_url + '/datacatalog/subjects/transportation?page=2'
+        whole, strained = self._both('dataset_list.html',
+                                     DrcogSync.dataset_list_page_spec)
+        datasets, pages = DrcogSync.get_dataset_urls_from_page(url, strained)
+        assert_equal((datasets, pages),
+                     DrcogSync.get_dataset_urls_from_page(url, whole))
+        assert_equal(len(datasets), 10)
+        assert_equal(len(pages), 5)
+
+    def test_03_dataset_page(self):
+        whole, strained = self._both('dataset.html',
+                                     DrcogSync.dataset_page_spec)
+        entity = DrcogSync.get_dataset_entity('regional-roadways', strained)
+        assert_equal(entity, DrcogSync.get_dataset_entity('regional-roadways',
+                                                          whole))
+        assert_equal(entity['title'], 'DRCOG: Regional Roadways')
+        assert_equal(entity['tags'], ['transportation', 'roads-regional',
+                                      'travel-model'])
+        assert_equal(entity['maintainer_email'], 'gis@drcog.org')
+        assert_equal([resource['format'] for resource in entity['resources']],
+                     ['KML', 'WMS', 'RSS', 'SHP', 'PDF'])
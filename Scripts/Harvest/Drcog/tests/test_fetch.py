@@ -0,0 +1,66 @@
+import hashlib
+import urllib2
+
+from nose.tools import assert_equal, assert_raises
+
+import DrcogSync
+from fetch import PageFetcher
+from tests.replay import ReplayServer, fixture_pages, read_fixture
+
+
+class TestPageFetcher(object):
+
+    @classmethod
+    def setup_class(cls):
+        cls.server = ReplayServer(fixture_pages())
+        cls.server.start()
+
+    @classmethod
+    def teardown_class(cls):
+        cls.server.stop()
+
+    def test_01_streamed_parse_matches_whole(self):
+        fetcher = PageFetcher(chunk_size=100)
+        html = read_fixture('dataset.html')
+        soup, validators = fetcher.fetch(self.server.url('/dataset.html'),
+                                         DrcogSync.dataset_page_spec)
+        assert_equal(unicode(soup),
+                     unicode(DrcogSync.dataset_page_spec.parse(html)))
+        assert_equal(validators['etag'],
+                     '"%s"' % hashlib.md5(html).hexdigest())
+
+    def test_02_charset_from_header(self):
+        self.server.pages['/latin1'] = ('text/html; charset=iso-8859-1',
+            u'<h1 id="page-title">Caf\xe9</h1>'.encode('iso-8859-1'))
+        soup, validators = PageFetcher(chunk_size=1).fetch(
+            self.server.url('/latin1'))
+        assert_equal(soup.h1.string, u'Caf\xe9')
+
+    def test_03_not_modified(self):
+        fetcher = PageFetcher()
+        url = self.server.url('/subjects.html')
+        soup, validators = fetcher.fetch(url)
+        assert_equal(fetcher.fetch(url, validators={
+            'If-None-Match': validators['etag']}), None)
+        counters = fetcher.url_stats()[url]
+        assert_equal(counters['requests'], 2)
+        assert_equal(counters['not_modified'], 1)
+        assert_equal(counters['bytes_received'],
+                     len(read_fixture('subjects.html')))
+
+    def test_04_connection_reused(self):
+        fetcher = PageFetcher()
+        connections = self.server.stats()['connections']
+        for name in ('subjects.html', 'dataset_list.html', 'dataset.html'):
+            fetcher.fetch(self.server.url('/' + name))
+        assert_equal(self.server.stats()['connections'] - connections, 1)
+        stats = fetcher.stats()
+        assert_equal(stats['connections']['hits'], 2)
+        assert_equal(stats['urls'], 3)
+        assert_equal(stats['requests'], 3)
+
+    def test_05_errors_counted(self):
+        fetcher = PageFetcher()
+        url = self.server.url('/missing')
+        assert_raises(urllib2.HTTPError, fetcher.fetch, url)
+        assert_equal(fetcher.url_stats()[url]['errors'], 1)
@@ -0,0 +1,157 @@
+'''Writes many packages to CKAN on a pool of threads.
+
+    writer = BatchWriter(ckan, workers=4)
+    for result in writer.write(packages):
+        print result.name, result.outcome
+    print writer.counts()
+
+Whether each package is created or updated is decided by name from the
+names given, else the remote catalog, else one read of the package register,
+rather than a GET per package. write_package writes a single package, for
+callers running their own threads.
+'''
+import copy
+import threading
+from collections import namedtuple
+
+from ckanclient import CkanApiError, CkanApiConflictError
+from ckanclient.workers import WorkerPool
+
+OUTCOMES = ('created', 'updated', 'unchanged', 'conflict', 'error')
+
+# outcome is one of OUTCOMES. changes is the package_entity_diff of an update
+# (None if unknown), error the CkanApiError of a conflict or error.
+BatchResult = namedtuple('BatchResult', 'name outcome changes error')
+
+
+class BatchWriter(object):
+    '''Creates the packages not yet registered and updates the others.
+
+    :param client: the CkanClient to write with, shared by the threads
+    :param workers: number of writes in flight, default *4*
+    :param remote: default *None*. Something with get(name) returning the
+        package as it is on CKAN, such as a CatalogMirror. Updates then skip
+        packages that would not change. Without it, updates are only
+        compared (after a GET) if there is a prepare_update.
+    :param prepare_create: default *None*. Called as prepare_create(package)
+        before a create, returns the package to POST.
+    :param prepare_update: default *None*. Called as
+        prepare_update(remote, package) with a copy of the remote package,
+        returns the package to PUT.
+    :param existing: default *None*. The names of the packages on CKAN, such
+        as those a reconcile plan updates. Without it, a package exists if
+        the remote has it or, without a remote, if the register lists it.
+    '''
+
+    def __init__(self, client, workers=4, remote=None, prepare_create=None,
+                 prepare_update=None, existing=None):
+        self.client = client
+        self.workers = workers
+        self.remote = remote
+        self.prepare_create = prepare_create
+        self.prepare_update = prepare_update
+        self._existing = None
+        self._from_remote = existing is None and remote is not None
+        if existing is not None:
+            self._existing = set(existing)
+        elif remote is not None:
+            # Only the packages created since the remote was read
+            self._existing = set()
+        self._lock = threading.Lock()
+        self._register_lock = threading.Lock()
+        self._counts = dict((outcome, 0) for outcome in OUTCOMES)
+
+    def existing_names(self):
+        '''Returns the set of names of the packages known to exist, read
+        once from the register if neither they nor a remote were given.'''
+        self._register_lock.acquire()
+        try:
+            if self._existing is None:
+                self._existing = self._registered_names()
+            return self._existing
+        finally:
+            self._register_lock.release()
+
+    def _registered_names(self):
+        # API v2 registers list packages by id, so ids are looked up by name
+        # in one search rather than a GET each.
+        refs = set(self.client.package_register_get())
+        names = set(refs)
+        results = self.client.package_search(None, {'all_fields': 1})
+        for package in results['results']:
+            if isinstance(package, dict) and package.get('id') in refs:
+                names.add(package['name'])
+        return names
+
+    def _exists(self, name):
+        if name in self._existing:
+            return True
+        return self._from_remote and self.remote.get(name) is not None
+
+    def write(self, packages):
+        '''Writes each package dict from the iterable, which is read as the
+        writes go, and yields a BatchResult for each in the same order.'''
+        self.existing_names()
+        pool = WorkerPool(self.workers)
+        results = pool.map_ordered(self.write_package, packages)
+        try:
+            for result in results:
+                yield result
+        finally:
+            results.close()
+            pool.shutdown(wait=False)
+
+    def counts(self):
+        '''Returns the number of packages with each outcome so far.'''
+        self._lock.acquire()
+        try:
+            return dict(self._counts)
+        finally:
+            self._lock.release()
+
+    def write_package(self, package):
+        '''Writes the package dict and returns its BatchResult. Safe to call
+        from many threads at once.'''
+        self.existing_names()
+        name = package['name']
+        changes = error = None
+        try:
+            if not self._exists(name):
+                if self.prepare_create is not None:
+                    package = self.prepare_create(package)
+                self.client.package_register_post(package)
+                outcome = 'created'
+                self._lock.acquire()
+                try:
+                    self._existing.add(name)
+                finally:
+                    self._lock.release()
+            else:
+                changes = self._update(name, package)
+                outcome = 'updated' if changes is None or changes \
+                    else 'unchanged'
+        except CkanApiConflictError, error:
+            outcome = 'conflict'
+        except CkanApiError, error:
+            outcome = 'error'
+        self._lock.acquire()
+        try:
+            self._counts[outcome] += 1
+        finally:
+            self._lock.release()
+        return BatchResult(name, outcome, changes, error)
+
+    def _update(self, name, package):
+        '''PUTs the package, unless it is known not to change anything.
+        Returns the changes, or None if they are not known.'''
+        remote = None
+        if self.remote is not None:
+            remote = self.remote.get(name)
+        if remote is None and self.prepare_update is not None:
+            remote = self.client.package_entity_get(name)
+        if remote is None:
+            self.client.package_entity_put(package)
+            return None
+        if self.prepare_update is not None:
+            package = self.prepare_update(copy.deepcopy(remote), package)
+        return self.client.package_entity_put_if_changed(remote, package)
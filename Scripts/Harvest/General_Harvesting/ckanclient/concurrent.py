@@ -0,0 +1,81 @@
+'''Concurrent CKAN client.
+
+ConcurrentCkanClient has the same methods as CkanClient, but each call runs
+on a pool of threads and returns a ckanclient.workers.Future straight away.
+That lets a harvester keep many requests in flight:
+
+    ckan = ConcurrentCkanClient(base_location=url, api_key=key,
+                                concurrency=16)
+    futures = [ckan.package_entity_get(name) for name in names]
+    for future in futures:
+        try:
+            package = future.result()
+        except CkanApiNotFoundError:
+            ...
+    ckan.close()
+
+Errors are raised from Future.result() as the same CkanApiError subclasses
+CkanClient raises.
+'''
+from ckanclient import CkanClient, KeepAliveTransport
+from ckanclient.workers import WorkerPool
+
+
+def _concurrent(name):
+    def method(self, *args, **kwargs):
+        return self._submit(name, *args, **kwargs)
+    method.__name__ = name
+    method.__doc__ = 'Runs CkanClient.%s on the pool. Returns a Future.' % name
+    return method
+
+
+class ConcurrentCkanClient(object):
+    '''Runs CkanClient calls on a pool of `concurrency` threads.
+
+    :param client: the CkanClient to make calls with. If not given, one is
+        created from the remaining keyword arguments, with a
+        KeepAliveTransport pooling one connection per thread.
+    :param concurrency: maximum number of calls in flight, default *8*
+    :param max_pending: maximum number of calls queued behind those in
+        flight, default *0* (unbounded). Calls block while the queue is full.
+    '''
+
+    def __init__(self, client=None, concurrency=8, max_pending=0, **kwargs):
+        self._transport = None
+        if client is None:
+            if 'transport' not in kwargs:
+                self._transport = KeepAliveTransport(pool_size=concurrency)
+                kwargs['transport'] = self._transport
+            client = CkanClient(**kwargs)
+        self.client = client
+        self.concurrency = concurrency
+        self._pool = WorkerPool(concurrency, queue_size=max_pending)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        '''Waits for the calls already made, then stops the threads.'''
+        self._pool.shutdown()
+        if self._transport is not None:
+            self._transport.close()
+
+    def _submit(self, name, *args, **kwargs):
+        return self._pool.submit(getattr(self.client, name), *args, **kwargs)
+
+    api_version_get = _concurrent('api_version_get')
+    package_register_get = _concurrent('package_register_get')
+    package_register_post = _concurrent('package_register_post')
+    package_entity_get = _concurrent('package_entity_get')
+    package_entity_put = _concurrent('package_entity_put')
+    package_entity_delete = _concurrent('package_entity_delete')
+    package_search = _concurrent('package_search')
+    tag_register_get = _concurrent('tag_register_get')
+    tag_entity_get = _concurrent('tag_entity_get')
+    group_register_get = _concurrent('group_register_get')
+    group_register_post = _concurrent('group_register_post')
+    group_entity_get = _concurrent('group_entity_get')
+    group_entity_put = _concurrent('group_entity_put')
@@ -0,0 +1,135 @@
+'''Incremental decoding of large JSON responses.
+
+    stream = JsonArrayStream(response, 'results')
+    for package in stream:
+        ...
+    print stream.members['count']
+
+Only a chunk of the response and the item being decoded are held in memory,
+never the whole body or the whole decoded list.
+'''
+try: # since python 2.6
+    import json
+except ImportError:
+    import simplejson as json
+
+WHITESPACE = ' \t\n\r'
+
+
+class JsonArrayStream(object):
+    '''Iterates over the items of the array member `key` of the JSON object
+    read from `fp`, decoding them one at a time. The other members of the
+    object are decoded whole into `members` as they are passed, so those
+    after the array are only there once iteration has finished.
+
+    :param fp: file-like object with read(size)
+    :param key: name of the array member to stream
+    :param chunk_size: bytes read at a time, default *64KB*
+    '''
+
+    def __init__(self, fp, key, chunk_size=65536):
+        self.fp = fp
+        self.key = key
+        self.chunk_size = chunk_size
+        self.members = {}
+        self._decoder = json.JSONDecoder()
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+        self._started = False
+        self._in_array = False
+        self._items = self._generate()
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        return next(self._items)
+
+    __next__ = next
+
+    def start(self):
+        '''Decodes the members ahead of the array, stopping before its
+        first item. Returns self.'''
+        if not self._started:
+            self._started = True
+            self._expect('{')
+            if self._peek() == '}':
+                self._pos += 1
+            else:
+                self._in_array = self._read_members()
+        return self
+
+    def _read_members(self):
+        '''Decodes members up to the start of the array (returns True) or
+        the end of the object (returns False).'''
+        while True:
+            name = self._decode()
+            self._expect(':')
+            if name == self.key:
+                self._expect('[')
+                return True
+            self.members[name] = self._decode()
+            if self._expect(',}') == '}':
+                return False
+
+    def _generate(self):
+        self.start()
+        if self._in_array:
+            if self._peek() == ']':
+                self._pos += 1
+            else:
+                while True:
+                    yield self._decode()
+                    if self._expect(',]') == ']':
+                        break
+            self._in_array = False
+            if self._expect(',}') == ',':
+                self._read_members()
+        # Read to the end, so a pooled connection can be reused.
+        while not self._eof:
+            self._fill()
+
+    def _decode(self):
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except ValueError:
+                if self._eof:
+                    raise
+                self._fill()
+                continue
+            if end == len(self._buffer) and not self._eof:
+                # A number may carry on into the next chunk.
+                self._fill()
+                continue
+            self._pos = end
+            return value
+
+    def _peek(self):
+        '''Skips whitespace and returns the next character.'''
+        while True:
+            while self._pos < len(self._buffer) and \
+                    self._buffer[self._pos] in WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if self._eof:
+                raise ValueError('Unexpected end of JSON data')
+            self._fill()
+
+    def _expect(self, chars):
+        char = self._peek()
+        if char not in chars:
+            raise ValueError('Expected %s in JSON data at %r' %
+                             (' or '.join(chars), self._buffer[self._pos:][:40]))
+        self._pos += 1
+        return char
+
+    def _fill(self):
+        data = self.fp.read(self.chunk_size)
+        if not data:
+            self._eof = True
+        self._buffer = self._buffer[self._pos:] + data
+        self._pos = 0
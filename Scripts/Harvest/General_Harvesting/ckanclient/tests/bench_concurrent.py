@@ -0,0 +1,61 @@
+'''Throughput of CkanClient against ConcurrentCkanClient.
+
+Runs package_entity_get for every package held by a local FakeCkanServer
+that answers each request after a fixed delay, standing in for the round
+trip to a real CKAN site.
+
+    python -m ckanclient.tests.bench_concurrent [packages] [latency] [concurrency]
+'''
+import sys
+import time
+
+from ckanclient import CkanClient, KeepAliveTransport
+from ckanclient.concurrent import ConcurrentCkanClient
+from ckanclient.tests.fake_ckan import FakeCkanServer
+
+
+def run_sync(server, names):
+    client = CkanClient(base_location=server.base_location,
+                        transport=KeepAliveTransport())
+    for name in names:
+        client.package_entity_get(name)
+
+
+def run_concurrent(server, names, concurrency):
+    client = ConcurrentCkanClient(base_location=server.base_location,
+                                  concurrency=concurrency)
+    try:
+        futures = [client.package_entity_get(name) for name in names]
+        for future in futures:
+            future.result()
+    finally:
+        client.close()
+
+
+def main():
+    packages = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.02
+    concurrency = int(sys.argv[3]) if len(sys.argv) > 3 else 16
+    server = FakeCkanServer(latency=latency)
+    names = ['package%05d' % i for i in range(packages)]
+    for name in names:
+        server.add_package(name)
+    server.start()
+    try:
+        print '%d package_entity_get calls, %d ms server latency' % (
+            packages, latency * 1000)
+        runs = (('sync', lambda: run_sync(server, names)),
+                ('concurrent x%d' % concurrency,
+                 lambda: run_concurrent(server, names, concurrency)))
+        for label, run in runs:
+            start = time.time()
+            run()
+            elapsed = time.time() - start
+            print '%-16s %6.2f s  %7.1f requests/s' % (
+                label, elapsed, packages / elapsed)
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+from nose.tools import assert_equal
+
+from ckanclient import CkanClient, KeepAliveTransport
+from ckanclient.batch import BatchWriter
+from ckanclient.workers import WorkerPool
+from ckanclient.tests.fake_ckan import FakeCkanServer
+
+
+class TestBatchWriter(object):
+
+    def setup(self):
+        self.server = FakeCkanServer(latency=0.005)
+        for i in range(5):
+            self.server.add_package('package%02d' % i, title='Old')
+        self.server.start()
+        self.c = CkanClient(base_location=self.server.base_location,
+                            transport=KeepAliveTransport(pool_size=4))
+
+    def teardown(self):
+        self.server.stop()
+
+    def _requests(self, method, path=''):
+        return len([r for r in self.server.requests
+                    if r[0] == method and path in r[1]])
+
+    def _packages(self, count):
+        return [{'name': 'package%02d' % i, 'title': 'New'}
+                for i in range(count)]
+
+    def test_01_create_and_update(self):
+        writer = BatchWriter(self.c, workers=4)
+        results = list(writer.write(self._packages(10)))
+        assert_equal([r.name for r in results],
+                     ['package%02d' % i for i in range(10)])
+        assert_equal([r.outcome for r in results], ['updated'] * 5 +
+                     ['created'] * 5)
+        assert_equal(writer.counts()['created'], 5)
+        assert_equal(self._requests('GET'), 1)
+        assert_equal(self._requests('PUT'), 5)
+        assert_equal(self._requests('POST', '/rest/package'), 5)
+        assert_equal(self.server.packages['package07']['title'], 'New')
+        assert self.server.max_in_flight > 1
+
+    def test_02_unchanged_skipped_with_remote(self):
+        remote = dict((name, dict(package)) for name, package
+                      in self.server.packages.items())
+        packages = self._packages(3)
+        packages[0]['title'] = 'Old'
+        writer = BatchWriter(self.c, remote=remote)
+        outcomes = [r.outcome for r in writer.write(packages)]
+        assert_equal(outcomes, ['unchanged', 'updated', 'updated'])
+        assert_equal(self._requests('PUT'), 2)
+
+    def test_03_prepare_update_and_conflict(self):
+        def prepare_update(remote, package):
+            remote['title'] = remote['title'] + ' and ' + package['title']
+            return remote
+        writer = BatchWriter(self.c, prepare_update=prepare_update)
+        writer.existing_names()
+        # Registered by someone else after the register was read.
+        self.server.add_package('package07')
+        results = list(writer.write(self._packages(8)[4:]))
+        assert_equal([r.outcome for r in results],
+                     ['updated', 'created', 'created', 'conflict'])
+        assert_equal(results[0].changes.keys(), ['title'])
+        assert_equal(self.server.packages['package04']['title'],
+                     'Old and New')
+        assert_equal(writer.counts()['conflict'], 1)
+
+    def test_04_write_package_from_threads(self):
+        writer = BatchWriter(self.c)
+        pool = WorkerPool(4)
+        futures = [pool.submit(writer.write_package, package)
+                   for package in self._packages(8)]
+        outcomes = sorted(future.result().outcome for future in futures)
+        pool.shutdown()
+        assert_equal(outcomes, ['created'] * 3 + ['updated'] * 5)
+        # The register is still only read once.
+        assert_equal(self._requests('GET'), 1)
+
+    def test_05_update_through_api_v2(self):
+        # The v2 register lists ids, which are looked up by name
+        self.c.base_location += '/2'
+        writer = BatchWriter(self.c, workers=4)
+        outcomes = [r.outcome for r in writer.write(self._packages(7))]
+        assert_equal(outcomes, ['updated'] * 5 + ['created'] * 2)
+        assert_equal(self._requests('PUT', '/api/2/rest/package/'), 5)
+        assert_equal(self.server.packages['package03']['title'], 'New')
+
+    def test_06_existing_names_given(self):
+        self.c.base_location += '/2'
+        writer = BatchWriter(self.c, existing=['package00', 'package01'])
+        outcomes = [r.outcome for r in writer.write(self._packages(2))]
+        assert_equal(outcomes, ['updated', 'updated'])
+        # Nothing is read to decide
+        assert_equal(self._requests('GET'), 0)
+        assert_equal(self._requests('POST'), 0)
@@ -0,0 +1,54 @@
+from nose.tools import assert_raises, assert_equal
+
+from ckanclient import CkanApiNotFoundError, CkanApiConflictError
+from ckanclient.concurrent import ConcurrentCkanClient
+from ckanclient.tests.fake_ckan import FakeCkanServer
+
+
+class TestConcurrentCkanClient(object):
+
+    @classmethod
+    def setup_class(self):
+        self.server = FakeCkanServer(latency=0.05)
+        self.names = ['package%02d' % i for i in range(20)]
+        for name in self.names:
+            self.server.add_package(name, groups=['drcog'])
+        self.server.add_group('drcog')
+        self.server.start()
+
+    @classmethod
+    def teardown_class(self):
+        self.server.stop()
+
+    def setup(self):
+        self.c = ConcurrentCkanClient(
+            base_location=self.server.base_location, api_key='tester',
+            concurrency=5)
+        self.server.max_in_flight = 0
+
+    def teardown(self):
+        self.c.close()
+
+    def test_01_entity_gets_in_order(self):
+        futures = [self.c.package_entity_get(name) for name in self.names]
+        assert_equal([f.result()['name'] for f in futures], self.names)
+        assert_equal(self.server.max_in_flight, 5)
+
+    def test_02_errors_mapped(self):
+        missing = self.c.package_entity_get('missing')
+        assert_raises(CkanApiNotFoundError, missing.result)
+        conflict = self.c.package_register_post({'name': 'package00'})
+        assert_raises(CkanApiConflictError, conflict.result)
+
+    def test_03_writes(self):
+        created = self.c.package_register_post({'name': 'newpackage'})
+        assert_equal(created.result()['name'], 'newpackage')
+        updated = self.c.package_entity_put({'name': 'newpackage',
+                                             'title': 'New'})
+        assert_equal(updated.result()['title'], 'New')
+
+    def test_04_search_and_groups(self):
+        search = self.c.package_search(None, {'groups': 'drcog', 'limit': 7})
+        group = self.c.group_entity_get('drcog')
+        assert_equal(list(search.result()['results']), self.names)
+        assert_equal(group.result()['name'], 'drcog')
@@ -0,0 +1,74 @@
+from nose.tools import assert_equal, assert_raises
+
+from ckanclient import CkanClient, CkanApiNotFoundError, KeepAliveTransport
+from ckanclient.hooks import RequestHook, LatencyCollector
+from ckanclient.tests.fake_ckan import FakeCkanServer
+
+
+class RecordingHook(RequestHook):
+
+    def __init__(self):
+        self.calls = []
+
+    def before_request(self, resource, method, location, bytes_sent):
+        self.calls.append(('before', resource, method))
+
+    def after_response(self, resource, method, location, status, bytes_sent,
+                       bytes_received, elapsed):
+        self.calls.append(('after', resource, method, status,
+                           bytes_received > 0))
+
+
+class TestHooks(object):
+
+    @classmethod
+    def setup_class(self):
+        self.server = FakeCkanServer()
+        self.server.add_package('package00')
+        self.server.start()
+
+    @classmethod
+    def teardown_class(self):
+        self.server.stop()
+
+    def _client(self, hooks):
+        return CkanClient(base_location=self.server.base_location,
+                          transport=KeepAliveTransport(), hooks=hooks)
+
+    def test_01_calls(self):
+        hook = RecordingHook()
+        c = self._client([hook])
+        c.package_entity_get('package00')
+        assert_raises(CkanApiNotFoundError, c.group_entity_get, 'missing')
+        list(c.package_search('package')['results'])
+        assert_equal(hook.calls, [
+            ('before', 'Package Entity', 'GET'),
+            ('after', 'Package Entity', 'GET', 200, True),
+            ('before', 'Group Entity', 'GET'),
+            ('after', 'Group Entity', 'GET', 404, True),
+            ('before', 'Package Search', 'POST'),
+            ('after', 'Package Search', 'POST', 200, True),
+            ])
+
+    def test_02_resource_names(self):
+        c = self._client([])
+        base = self.server.base_location
+        assert_equal(c._resource_name(base), 'Base')
+        assert_equal(c._resource_name(base + '/rest/package'),
+                     'Package Register')
+        assert_equal(c._resource_name(base + '/form/package/edit/x'),
+                     'Package Edit Form')
+        assert_equal(c._resource_name(base + '/storage/metadata/x'), None)
+
+    def test_03_latency_collector(self):
+        latency = LatencyCollector()
+        c = self._client([latency])
+        for i in range(3):
+            c.package_entity_get('package00')
+        stats = latency.stats()
+        assert_equal(stats.keys(), ['Package Entity GET'])
+        endpoint = stats['Package Entity GET']
+        assert_equal(endpoint['requests'], 3)
+        assert_equal(endpoint['errors'], 0)
+        assert_equal(sum(endpoint['histogram'].values()), 3)
+        assert endpoint['p50_ms'] <= endpoint['p99_ms']
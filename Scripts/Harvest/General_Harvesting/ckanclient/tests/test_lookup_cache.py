@@ -0,0 +1,91 @@
+import threading
+import time
+
+from nose.tools import assert_equal, assert_raises
+
+from ckanclient import CkanClient, CkanApiNotFoundError, KeepAliveTransport
+from ckanclient.cache import LookupCache
+from ckanclient.tests.fake_ckan import FakeCkanServer
+
+
+class TestLookupCache(object):
+
+    def setup(self):
+        self.server = FakeCkanServer()
+        self.server.add_group('drcog', title='DRCOG')
+        self.server.start()
+        self.cache = LookupCache(ttl=60)
+
+    def teardown(self):
+        self.server.stop()
+
+    def _client(self):
+        return CkanClient(base_location=self.server.base_location,
+                          api_key='key', transport=KeepAliveTransport(),
+                          lookup_cache=self.cache)
+
+    def _group_gets(self):
+        return len([r for r in self.server.requests
+                    if r == ('GET', '/api/rest/group/drcog')])
+
+    def test_01_group_looked_up_once(self):
+        c = self._client()
+        for i in range(5):
+            group = c.group_entity_get('drcog')
+            assert_equal(group['id'], 'id-drcog')
+            # Callers get their own copy
+            group['title'] = 'changed'
+        assert_equal(c.group_entity_get('drcog')['title'], 'DRCOG')
+        assert_equal(self._group_gets(), 1)
+        stats = self.cache.stats()
+        assert_equal((stats['hits'], stats['misses'], stats['entries']),
+                     (5, 1, 1))
+
+    def test_02_expires(self):
+        self.cache.ttl = 0.1
+        c = self._client()
+        c.group_entity_get('drcog')
+        time.sleep(0.2)
+        c.group_entity_get('drcog')
+        assert_equal(self._group_gets(), 2)
+        assert_equal(self.cache.stats()['expired'], 1)
+
+    def test_03_invalidate(self):
+        c = self._client()
+        c.group_entity_get('drcog')
+        self.cache.invalidate('group', 'drcog')
+        c.group_entity_get('drcog')
+        self.cache.invalidate()
+        c.group_entity_get('drcog')
+        assert_equal(self._group_gets(), 3)
+        assert_equal(self.cache.stats()['invalidations'], 2)
+
+    def test_04_group_put_invalidates(self):
+        c = self._client()
+        c.group_entity_get('drcog')
+        c.group_entity_put({'name': 'drcog', 'id': 'id-drcog',
+                            'title': 'Denver Regional Council'})
+        assert_equal(c.group_entity_get('drcog')['title'],
+                     'Denver Regional Council')
+        assert_equal(self._group_gets(), 2)
+
+    def test_05_not_found_not_cached(self):
+        c = self._client()
+        assert_raises(CkanApiNotFoundError, c.group_entity_get, 'missing')
+        assert_raises(CkanApiNotFoundError, c.group_entity_get, 'missing')
+        assert_equal(self.cache.stats()['entries'], 0)
+        assert_equal(self.cache.stats()['misses'], 2)
+
+    def test_06_concurrent_lookups_share_one_request(self):
+        self.server.latency = 0.2
+        c = self._client()
+        groups = []
+        def lookup():
+            groups.append(c.group_entity_get('drcog'))
+        threads = [threading.Thread(target=lookup) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert_equal([group['id'] for group in groups], ['id-drcog'] * 8)
+        assert_equal(self._group_gets(), 1)
@@ -0,0 +1,131 @@
+from nose.tools import assert_equal
+
+from ckanclient import CkanClient, KeepAliveTransport
+from ckanclient.tests.fake_ckan import FakeCkanServer
+
+
+class TestPackageSearchPaging(object):
+
+    @classmethod
+    def setup_class(self):
+        self.server = FakeCkanServer(latency=0.01)
+        self.names = ['package%02d' % i for i in range(23)]
+        for name in self.names:
+            self.server.add_package(name, groups=['drcog'])
+        self.server.start()
+
+    @classmethod
+    def teardown_class(self):
+        self.server.stop()
+
+    def _client(self, **kwargs):
+        return CkanClient(base_location=self.server.base_location,
+                          transport=KeepAliveTransport(), **kwargs)
+
+    def _search_requests(self):
+        return len([r for r in self.server.requests if 'search' in r[1]])
+
+    def test_01_paged(self):
+        requests = self._search_requests()
+        res = self._client().package_search('package', {'limit': 5})
+        assert_equal(list(res['results']), self.names)
+        assert_equal(self._search_requests() - requests, 5)
+
+    def test_02_prefetch_keeps_order(self):
+        requests = self._search_requests()
+        c = self._client(prefetch_workers=3)
+        res = c.package_search('package', {'limit': 5, 'all_fields': 1})
+        assert_equal([p['name'] for p in res['results']], self.names)
+        assert_equal(self._search_requests() - requests, 5)
+
+    def test_03_prefetch_per_call(self):
+        res = self._client().package_search(None, {'groups': 'drcog',
+                                                   'limit': 2},
+                                            prefetch_workers=4)
+        assert_equal(res['count'], 23)
+        assert_equal(list(res['results']), self.names)
+
+    def test_04_prefetch_single_page(self):
+        res = self._client(prefetch_workers=2).package_search('package22')
+        assert_equal(list(res['results']), ['package22'])
+
+
+class TestPackageBulkGet(object):
+
+    def setup(self):
+        self.server = FakeCkanServer()
+        self.names = ['package%02d' % i for i in range(23)]
+        for name in self.names:
+            self.server.add_package(name, resources=[{'format': 'SHP'}])
+        self.server.start()
+        self.c = CkanClient(base_location=self.server.base_location,
+                            transport=KeepAliveTransport())
+
+    def teardown(self):
+        self.server.stop()
+
+    def _requests(self, method, path):
+        return len([r for r in self.server.requests
+                    if r[0] == method and path in r[1]])
+
+    def test_01_from_search(self):
+        packages = list(self.c.package_bulk_get(batch_size=10))
+        assert_equal([p['name'] for p in packages], self.names)
+        assert_equal(packages[0]['resources'], [{'format': 'SHP'}])
+        assert_equal(self._requests('POST', '/search/package'), 4)
+        assert_equal(self._requests('GET', '/rest/package'), 0)
+
+    def test_02_fallback_to_entity_gets(self):
+        self.server.full_search_results = False
+        packages = list(self.c.package_bulk_get(batch_size=10, workers=3))
+        assert_equal([p['name'] for p in packages], self.names)
+        assert_equal(packages[0]['resources'], [{'format': 'SHP'}])
+        assert_equal(self._requests('POST', '/search/package'), 1)
+        assert_equal(self._requests('GET', '/rest/package/'), 23)
+
+
+class TestStreamingSearch(object):
+
+    @classmethod
+    def setup_class(self):
+        self.server = FakeCkanServer()
+        self.names = ['package%02d' % i for i in range(23)]
+        for name in self.names:
+            self.server.add_package(name)
+        self.server.start()
+
+    @classmethod
+    def teardown_class(self):
+        self.server.stop()
+
+    def setup(self):
+        self.transport = KeepAliveTransport()
+        self.c = CkanClient(base_location=self.server.base_location,
+                            transport=self.transport, stream_search=True)
+
+    def _search_requests(self):
+        return len([r for r in self.server.requests if 'search' in r[1]])
+
+    def test_01_pages_until_short_page(self):
+        requests = self._search_requests()
+        res = self.c.package_search('package', {'limit': 5, 'all_fields': 1})
+        assert_equal([p['name'] for p in res['results']], self.names)
+        assert_equal(self._search_requests() - requests, 5)
+        assert_equal(self.c.last_body, None)
+
+    def test_02_reuses_connection(self):
+        res = self.c.package_search('package', {'limit': 10})
+        assert_equal(list(res['results']), self.names)
+        assert_equal(self.transport.stats()['misses'], 1)
+
+    def test_03_no_results(self):
+        res = self.c.package_search('nothing')
+        assert_equal(list(res['results']), [])
+
+    def test_04_stop_part_way(self):
+        res = self.c.package_search('package', {'limit': 10})
+        results = res['results']
+        assert_equal(next(results), 'package00')
+        results.close()
+        assert_equal(list(self.c.package_search('package22')['results']),
+                     ['package22'])
@@ -0,0 +1,74 @@
+import threading
+
+from nose.tools import assert_equal, assert_raises
+
+from ckanclient import (CkanClient, KeepAliveTransport, ApiResponse,
+                        CkanApiNotFoundError)
+from ckanclient.workers import WorkerPool
+from ckanclient.tests.fake_ckan import FakeCkanServer
+
+
+class TestSharedClient(object):
+
+    @classmethod
+    def setup_class(self):
+        self.server = FakeCkanServer(latency=0.002)
+        self.names = ['package%03d' % i for i in range(200)]
+        for name in self.names:
+            self.server.add_package(name, title='Title of ' + name)
+        self.server.start()
+
+    @classmethod
+    def teardown_class(self):
+        self.server.stop()
+
+    def setup(self):
+        self.c = CkanClient(base_location=self.server.base_location,
+                            transport=KeepAliveTransport(pool_size=16))
+
+    def test_01_response_is_read_only(self):
+        response = self.c.open_url(self.c.get_location('Base'))
+        assert isinstance(response, ApiResponse)
+        assert_equal(response.status, 200)
+        assert_equal(response.message, {'version': 2})
+        assert self.c.last_response is response
+        assert_raises(AttributeError, setattr, response, 'status', 500)
+
+    def test_02_last_attributes_per_thread(self):
+        self.c.package_entity_get('package000')
+        def other_thread():
+            assert_raises(CkanApiNotFoundError, self.c.package_entity_get,
+                          'missing')
+        thread = threading.Thread(target=other_thread)
+        thread.start()
+        thread.join()
+        assert_equal(self.c.last_status, 200)
+        assert_equal(self.c.last_message['name'], 'package000')
+
+    def test_03_stress(self):
+        # Many threads on one client, each checking every result and the
+        # compatibility attributes belong to its own request.
+        mismatches = []
+        def fetch(name):
+            if name.endswith('7'):
+                try:
+                    self.c.package_entity_get(name + '-missing')
+                except CkanApiNotFoundError:
+                    if self.c.last_status != 404:
+                        mismatches.append((name, self.c.last_status))
+            package = self.c.package_entity_get(name)
+            if package['name'] != name or \
+                    self.c.last_message['title'] != 'Title of ' + name or \
+                    self.c.last_response.message is not package or \
+                    self.c.last_status != 200:
+                mismatches.append(name)
+            return package['name']
+        pool = WorkerPool(16)
+        try:
+            for round in range(3):
+                results = list(pool.map_ordered(fetch, self.names, window=64))
+                assert_equal(results, self.names)
+        finally:
+            pool.shutdown()
+        assert_equal(mismatches, [])
+        assert self.server.max_in_flight > 1
@@ -0,0 +1,183 @@
+import base64
+import shutil
+import tempfile
+import threading
+import urllib2
+
+from nose.tools import assert_raises, assert_equal
+
+from ckanclient import (CkanClient, KeepAliveTransport, CkanApiNotFoundError,
+                        CkanApiConflictError)
+from ckanclient.cache import ResponseCache
+from ckanclient.tests.fake_ckan import FakeCkanServer
+
+
+class TestKeepAliveTransport(object):
+
+    @classmethod
+    def setup_class(self):
+        self.server = FakeCkanServer()
+        self.server.add_package('annakarenina', title='A Novel By Tolstoy')
+        self.server.start()
+
+    @classmethod
+    def teardown_class(self):
+        self.server.stop()
+
+    def _client(self, transport):
+        return CkanClient(base_location=self.server.base_location,
+                          transport=transport)
+
+    def test_01_connection_reused(self):
+        transport = KeepAliveTransport()
+        c = self._client(transport)
+        connections = self.server.connections
+        for i in range(5):
+            package = c.package_entity_get('annakarenina')
+            assert_equal(package['title'], 'A Novel By Tolstoy')
+        assert_equal(self.server.connections - connections, 1)
+        assert_equal(transport.stats(),
+                     {'hits': 4, 'misses': 1, 'discarded': 0})
+
+    def test_02_errors_mapped(self):
+        c = self._client(KeepAliveTransport())
+        assert_raises(CkanApiNotFoundError, c.package_entity_get, 'missing')
+        assert_equal(c.last_status, 404)
+        assert_raises(CkanApiConflictError, c.package_register_post,
+                      {'name': 'annakarenina'})
+        assert_equal(c.last_status, 409)
+        # the connection survives error responses
+        assert_equal(c.package_entity_get('annakarenina')['name'],
+                     'annakarenina')
+        assert_equal(c.transport.stats()['misses'], 1)
+
+    def test_03_shared_between_threads(self):
+        transport = KeepAliveTransport(pool_size=2)
+        errors = []
+        def worker():
+            c = self._client(transport)
+            try:
+                for i in range(10):
+                    c.package_entity_get('annakarenina')
+            except Exception, e:
+                errors.append(e)
+        threads = [threading.Thread(target=worker) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert not errors, errors
+        stats = transport.stats()
+        assert_equal(stats['hits'] + stats['misses'], 80)
+        # A thread only opens a new connection when none is idle: at first,
+        # and after the full pool made it discard its last one.
+        assert stats['misses'] <= 8 + stats['discarded'], stats
+        assert stats['hits'] > stats['misses'], stats
+
+    def test_04_basic_auth(self):
+        c = CkanClient(base_location=self.server.base_location,
+                       api_key='key', http_user='user', http_pass='secret',
+                       transport=KeepAliveTransport())
+        # Undo the opener the client installs for urlopen
+        urllib2.install_opener(None)
+        c.package_entity_get('annakarenina')
+        c.package_entity_put({'name': 'annakarenina',
+                              'title': 'A Novel By Tolstoy'})
+        assert_equal(self.server.authorizations[-2:],
+                     ['Basic ' + base64.b64encode('user:secret')] * 2)
+
+
+class TestResponseCache(object):
+
+    @classmethod
+    def setup_class(self):
+        self.server = FakeCkanServer()
+        self.server.add_package('annakarenina', title='A Novel By Tolstoy')
+        self.server.start()
+        self.directory = tempfile.mkdtemp()
+
+    @classmethod
+    def teardown_class(self):
+        self.server.stop()
+        shutil.rmtree(self.directory)
+
+    def test_01_not_modified_served_from_cache(self):
+        cache = ResponseCache(self.directory)
+        c = CkanClient(base_location=self.server.base_location,
+                       api_key='tester', response_cache=cache)
+        first = c.package_entity_get('annakarenina')
+        second = c.package_entity_get('annakarenina')
+        assert_equal(first, second)
+        assert_equal(c.last_status, 200)
+        stats = cache.stats()
+        assert_equal((stats['hits'], stats['misses'], stats['stores']),
+                     (1, 1, 1))
+        assert_equal(stats['hit_rate'], 0.5)
+
+    def test_02_changed_entity_refetched(self):
+        cache = ResponseCache(self.directory)
+        c = CkanClient(base_location=self.server.base_location,
+                       api_key='tester', response_cache=cache)
+        c.package_entity_get('annakarenina')
+        self.server.packages['annakarenina']['title'] = 'War and Peace'
+        assert_equal(c.package_entity_get('annakarenina')['title'],
+                     'War and Peace')
+        assert_equal(cache.stats()['misses'], 1)
+
+    def test_03_lru_eviction(self):
+        cache = ResponseCache(tempfile.mkdtemp(dir=self.directory),
+                              max_bytes=1)
+        for name in 'abc':
+            cache.store(name, 'x', {'etag': '"%s"' % name})
+        cache = ResponseCache(cache.directory, max_bytes=2)
+        assert_equal(cache.validators('a'), {})
+        cache.store('d', 'x', {'etag': '"d"'})
+        cache.store('e', 'x', {'etag': '"e"'})
+        assert_equal(cache.validators('d'), {'If-None-Match': '"d"'})
+        assert_equal(cache.validators('c'), {})
+        assert_equal(cache.stats()['evictions'], 1)
+
+
+class TestCompressedResponses(object):
+
+    def setup(self):
+        self.server = FakeCkanServer()
+        for i in range(30):
+            self.server.add_package('package%02d' % i, notes='Notes ' * 50)
+        self.server.start()
+
+    def teardown(self):
+        self.server.stop()
+
+    def _client(self, **kwargs):
+        return CkanClient(base_location=self.server.base_location,
+                          transport=KeepAliveTransport(), **kwargs)
+
+    def _check(self, encoding, **kwargs):
+        self.server.content_encoding = encoding
+        c = self._client(**kwargs)
+        assert_equal(c.package_entity_get('package00')['notes'], 'Notes ' * 50)
+        res = c.package_search('package', {'limit': 7, 'all_fields': 1})
+        assert_equal(len(list(res['results'])), 30)
+        stats = c.transfer_stats.stats()
+        assert stats['compression_ratio'] > 3, stats
+        assert stats['bytes_received'] < stats['bytes_decoded'] / 3, stats
+        assert_equal(c.transport.stats()['misses'], 1)
+
+    def test_01_gzip(self):
+        self._check('gzip')
+
+    def test_02_deflate(self):
+        self._check('deflate')
+
+    def test_03_gzip_streamed(self):
+        self._check('gzip', stream_search=True)
+
+    def test_04_not_accepted(self):
+        self.server.content_encoding = 'gzip'
+        c = self._client()
+        c.accept_encoding = None
+        c.package_entity_get('package00')
+        stats = c.transfer_stats.stats()
+        assert_equal(stats['compression_ratio'], None)
+        assert_equal(stats['bytes_received'], stats['bytes_decoded'])
@@ -16,11 +16,13 @@
 
 import os, sys, urllib2, zipfile, shutil
 import ckanclient
+import ckanclient.mirror
 from osgeo import ogr, osr
 
 
 # Globals
 download_folder = "download"
+catalog_file = os.path.join(download_folder, "catalog.json")
 
 ckan_host = "http://data.opencolorado.org/api/2"
 
@@ -46,29 +48,28 @@ def initialize():
       
 def process_ckan_datasets():
     
-    global ckan_host
+    global ckan_host, catalog_file
     
     # Initialize the CKAN client  
-    ckan_client = ckanclient.CkanClient(base_location=ckan_host)
+    ckan_client = ckanclient.CkanClient(base_location=ckan_host,
+        transport=ckanclient.KeepAliveTransport())
     
-    package_id_list = ckan_client.package_register_get()
-   # print package_id_list  
-
+    # Bring the local copy of the catalog up to date, fetching only the
+    # packages changed since the last run
+    mirror = ckanclient.mirror.CatalogMirror(catalog_file)
+    print "Catalog mirror refreshed: " + str(mirror.refresh(ckan_client))
+    packages = mirror.packages()
     
     index = 0;
-    for package_id in package_id_list:
+    for package in packages:
             
-        # Get the package details
-        package = ckan_client.package_entity_get(package_id)
-
-		
         # Get the package name (slug)
         package_name = package['name']
         #print package_name
         
         
         print "------------------------------"
-        print "Processing dataset " + str(index) + " of " + str(len(package_id_list)) + ": " + package_name
+        print "Processing dataset " + str(index) + " of " + str(len(packages)) + ": " + package_name
         print "Created: " + package['metadata_created'] + ", modified: " + package['metadata_modified']
         
         shapefile_found = False
@@ -102,6 +103,9 @@ def process_ckan_datasets():
                                             
         index = index + 1    
 
+    # gzip responses cut the catalog transfer, see how much
+    print "CKAN transfer: " + str(ckan_client.transfer_stats.stats())
+
     
 def download_shapefile(package_name,url):
     global download_folder